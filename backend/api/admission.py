@@ -0,0 +1,98 @@
+# backend/api/admission.py
+import json
+import math
+import time
+from typing import Dict
+from fastapi import APIRouter
+from starlette.types import ASGIApp, Receive, Scope, Send
+from config import Config
+from services.admission import AdmissionQueue, AdmissionRejectedError
+
+admission_router = APIRouter()
+
+# 路由类别：LLM 调用较快，图片生成（尤其是一次生成 3 张的盲盒）耗时以分钟计
+admission_queues: Dict[str, AdmissionQueue] = {
+    "llm": AdmissionQueue(
+        "llm",
+        concurrency=Config.ADMISSION_LLM_CONCURRENCY,
+        max_wait=Config.ADMISSION_LLM_MAX_WAIT_SECONDS,
+        max_queue=Config.ADMISSION_MAX_QUEUE,
+        initial_service_time=2.0,
+    ),
+    "image": AdmissionQueue(
+        "image",
+        concurrency=Config.ADMISSION_IMAGE_CONCURRENCY,
+        max_wait=Config.ADMISSION_IMAGE_MAX_WAIT_SECONDS,
+        max_queue=Config.ADMISSION_MAX_QUEUE,
+        initial_service_time=20.0,
+    ),
+}
+
+ROUTE_CLASSES: Dict[str, str] = {
+    "/api/interpret_name": "llm",
+    "/api/generate_feedback": "llm",
+    "/api/generate_feedback/stream": "llm",
+    "/api/generate_image": "image",
+    "/api/generate_name_images": "image",
+    "/api/generate_name_images/stream": "image",
+}
+
+
+@admission_router.get("/api/admission_stats")
+async def admission_stats():
+    """Slots, queue depth and service time estimate of each admission class."""
+    return {name: queue.stats() for name, queue in admission_queues.items()}
+
+
+class AdmissionMiddleware:
+    """
+    Admits POST requests to the generation routes through their class's AdmissionQueue, holding
+    the slot until the response (streamed or not) is complete. Rejected requests get a 503 with
+    Retry-After before any work is done. Other routes pass through untouched.
+    """
+
+    def __init__(self, app: ASGIApp, enabled: bool = True):
+        self.app = app
+        self.enabled = enabled
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        route_class = ROUTE_CLASSES.get(scope["path"]) if scope["type"] == "http" and scope["method"] == "POST" else None
+        if not self.enabled or route_class is None:
+            await self.app(scope, receive, send)
+            return
+
+        queue = admission_queues[route_class]
+        try:
+            await queue.acquire(self._client(scope))
+        except AdmissionRejectedError as e:
+            await self._reject(send, str(e), e.retry_after)
+            return
+
+        start = time.monotonic()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            queue.release(time.monotonic() - start)
+
+    def _client(self, scope: Scope) -> str:
+        if Config.ADMISSION_CLIENT_HEADER:
+            name = Config.ADMISSION_CLIENT_HEADER.lower().encode()
+            for key, value in scope["headers"]:
+                if key == name:
+                    # X-Forwarded-For 取第一个地址（原始客户端）
+                    return value.decode("latin-1").split(",")[0].strip()
+        client = scope.get("client")
+        return client[0] if client else "unknown"
+
+    async def _reject(self, send: Send, detail: str, retry_after: float):
+        body = json.dumps({"detail": detail}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 503,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,53 @@
+# backend/api/degradation.py
+from fastapi import APIRouter
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from services.llm import doubao_llm_service
+from services.vlm import doubao_vlm_service
+from api.generate_image import deferred_images, fallback_images
+
+degradation_router = APIRouter()
+
+
+def service_mode() -> str:
+    """
+    Value of the X-Service-Mode header: "normal", or "degraded" followed by each degraded upstream
+    and the reason, e.g. "degraded; seedream=latency; llm=circuit_open".
+    """
+    reasons = []
+    for policy in (doubao_llm_service.degradation, doubao_vlm_service.degradation):
+        reason = policy.evaluate()
+        if reason is not None:
+            reasons.append(f"{policy.name}={reason}")
+    return "; ".join(["degraded", *reasons]) if reasons else "normal"
+
+
+@degradation_router.get("/api/degradation_stats")
+async def degradation_stats():
+    """Serving mode of each upstream and the state of the degraded-mode fallbacks."""
+    return {
+        "mode": service_mode(),
+        "llm": {**doubao_llm_service.degradation.state(), "active_model": doubao_llm_service.active_model},
+        "seedream": doubao_vlm_service.degradation.state(),
+        "fallback_images": fallback_images.stats(),
+        "deferred_images": deferred_images.stats(),
+    }
+
+
+class ServiceModeMiddleware:
+    """Adds the X-Service-Mode header (see service_mode) to every /api/ response."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or not scope["path"].startswith("/api/"):
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_mode(message: Message):
+            if message["type"] == "http.response.start":
+                # 在响应开始时取值，反映请求处理结束时的模式
+                message["headers"] = [*message.get("headers", []), (b"x-service-mode", service_mode().encode())]
+            await send(message)
+
+        await self.app(scope, receive, send_with_mode)
@@ -0,0 +1,19 @@
+# backend/api/errors.py
+import math
+from fastapi import HTTPException
+from services.upstream import UpstreamUnavailableError
+
+
+def to_http_exception(e: Exception) -> HTTPException:
+    """
+    Maps an exception raised while serving a route to the HTTPException returned to the client:
+    HTTPExceptions pass through, an open circuit breaker becomes 503 with Retry-After,
+    anything else is a 500.
+    """
+    if isinstance(e, HTTPException):
+        return e
+    if isinstance(e, UpstreamUnavailableError):
+        return HTTPException(
+            status_code=503, detail=str(e), headers={"Retry-After": str(max(1, math.ceil(e.retry_after)))}
+        )
+    return HTTPException(status_code=500, detail=str(e))
@@ -1,22 +1,97 @@
+import time
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 from services.llm import doubao_llm_service
 from models.user_models import FeedbackInput, FeedbackResponse
-from typing import List, Dict
+from typing import Any, AsyncIterator, List, Dict, Tuple
 from prompts.llm_prompts import get_feedback_prompt
+from api.errors import to_http_exception
+from api.streaming import StreamFormat, stream_events
+from services.feedback_cache import speculative_feedback_cache
 
 generate_feedback_router = APIRouter()
 
+
+def _build_feedback_messages(input: FeedbackInput) -> List[Dict[str, str]]:
+    prompt = get_feedback_prompt(input.imagery1, input.imagery2)
+    return [
+        {"role": "system", "content": "你是一位精通命理、文化、风水和积极心理学的专家，能够根据用户选择的意象组合生成充满情绪价值的赞美和反馈。"},
+        {"role": "user", "content": prompt}
+    ]
+
+
+async def _live_feedback(input: FeedbackInput) -> str:
+    messages = _build_feedback_messages(input)
+    return await doubao_llm_service.generate_response(messages=messages, temperature=1.2, top_p=0.9)
+
+
+def prefetch_feedback(imagery1: str, imagery2: str):
+    """
+    Speculatively generates feedback for an imagery pair in the background, so that
+    /api/generate_feedback can answer instantly if the user picks it. No-op unless
+    FEEDBACK_PREFETCH_ENABLED is set.
+    """
+    input = FeedbackInput(imagery1=imagery1, imagery2=imagery2)
+    speculative_feedback_cache.speculate(imagery1, imagery2, lambda: _live_feedback(input))
+
+
 @generate_feedback_router.post("/api/generate_feedback", response_model=FeedbackResponse)
 async def generate_feedback(input: FeedbackInput):
     try:
-        prompt = get_feedback_prompt(input.imagery1, input.imagery2)
-
-        messages = [
-            {"role": "system", "content": "你是一位精通命理、文化、风水和积极心理学的专家，能够根据用户选择的意象组合生成充满情绪价值的赞美和反馈。"},
-            {"role": "user", "content": prompt}
-        ]
-        result = await doubao_llm_service.generate_response(messages=messages, temperature=1.2, top_p=0.9)
+        # 优先使用推测预取的结果，未命中时再实时调用 LLM
+        result = await speculative_feedback_cache.get(input.imagery1, input.imagery2)
+        if result is None:
+            result = await _live_feedback(input)
         return FeedbackResponse(feedback=result)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise to_http_exception(e)
+
+
+@generate_feedback_router.get("/api/generate_feedback/prefetch_stats")
+async def feedback_prefetch_stats():
+    """Cost and hit rate of speculative feedback prefetching."""
+    return speculative_feedback_cache.stats()
+
+
+@generate_feedback_router.post("/api/generate_feedback/stream")
+async def generate_feedback_stream(input: FeedbackInput, format: StreamFormat = "sse"):
+    """
+    Streaming variant of /api/generate_feedback.
+
+    Emits one "delta" event ({"content": ...}) per text delta as it arrives, then a "done" event
+    with the full feedback plus the time to first token and total duration in milliseconds.
+    """
+    start = time.monotonic()
+    deltas = doubao_llm_service.stream_response(
+        messages=_build_feedback_messages(input), temperature=1.2, top_p=0.9
+    )
+    # 在第一个 token 到达之前失败时直接返回 HTTP 错误，而不是开始一个空的流
+    try:
+        first_delta = await deltas.__anext__()
+    except StopAsyncIteration:
+        first_delta = ""
+    except Exception as e:
+        await deltas.aclose()
+        raise to_http_exception(e)
+    ttft_ms = round((time.monotonic() - start) * 1000)
+
+    async def events() -> AsyncIterator[Tuple[str, Any]]:
+        parts = [first_delta]
+        try:
+            if first_delta:
+                yield "delta", {"content": first_delta}
+            async for delta in deltas:
+                parts.append(delta)
+                yield "delta", {"content": delta}
+            yield "done", {
+                "feedback": "".join(parts),
+                "ttft_ms": ttft_ms,
+                "duration_ms": round((time.monotonic() - start) * 1000),
+            }
+        except Exception as e:
+            print(f"Error streaming feedback: {e}")
+            yield "error", {"detail": str(e)}
+        finally:
+            await deltas.aclose()
+
+    return stream_events(events(), format)
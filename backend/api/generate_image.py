@@ -1,61 +1,365 @@
+import asyncio
+import base64
 from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel, HttpUrl
-from typing import Optional, List, Dict
+from typing import Any, AsyncIterator, NamedTuple, Optional, List, Dict, Tuple
 from services.vlm import doubao_vlm_service
-from models.user_models import ImageryInput, ImageResponse, NameImagesResponse, NameImagesResponseItem, NameInput
-from api.interpret_name import interpret_name
+from services.image_store import image_store
+from config import Config
+from models.user_models import ImageryCombination, ImageryInput, InterpretNameLLMResponse, ImageResponse, NameImagesResponse, NameInput
+from api.interpret_name import get_interpretation, stream_interpret_name
+from api.streaming import StreamFormat, stream_events
+from api.errors import to_http_exception
+from api.responses import json_response
+from api.generate_feedback import prefetch_feedback
+from services.upstream import UpstreamError, UpstreamUnavailableError, upstream_priority
+from services.prefetch import BlindBoxPool
+from services.degradation import DeferredImages, FallbackImageCache, degraded_results
 from prompts.vlm_prompts import get_image_generation_prompt
 
 generate_image_router = APIRouter()
 
-@generate_image_router.post("/api/generate_image", response_model=ImageResponse)
-async def generate_image(input: ImageryInput):
-    try:
-        prompt = get_image_generation_prompt(input.imagery1, input.imagery2)
+# 内部参数，不暴露给用户：生成图片的尺寸
+IMAGE_SIZE = "1024x1024"
+
+
+def _store_key(imagery1: str, imagery2: str) -> str:
+    return image_store.make_key(imagery1, imagery2, IMAGE_SIZE, None, doubao_vlm_service.model_id)
+
+async def _generate_stored_images(input: ImageryInput, prompt: str) -> List[str]:
+    """
+    Serves the image from the local store when these parameters were generated before;
+    otherwise generates it, saves it to the store and returns its local URL.
+    """
+    key = _store_key(input.imagery1, input.imagery2)
+    digest = await image_store.lookup(key)
+    if digest is None:
+        results = await doubao_vlm_service.generate_images(
+            prompt=prompt, num_images=1, size=IMAGE_SIZE, response_format=Config.IMAGE_STORE_SOURCE
+        )
+        if not results:
+            return []
+        if Config.IMAGE_STORE_SOURCE == "b64_json":
+            data = base64.b64decode(results[0])
+        else:
+            data = await doubao_vlm_service.download_image(results[0])
+        digest = await image_store.save(data, key=key)
+    return [image_store.url_for(digest)]
+
 
-        # 内部参数，不暴露给用户
-        num_images = 1  # 生成图片的数量
-        image_size = "1024x1024"  # 图片尺寸
+async def _generate_image_urls(input: ImageryInput) -> List[str]:
+    prompt = get_image_generation_prompt(input.imagery1, input.imagery2)
 
+    # 内部参数，不暴露给用户
+    num_images = 1  # 生成图片的数量
+
+    if image_store.enabled:
+        images = await _generate_stored_images(input, prompt)
+    else:
         images = await doubao_vlm_service.generate_images(
-            prompt=prompt, num_images=num_images, size=image_size
+            prompt=prompt, num_images=num_images, size=IMAGE_SIZE
         )
+    if images:
+        # 记录近期生成的图片，图片上游降级或失败时可代替实时生成
+        fallback_images.add(input.imagery1, input.imagery2, images[0])
+    return images
+
+
+async def _prefetch_image(imagery1: str, imagery2: str) -> Optional[str]:
+    images = await _generate_image_urls(ImageryInput(imagery1=imagery1, imagery2=imagery2))
+    return images[0] if images else None
+
+
+async def _prefetch_name(name: str) -> List[Tuple[str, str]]:
+    interpret_result = await get_interpretation(NameInput(name=name))
+    return [(item.imagery1, item.imagery2) for item in interpret_result.root]
+
+
+async def _image_stored(imagery1: str, imagery2: str) -> bool:
+    # 本地图片存储已有该组意象的图片时，请求直接由存储提供，预热不会节省任何上游调用
+    return image_store.enabled and await image_store.lookup(_store_key(imagery1, imagery2)) is not None
+
 
-        # 确保返回的是 HttpUrl 列表
-        http_url_images = [HttpUrl(url) for url in images]
+def _image_upstream_idle() -> bool:
+    # 熔断器闭合且占用的并发名额不到一半时才进行预热，保证预热不与实时流量争抢名额
+    service = doubao_vlm_service
+    return service.controller.breaker.status == "closed" and service.active_calls * 2 < service.max_concurrency
 
-        return ImageResponse(images=http_url_images)
+
+blindbox_pool = BlindBoxPool(
+    generate=_prefetch_image,
+    interpret=_prefetch_name,
+    is_idle=_image_upstream_idle,
+    is_stored=_image_stored,
+    enabled=Config.PREFETCH_ENABLED,
+    top_pairs=Config.PREFETCH_TOP_PAIRS,
+    top_names=Config.PREFETCH_TOP_NAMES,
+    depth=Config.PREFETCH_POOL_DEPTH,
+    max_images=Config.PREFETCH_MAX_IMAGES,
+    min_requests=Config.PREFETCH_MIN_REQUESTS,
+    interval=Config.PREFETCH_INTERVAL_SECONDS,
+    image_ttl=Config.PREFETCH_IMAGE_TTL_SECONDS,
+    decay_interval=Config.PREFETCH_DECAY_INTERVAL_SECONDS,
+)
+
+fallback_images = FallbackImageCache(
+    max_entries=Config.FALLBACK_IMAGES_MAX_ENTRIES,
+    ttl=Config.FALLBACK_IMAGES_TTL_SECONDS,
+)
+
+deferred_images = DeferredImages(
+    generate=_prefetch_image,
+    max_pending=Config.DEFERRED_IMAGES_MAX_PENDING,
+    ttl=Config.FALLBACK_IMAGES_TTL_SECONDS,
+)
+
+
+class _Image(NamedTuple):
+    """
+    A served image. The URL is trusted: Seedream URLs are validated once in DoubaoSeedreamService,
+    local store URLs are built by the backend, so it is passed on without re-validation.
+    """
+    url: str
+    degraded: Optional[str] = None
+
+
+def _fallback_image(input: ImageryInput) -> Optional[_Image]:
+    """A recent image of the same or a similar imagery pair, for interactive requests only."""
+    # 批量任务的结果会被长期保存，不使用降级图片
+    if upstream_priority.get() == "batch":
+        return None
+    found = fallback_images.find(input.imagery1, input.imagery2)
+    if found is None:
+        return None
+    url, exact = found
+    mode = "cached" if exact else "similar"
+    degraded_results.inc(mode=f"image_{mode}")
+    return _Image(url, mode)
+
+
+async def _get_image(input: ImageryInput) -> Optional[_Image]:
+    """The image for an imagery pair, or None if the upstream returned none."""
+    blindbox_pool.record_pair(input.imagery1, input.imagery2)
+    # 降级时为该组意象延后生成的图片（可能仍在生成中）或预热池中的现成图片直接返回，后台会异步补充预热池
+    ready = await deferred_images.take(input.imagery1, input.imagery2)
+    ready = ready or blindbox_pool.take(input.imagery1, input.imagery2)
+    if ready:
+        return _Image(ready)
+
+    # 图片上游降级时优先用相同/相似意象的近期图片代替实时生成
+    fallback = _fallback_image(input) if doubao_vlm_service.degradation.degraded else None
+    if fallback is not None:
+        return fallback
+    try:
+        images = await _generate_image_urls(input)
+    except (UpstreamError, UpstreamUnavailableError) as e:
+        # 限流、5xx、网络错误或熔断时退回近期图片；内容审核等不可重试的错误照常返回
+        fallback = _fallback_image(input) if getattr(e, "retryable", True) else None
+        if fallback is None:
+            raise
+        return fallback
+    return _Image(images[0]) if images else None
+
+
+@generate_image_router.post("/api/generate_image", response_model=ImageResponse)
+async def generate_image(input: ImageryInput):
+    try:
+        image = await _get_image(input)
     except Exception as e:
         print(f"Error generating image: {e}")  # 添加日志记录
-        raise HTTPException(status_code=500, detail=str(e))
+        raise to_http_exception(e)
+    if image is None:
+        return json_response({"images": [], "degraded": None})
+    return json_response({"images": [image.url], "degraded": image.degraded})
 
 
-@generate_image_router.post("/api/generate_name_images", response_model=NameImagesResponse)
-async def generate_name_blindbox(input: NameInput):
+def _blindbox_item(
+    item: ImageryCombination,
+    status: str = "success",
+    image_url: Optional[str] = None,
+    error: Optional[str] = None,
+    degraded: Optional[str] = None,
+) -> Dict[str, Any]:
+    """A NameImagesResponseItem as the plain dict it serializes to; every value is already validated."""
+    return {
+        "id": item.id,
+        "imagery1": item.imagery1,
+        "imagery2": item.imagery2,
+        "status": status,
+        "image_url": image_url,
+        "error": error,
+        "degraded": degraded,
+    }
+
+
+async def _generate_blindbox_item(item: ImageryCombination, semaphore: asyncio.Semaphore) -> Dict[str, Any]:
+    """
+    Generates the image for one imagery combination, turning a failure into a failed item
+    so that a single bad combination does not sink the whole blind box.
+    """
+    async with semaphore:
+        try:
+            image = await _get_image(ImageryInput(imagery1=item.imagery1, imagery2=item.imagery2))
+        except Exception as e:
+            # 失败原因随条目返回；上游错误已由 track_upstream 计入指标
+            return _blindbox_item(item, status="failed", error=str(to_http_exception(e).detail))
+
+    if image is None:
+        return _blindbox_item(item, status="failed", error="No image returned")
+    return _blindbox_item(item, image_url=image.url, degraded=image.degraded)
+
+
+async def _interpretation_only_blindbox(input: NameInput) -> List[Dict[str, Any]]:
+    """
+    Degraded blind box: returns the interpretation right away, with a recent image of the same or a
+    similar imagery pair where there is one. The other items are "pending" and their images are
+    generated in the background, to be picked up through /api/generate_image.
+    """
+    interpretations = await get_interpretation(input)
+    items = []
+    for item in interpretations.root:
+        prefetch_feedback(item.imagery1, item.imagery2)
+        fallback = _fallback_image(ImageryInput(imagery1=item.imagery1, imagery2=item.imagery2))
+        if fallback is not None:
+            items.append(_blindbox_item(item, image_url=fallback.url, degraded=fallback.degraded))
+        elif deferred_images.defer(item.imagery1, item.imagery2):
+            degraded_results.inc(mode="image_deferred")
+            items.append(_blindbox_item(item, status="pending"))
+        else:
+            items.append(_blindbox_item(item, status="failed", error="Image generation is busy, please try again later."))
+    return items
+
+
+async def _blindbox_events(input: NameInput) -> AsyncIterator[Tuple[str, Any]]:
+    """
+    Runs the name blind box pipeline and yields its events as they happen:
+
+    - "combination": an ImageryCombination, as soon as it is parsed from the LLM stream
+      (its image generation starts at the same moment);
+    - "combinations": the validated InterpretNameLLMResponse, once the LLM output is complete;
+    - "item": a NameImagesResponseItem (as a plain dict), as soon as its image finishes.
+
+    The iterator ends after the last item. Interpretation errors are raised as HTTPException;
+    every pending task is cancelled when the iterator is closed early.
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+    semaphore = asyncio.Semaphore(Config.NAME_IMAGES_MAX_CONCURRENCY)
+    image_tasks: List[asyncio.Task] = []
+
+    async def generate_item(item: ImageryCombination):
+        await queue.put(("item", await _generate_blindbox_item(item, semaphore)))
+
+    async def interpret():
+        try:
+            combinations = []
+            async for item in stream_interpret_name(input):
+                combinations.append(item)
+                image_tasks.append(asyncio.create_task(generate_item(item)))
+                # 用户选中某组意象后才会请求反馈，这里趁图片生成时推测式地预先生成
+                prefetch_feedback(item.imagery1, item.imagery2)
+                await queue.put(("combination", item))
+            await queue.put(("combinations", InterpretNameLLMResponse(root=combinations)))
+        except Exception as e:
+            await queue.put(("error", e))
+
+    interpret_task = asyncio.create_task(interpret())
+    expected = None
+    received = 0
+    try:
+        while expected is None or received < expected:
+            event, data = await queue.get()
+            if event == "error":
+                raise data
+            if event == "combinations":
+                expected = len(data.root)
+            elif event == "item":
+                received += 1
+            yield event, data
+    finally:
+        interpret_task.cancel()
+        for task in image_tasks:
+            task.cancel()
+
+
+@generate_image_router.get("/api/generate_image/pool_stats")
+async def image_pool_stats():
+    """Hit rate, refills and contents of the prewarmed blind box pool."""
+    return blindbox_pool.stats()
+
+
+async def get_name_blindbox(input: NameInput) -> List[Dict[str, Any]]:
+    """
+    Builds a name blind box: the NameImagesResponseItem dicts of its 3 imagery combinations, sorted by id.
+    Shared by /api/generate_name_images and the batch job worker.
+
+    Raises:
+        HTTPException: If the interpretation fails, or every image generation fails
+            (503 with Retry-After while the image upstream's breaker is open).
+    """
     try:
-        # 1. 调用 /api/interpret_name 获取意象组合
-        interpret_result = await interpret_name(input)
+        blindbox_pool.record_name(input.name)
+        # 图片上游降级时只返回解析结果，图片在后台生成（批量任务仍然等待实时生成）
+        if doubao_vlm_service.degradation.degraded and upstream_priority.get() != "batch":
+            return await _interpretation_only_blindbox(input)
 
-        # 2. 循环调用 /api/generate_image 生成图片
+        # 1. 流式解析名字，每得到一组意象组合就立即并发生成图片（单个请求内的并发数受限）
         blindbox_results = []
-        for item in interpret_result.root:
-            imagery_input = {"imagery1": item.imagery1, "imagery2": item.imagery2}
-            image_response = await generate_image(ImageryInput(**imagery_input))
-            # 假设 generate_image 返回的是 ImageResponse，需要提取 URL
-            image_url = image_response.images[0] if image_response.images else None
-            if image_url:
-                # 创建 NameImagesResponseItem 对象
-                name_image_response_item = NameImagesResponseItem(
-                    id=item.id,
-                    imagery1=item.imagery1,
-                    imagery2=item.imagery2,
-                    image_url=image_url  # 使用别名 imageUrl
-                )
-                blindbox_results.append(name_image_response_item)
-
-        # 3. 返回所有图片 URL
-        return NameImagesResponse(root=blindbox_results)
+        async for event, data in _blindbox_events(input):
+            if event == "item":
+                blindbox_results.append(data)
+        blindbox_results.sort(key=lambda item: item["id"])
+
+        # 2. 全部失败时才视为请求失败，否则返回带状态的部分结果
+        if all(item["status"] == "failed" for item in blindbox_results):
+            errors = "; ".join(item["error"] for item in blindbox_results if item["error"])
+            breaker = doubao_vlm_service.controller.breaker
+            if breaker.status == "open":
+                raise to_http_exception(UpstreamUnavailableError(errors, breaker.retry_after()))
+            raise HTTPException(status_code=500, detail=f"All image generations failed: {errors}")
+
+        return blindbox_results
 
     except Exception as e:
-        print(f"Error generating name blindbox: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        if not isinstance(e, HTTPException):
+            print(f"Error generating name blindbox: {e}")
+        raise to_http_exception(e)
+
+
+@generate_image_router.post("/api/generate_name_images", response_model=NameImagesResponse)
+async def generate_name_blindbox(input: NameInput):
+    # 各项已经过校验，直接序列化，不再经过 NameImagesResponse 与 response_model 的重复校验
+    return json_response(await get_name_blindbox(input))
+
+
+@generate_image_router.post("/api/generate_name_images/stream")
+async def generate_name_blindbox_stream(input: NameInput, format: StreamFormat = "ndjson"):
+    """
+    Streaming variant of /api/generate_name_images.
+
+    Emits a "combination" event per imagery combination as soon as the LLM produces it, a
+    "combinations" event once the interpretation is validated, one "item" event
+    (a NameImagesResponseItem) per finished image in completion order, and a final "done" event.
+    """
+    blindbox_pool.record_name(input.name)
+    events = _blindbox_events(input)
+    # 在第一组意象解析出来之前失败时直接返回 HTTP 错误，而不是开始一个空的流
+    try:
+        first_event = await events.__anext__()
+    except BaseException:
+        await events.aclose()
+        raise
+
+    async def stream() -> AsyncIterator[Tuple[str, Any]]:
+        try:
+            yield first_event
+            async for event in events:
+                yield event
+            yield "done", None
+        except HTTPException as e:
+            yield "error", {"detail": e.detail}
+        except Exception as e:
+            print(f"Error streaming name blindbox: {e}")
+            yield "error", {"detail": str(e)}
+        finally:
+            await events.aclose()
+
+    return stream_events(stream(), format)
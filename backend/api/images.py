@@ -0,0 +1,99 @@
+# backend/api/images.py
+import os
+import re
+from typing import Optional, Tuple
+import anyio
+from fastapi import APIRouter, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
+from services.image_store import DIGEST_PATTERN, image_store, sniff_content_type
+
+images_router = APIRouter()
+
+CHUNK_SIZE = 64 * 1024
+# 图片按内容寻址，同一 URL 的内容永不改变，可以长期缓存
+CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+_RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def _parse_range(header: str, file_size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parses a single-range "Range" header into an inclusive (start, end) pair.
+    Returns None for headers that should be ignored (multiple ranges, other units).
+
+    Raises:
+        HTTPException: 416 if the range cannot be satisfied.
+    """
+    match = _RANGE_PATTERN.match(header.strip())
+    if not match:
+        return None
+    start, end = match.groups()
+    if not start and not end:
+        return None
+    if not start:
+        # "bytes=-N"：最后 N 个字节
+        length = int(end)
+        if length == 0:
+            raise HTTPException(status_code=416, headers={"Content-Range": f"bytes */{file_size}"})
+        return max(0, file_size - length), file_size - 1
+    first = int(start)
+    last = min(int(end), file_size - 1) if end else file_size - 1
+    if first >= file_size or first > last:
+        raise HTTPException(status_code=416, headers={"Content-Range": f"bytes */{file_size}"})
+    return first, last
+
+
+async def _iter_file(path: str, start: int, length: int):
+    async with await anyio.open_file(path, "rb") as f:
+        await f.seek(start)
+        remaining = length
+        while remaining > 0:
+            chunk = await f.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+@images_router.get("/api/images/{digest}")
+async def get_image(digest: str, request: Request, w: Optional[int] = None):
+    """
+    Serves a stored image straight from disk, honouring If-None-Match and single byte ranges.
+    `w` selects a resized variant; the original is served when that width is not available.
+    """
+    if not DIGEST_PATTERN.match(digest):
+        raise HTTPException(status_code=404, detail="Image not found")
+
+    path = image_store.path_for(digest)
+    if w is not None and os.path.exists(image_store.path_for(digest, w)):
+        path = image_store.path_for(digest, w)
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Image not found")
+
+    etag = f'"{os.path.basename(path)}"'
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL, "Accept-Ranges": "bytes"}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+
+    async with await anyio.open_file(path, "rb") as f:
+        content_type = sniff_content_type(await f.read(12))
+
+    file_size = stat.st_size
+    byte_range = None
+    range_header = request.headers.get("range")
+    if range_header and request.headers.get("if-range", etag) == etag:
+        byte_range = _parse_range(range_header, file_size)
+
+    if byte_range is None:
+        headers["Content-Length"] = str(file_size)
+        return StreamingResponse(_iter_file(path, 0, file_size), media_type=content_type, headers=headers)
+
+    start, end = byte_range
+    headers["Content-Length"] = str(end - start + 1)
+    headers["Content-Range"] = f"bytes {start}-{end}/{file_size}"
+    return StreamingResponse(
+        _iter_file(path, start, end - start + 1), status_code=206, media_type=content_type, headers=headers
+    )
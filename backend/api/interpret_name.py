@@ -1,29 +1,170 @@
+from contextlib import aclosing
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
+from typing import AsyncIterator, Dict, List, Optional
+from config import Config
 from services.llm import doubao_llm_service
+from services.json_stream import IncrementalJSONArrayParser
+from services.name_cache import name_interpretation_cache
+from services.name_index import name_index
 from models.user_models import NameInput
-from models.user_models import InterpretNameLLMResponse
+from models.user_models import ImageryCombination, InterpretNameLLMResponse
 from prompts.llm_prompts import get_interpret_name_prompt
+from api.errors import to_http_exception
+from api.responses import json_response
 
 interpret_name_router = APIRouter()
 
-@interpret_name_router.post("/api/interpret_name", response_model=InterpretNameLLMResponse)
-async def interpret_name(input: NameInput):
+
+def _build_interpret_messages(name: str) -> List[Dict[str, str]]:
+    prompt = get_interpret_name_prompt(name)
+    return [
+        {"role": "system", "content": "你是一个根据用户名称拆解为意象组合的助手。"},
+        {"role": "user", "content": prompt}
+    ]
+
+
+async def _get_cached_interpretation(input: NameInput) -> Optional[InterpretNameLLMResponse]:
+    if input.cache != "default":
+        return None
+    cached = await name_interpretation_cache.get(input.name)
+    return InterpretNameLLMResponse.model_validate_json(cached) if cached else None
+
+
+def _get_indexed_interpretation(input: NameInput) -> Optional[InterpretNameLLMResponse]:
+    # 本地谐音索引只参与默认模式；bypass/refresh 表示调用方需要一次真实的 LLM 解析
+    if input.cache != "default":
+        return None
+    # LLM 降级时不再为保持新鲜度而把索引覆盖的名字交给 LLM
+    pairs = name_index.lookup(input.name, freshness=not doubao_llm_service.degradation.degraded)
+    if pairs is None:
+        return None
+    return InterpretNameLLMResponse(root=[
+        ImageryCombination(id=i, imagery1=imagery1, imagery2=imagery2)
+        for i, (imagery1, imagery2) in enumerate(pairs, start=1)
+    ])
+
+
+async def _get_local_interpretation(input: NameInput) -> Optional[InterpretNameLLMResponse]:
+    """Answers from the name cache, then from the homophone index, without calling the LLM."""
+    cached = await _get_cached_interpretation(input)
+    if cached is not None:
+        return cached
+    return _get_indexed_interpretation(input)
+
+
+async def _store_interpretation(input: NameInput, interpretations: InterpretNameLLMResponse):
+    if input.cache == "bypass":
+        return
+    await name_interpretation_cache.put(
+        input.name, interpretations.model_dump_json(), replace=input.cache == "refresh"
+    )
+
+
+async def get_interpretation(input: NameInput) -> InterpretNameLLMResponse:
+    """
+    Interprets a name from the cache, the homophone index or the LLM, validating the LLM output once.
+
+    Raises:
+        HTTPException: If the LLM call fails or its output is not 3 valid imagery combinations.
+    """
     try:
-        prompt = get_interpret_name_prompt(input.name)
+        local = await _get_local_interpretation(input)
+        if local is not None:
+            return local
 
-        messages = [
-            {"role": "system", "content": "你是一个根据用户名称拆解为意象组合的助手。"},
-            {"role": "user", "content": prompt}
-        ]
+        messages = _build_interpret_messages(input.name)
 
         result = await doubao_llm_service.generate_response(messages=messages, temperature=1.2, top_p=0.9)
         # 尝试将 LLM 返回的字符串解析为 InterpretNameLLMResponse 对象
         try:
-            interpretations = InterpretNameLLMResponse.parse_raw(result)
-            return interpretations
+            interpretations = InterpretNameLLMResponse.model_validate_json(result)
         except Exception as e:
             print(f"Error parsing LLM response: {e}")
             raise HTTPException(status_code=500, detail="Failed to parse LLM response")
+
+        await _store_interpretation(input, interpretations)
+        return interpretations
+    except Exception as e:
+        raise to_http_exception(e)
+
+
+@interpret_name_router.post("/api/interpret_name", response_model=InterpretNameLLMResponse)
+async def interpret_name(input: NameInput):
+    return json_response(await get_interpretation(input))
+
+
+@interpret_name_router.get("/api/interpret_name/cache_stats")
+async def interpret_name_cache_stats():
+    """Hit/miss and eviction counters of the name interpretation cache."""
+    return name_interpretation_cache.stats()
+
+
+@interpret_name_router.get("/api/interpret_name/index_stats")
+async def interpret_name_index_stats():
+    """Coverage of the local homophone index fast path."""
+    return name_index.stats()
+
+
+async def stream_interpret_name(input: NameInput) -> AsyncIterator[ImageryCombination]:
+    """
+    Yields each imagery combination as soon as its JSON object closes in the LLM token stream.
+
+    Once the stream ends, the collected combinations go through the same InterpretNameLLMResponse
+    validation as get_interpretation (exactly 3 items); a violation raises HTTPException after the
+    already-yielded items, so callers must be ready to discard work started for them.
+    Cache and homophone index hits, and every call when NAME_INTERPRET_STREAMING is disabled,
+    go through the non-streaming get_interpretation instead.
+    """
+    if Config.NAME_INTERPRET_STREAMING:
+        interpret_result = await _get_local_interpretation(input)
+    else:
+        interpret_result = await get_interpretation(input)
+    if interpret_result is not None:
+        for item in interpret_result.root:
+            yield item
+        return
+
+    messages = _build_interpret_messages(input.name)
+    parser = IncrementalJSONArrayParser()
+    combinations: List[ImageryCombination] = []
+    try:
+        # aclosing：数组闭合后提前结束读取（或本生成器被关闭）时立即关闭上游流，让其记录调用结果并释放连接
+        async with aclosing(
+            doubao_llm_service.stream_response(messages=messages, temperature=1.2, top_p=0.9)
+        ) as deltas:
+            async for delta in deltas:
+                for combination in _parse_combinations(parser, delta, combinations):
+                    yield combination
+                if parser.closed:
+                    break
+    except Exception as e:
+        raise to_http_exception(e)
+
+    try:
+        # 流在数组闭合之前结束（被截断的响应）不能当作成功
+        parser.finish()
+        interpretations = InterpretNameLLMResponse(root=combinations)
+    except Exception as e:
+        print(f"Error parsing LLM response: {e}")
+        raise HTTPException(status_code=500, detail="Failed to parse LLM response")
+    await _store_interpretation(input, interpretations)
+
+
+def _parse_combinations(
+    parser: IncrementalJSONArrayParser, delta: str, combinations: List[ImageryCombination]
+) -> List[ImageryCombination]:
+    """
+    Feeds one LLM delta into the parser and validates the objects it completes,
+    appending them to combinations.
+    """
+    try:
+        completed = [ImageryCombination.model_validate(obj) for obj in parser.feed(delta)]
+        combinations.extend(completed)
+        # 超过 3 组时立即失败，不再为多余的组合生成图片
+        if len(combinations) > 3:
+            raise ValueError("LLM returned more than 3 imagery combinations")
+        return completed
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        print(f"Error parsing LLM response: {e}")
+        raise HTTPException(status_code=500, detail="Failed to parse LLM response")
@@ -0,0 +1,73 @@
+# backend/api/jobs.py
+import asyncio
+import json
+import orjson
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
+from config import Config
+from models.user_models import BatchJobStatus, BatchNameInput, NameInput
+from api.generate_image import get_name_blindbox
+from services.jobs import BatchJobManager, JobStore
+
+jobs_router = APIRouter()
+
+
+async def _generate_name_blindbox_json(name: str) -> str:
+    # 复用 /api/generate_name_images 的完整流程（名字解析缓存、并发生图、上游限流）
+    return orjson.dumps(await get_name_blindbox(NameInput(name=name))).decode()
+
+
+batch_job_manager = BatchJobManager(
+    store=JobStore(Config.JOBS_DB_PATH, lease=Config.BATCH_JOB_LEASE_SECONDS),
+    worker=_generate_name_blindbox_json,
+    concurrency=Config.BATCH_JOB_WORKERS,
+)
+
+
+@jobs_router.post("/api/jobs/name_images", response_model=BatchJobStatus, status_code=202)
+async def submit_name_images_job(input: BatchNameInput):
+    names = [name.strip() for name in input.names if name.strip()]
+    if not names:
+        raise HTTPException(status_code=422, detail="No names submitted")
+    if len(names) > Config.BATCH_JOB_MAX_NAMES:
+        raise HTTPException(status_code=413, detail=f"At most {Config.BATCH_JOB_MAX_NAMES} names per job")
+    job_id = await batch_job_manager.submit(names)
+    return await batch_job_manager.status(job_id)
+
+
+@jobs_router.get("/api/jobs/{job_id}", response_model=BatchJobStatus)
+async def get_job(job_id: str):
+    status = await batch_job_manager.status(job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return status
+
+
+@jobs_router.get("/api/jobs/{job_id}/results")
+async def download_job_results(job_id: str):
+    """
+    Downloads the results of a job as NDJSON, one line per name in submission order:
+    {"name", "status", "result" (the NameImagesResponse, if succeeded), "error"}.
+    Unfinished names are included with their current status.
+    """
+    if await batch_job_manager.status(job_id) is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def lines():
+        pages = batch_job_manager.store.iter_results(job_id)
+        while True:
+            # 分页从 SQLite 读取，避免一次性把大任务的全部结果载入内存
+            rows = await asyncio.to_thread(next, pages, None)
+            if rows is None:
+                return
+            for _, name, status, result, error in rows:
+                yield json.dumps(
+                    {"name": name, "status": status, "result": json.loads(result) if result else None, "error": error},
+                    ensure_ascii=False,
+                ) + "\n"
+
+    return StreamingResponse(
+        lines(),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{job_id}.ndjson"'},
+    )
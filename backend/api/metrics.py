@@ -0,0 +1,57 @@
+# backend/api/metrics.py
+import time
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from starlette.routing import Match
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from services.metrics import http_in_flight, http_request_duration, registry
+
+metrics_router = APIRouter()
+
+
+@metrics_router.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def metrics():
+    """Prometheus metrics of this process."""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+class MetricsMiddleware:
+    """
+    Records latency (until the last body chunk, so streaming responses are measured in full) and
+    in-flight counts per route template. Requests that match no route are grouped under "unmatched"
+    to keep label cardinality bounded.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        route = self._route(scope)
+        status = "500"
+        start = time.monotonic()
+
+        async def send_wrapper(message: Message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = str(message["status"])
+            await send(message)
+
+        http_in_flight.inc(method=method, route=route)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            http_in_flight.dec(method=method, route=route)
+            http_request_duration.observe(time.monotonic() - start, method=method, route=route, status=status)
+
+    def _route(self, scope: Scope) -> str:
+        # 中间件在路由之前执行，这里自行匹配出路由模板（如 /api/images/{digest}）
+        for route in scope["app"].router.routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return getattr(route, "path", "unmatched")
+        return "unmatched"
@@ -0,0 +1,18 @@
+# backend/api/responses.py
+from typing import Any
+from fastapi.responses import ORJSONResponse, Response
+from pydantic import BaseModel
+
+
+def json_response(content: Any, status_code: int = 200) -> Response:
+    """
+    Serializes a route's result exactly once.
+
+    Returning a Response skips FastAPI's response_model handling (dump, re-validation and
+    jsonable_encoder), which only repeats the validation done at the upstream boundary; the
+    response_model still documents the route. Pydantic models are written by their own JSON
+    serializer, plain data (dicts and lists of already validated values) by orjson.
+    """
+    if isinstance(content, BaseModel):
+        return Response(content.model_dump_json(), status_code=status_code, media_type="application/json")
+    return ORJSONResponse(content, status_code=status_code)
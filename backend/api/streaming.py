@@ -0,0 +1,48 @@
+# backend/api/streaming.py
+from typing import Any, AsyncIterator, Literal, Tuple
+import orjson
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+
+# 流式接口支持的两种编码：NDJSON（每行一个 JSON 对象）与 Server-Sent Events
+StreamFormat = Literal["ndjson", "sse"]
+
+STREAM_MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "sse": "text/event-stream",
+}
+
+
+def encode_event(event: str, data: Any, format: StreamFormat) -> bytes:
+    """
+    Encodes a single stream event as an NDJSON line or an SSE frame.
+
+    Args:
+        event (str): The event name, e.g. "item" or "done".
+        data (Any): The event payload. Pydantic models are dumped in JSON mode.
+        format (StreamFormat): "ndjson" or "sse".
+
+    Returns:
+        bytes: The UTF-8 encoded event, including its trailing delimiter.
+    """
+    if isinstance(data, BaseModel):
+        data = data.model_dump(mode="json")
+    if format == "sse":
+        return b"event: " + event.encode() + b"\ndata: " + orjson.dumps(data) + b"\n\n"
+    return orjson.dumps({"event": event, "data": data}) + b"\n"
+
+
+def stream_events(events: AsyncIterator[Tuple[str, Any]], format: StreamFormat) -> StreamingResponse:
+    """
+    Wraps an async iterator of (event, data) pairs into a StreamingResponse.
+    Proxy buffering is disabled so that every event reaches the client as soon as it is produced.
+    """
+    async def body():
+        async for event, data in events:
+            yield encode_event(event, data, format)
+
+    return StreamingResponse(
+        body(),
+        media_type=STREAM_MEDIA_TYPES[format],
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
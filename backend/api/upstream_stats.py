@@ -0,0 +1,15 @@
+# backend/api/upstream_stats.py
+from fastapi import APIRouter
+from services.llm import doubao_llm_service
+from services.vlm import doubao_vlm_service
+
+upstream_stats_router = APIRouter()
+
+
+@upstream_stats_router.get("/api/upstream_stats")
+async def upstream_stats():
+    """Internal state of the upstream LLM and Seedream services, for monitoring."""
+    return {
+        "llm": await doubao_llm_service.stats(),
+        "vlm": await doubao_vlm_service.stats(),
+    }
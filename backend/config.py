@@ -7,4 +7,137 @@ class Config:
     DEEPSEEK_V3_API_KEY = os.getenv("DEEPSEEK_V3_API_KEY")
     DEEPSEEK_V3_ENDPOINT = os.getenv("DEEPSEEK_V3_ENDPOINT")
     DOUBAO_SEEDREAM_API_KEY = os.getenv("DOUBAO_SEEDREAM_API_KEY")
-    DOUBAO_SEEDREAM_ENDPOINT = os.getenv("DOUBAO_SEEDREAM_ENDPOINT")
\ No newline at end of file
+    DOUBAO_SEEDREAM_ENDPOINT = os.getenv("DOUBAO_SEEDREAM_ENDPOINT")
+    # LLM chat/completions 地址；压测时可指向本地的 tools/fake_ark.py
+    DOUBAO_LLM_ENDPOINT = os.getenv("DOUBAO_LLM_ENDPOINT", "https://ark.cn-beijing.volces.com/api/v3/chat/completions")
+
+    # 图片生成并发控制：进程级上限（所有请求共享）与单个盲盒请求内的并发上限
+    IMAGE_GENERATION_MAX_CONCURRENCY = int(os.getenv("IMAGE_GENERATION_MAX_CONCURRENCY", "8"))
+    NAME_IMAGES_MAX_CONCURRENCY = int(os.getenv("NAME_IMAGES_MAX_CONCURRENCY", "3"))
+
+    # 盲盒生成时以流式方式调用 LLM，每解析出一组意象就立即开始生成图片
+    NAME_INTERPRET_STREAMING = os.getenv("NAME_INTERPRET_STREAMING", "true").lower() == "true"
+
+    # 名字解析缓存：内存 LRU + SQLite 持久化
+    NAME_CACHE_ENABLED = os.getenv("NAME_CACHE_ENABLED", "true").lower() == "true"
+    NAME_CACHE_PATH = os.getenv("NAME_CACHE_PATH", "data/name_cache.sqlite3")
+    NAME_CACHE_TTL_SECONDS = float(os.getenv("NAME_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+    NAME_CACHE_MEMORY_MAX_ENTRIES = int(os.getenv("NAME_CACHE_MEMORY_MAX_ENTRIES", "2048"))
+    NAME_CACHE_DISK_MAX_ENTRIES = int(os.getenv("NAME_CACHE_DISK_MAX_ENTRIES", "200000"))
+    # 每个名字最多缓存的不同解析结果数，命中时随机返回其中之一
+    NAME_CACHE_VARIANTS = int(os.getenv("NAME_CACHE_VARIANTS", "1"))
+
+    # 本地图片存储：将生成的图片按内容哈希保存到磁盘，由 /api/images/{digest} 提供访问
+    IMAGE_STORE_ENABLED = os.getenv("IMAGE_STORE_ENABLED", "false").lower() == "true"
+    IMAGE_STORE_DIR = os.getenv("IMAGE_STORE_DIR", "data/images")
+    # 获取图片内容的方式："b64_json" 直接让 Seedream 返回图片数据，"url" 则下载一次临时链接
+    IMAGE_STORE_SOURCE = os.getenv("IMAGE_STORE_SOURCE", "b64_json")
+    IMAGE_STORE_VARIANT_WIDTHS = [int(w) for w in os.getenv("IMAGE_STORE_VARIANT_WIDTHS", "256,512").split(",") if w.strip()]
+    # 对外可访问的后端地址，用于拼接本地图片的绝对 URL
+    PUBLIC_BASE_URL = os.getenv("PUBLIC_BASE_URL", "http://localhost:8000")
+
+    # 合并并发的相同上游请求（相同 prompt 与参数）
+    SINGLEFLIGHT_ENABLED = os.getenv("SINGLEFLIGHT_ENABLED", "true").lower() == "true"
+
+    # 多 worker 部署：WEB_CONCURRENCY 与 uvicorn 命令行使用同一个环境变量。
+    # 多于一个 worker 时默认启用共享状态（SQLite WAL），令牌桶与请求合并在同一主机的各 worker 间共享
+    WORKERS = int(os.getenv("WEB_CONCURRENCY", "1"))
+    SHARED_STATE_ENABLED = os.getenv("SHARED_STATE_ENABLED", str(WORKERS > 1)).lower() == "true"
+    SHARED_STATE_PATH = os.getenv("SHARED_STATE_PATH", "data/shared_state.sqlite3")
+
+    # 上游限流（令牌桶，遇到 429 时自适应降速）、重试与熔断
+    LLM_RATE_LIMIT_RPS = float(os.getenv("LLM_RATE_LIMIT_RPS", "20"))
+    LLM_RATE_LIMIT_BURST = int(os.getenv("LLM_RATE_LIMIT_BURST", "20"))
+    LLM_RATE_LIMIT_MIN_RPS = float(os.getenv("LLM_RATE_LIMIT_MIN_RPS", "1"))
+    IMAGE_RATE_LIMIT_RPS = float(os.getenv("IMAGE_RATE_LIMIT_RPS", "5"))
+    IMAGE_RATE_LIMIT_BURST = int(os.getenv("IMAGE_RATE_LIMIT_BURST", "10"))
+    IMAGE_RATE_LIMIT_MIN_RPS = float(os.getenv("IMAGE_RATE_LIMIT_MIN_RPS", "0.2"))
+    UPSTREAM_MAX_RETRIES = int(os.getenv("UPSTREAM_MAX_RETRIES", "2"))
+    UPSTREAM_RETRY_BASE_DELAY = float(os.getenv("UPSTREAM_RETRY_BASE_DELAY", "0.5"))
+    UPSTREAM_RETRY_MAX_DELAY = float(os.getenv("UPSTREAM_RETRY_MAX_DELAY", "8"))
+    CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+    CIRCUIT_RESET_TIMEOUT = float(os.getenv("CIRCUIT_RESET_TIMEOUT", "30"))
+
+    # 上游 HTTP 连接池与超时（连接/读/写/等待连接池分开配置）
+    UPSTREAM_MAX_CONNECTIONS = int(os.getenv("UPSTREAM_MAX_CONNECTIONS", "100"))
+    UPSTREAM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("UPSTREAM_MAX_KEEPALIVE_CONNECTIONS", "20"))
+    UPSTREAM_KEEPALIVE_EXPIRY = float(os.getenv("UPSTREAM_KEEPALIVE_EXPIRY", "120"))
+    UPSTREAM_HTTP2 = os.getenv("UPSTREAM_HTTP2", "true").lower() == "true"
+    UPSTREAM_CONNECT_TIMEOUT = float(os.getenv("UPSTREAM_CONNECT_TIMEOUT", "5"))
+    UPSTREAM_WRITE_TIMEOUT = float(os.getenv("UPSTREAM_WRITE_TIMEOUT", "10"))
+    UPSTREAM_POOL_TIMEOUT = float(os.getenv("UPSTREAM_POOL_TIMEOUT", "10"))
+    LLM_READ_TIMEOUT = float(os.getenv("LLM_READ_TIMEOUT", "60"))
+    IMAGE_READ_TIMEOUT = float(os.getenv("IMAGE_READ_TIMEOUT", "120"))
+
+    # LLM 对冲请求（默认关闭）：超过近期延迟的该分位数仍未返回时发出第二个请求
+    LLM_HEDGING_ENABLED = os.getenv("LLM_HEDGING_ENABLED", "false").lower() == "true"
+    LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))
+    LLM_HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", "1"))
+    # 额外请求预算：最多约为调用次数的该比例
+    LLM_HEDGE_BUDGET_RATIO = float(os.getenv("LLM_HEDGE_BUDGET_RATIO", "0.1"))
+
+    # 批量盲盒任务：进程内队列 + 有限的 worker，任务状态持久化在 SQLite
+    JOBS_DB_PATH = os.getenv("JOBS_DB_PATH", "data/jobs.sqlite3")
+    BATCH_JOB_WORKERS = int(os.getenv("BATCH_JOB_WORKERS", "2"))
+    BATCH_JOB_MAX_NAMES = int(os.getenv("BATCH_JOB_MAX_NAMES", "5000"))
+    # 正在处理的条目的租约：处理中的进程定期续约，过期（进程退出）后其他进程才会接手
+    BATCH_JOB_LEASE_SECONDS = float(os.getenv("BATCH_JOB_LEASE_SECONDS", "60"))
+    # 批量任务调用上游时，为交互请求保留的令牌桶份额
+    BATCH_UPSTREAM_RESERVE_RATIO = float(os.getenv("BATCH_UPSTREAM_RESERVE_RATIO", "0.5"))
+    # 批量任务同时占用的图片生成并发上限（IMAGE_GENERATION_MAX_CONCURRENCY 中的其余份额始终留给交互请求）
+    BATCH_IMAGE_MAX_CONCURRENCY = int(os.getenv("BATCH_IMAGE_MAX_CONCURRENCY", str(max(1, IMAGE_GENERATION_MAX_CONCURRENCY // 4))))
+
+    # 推测式反馈预取（默认关闭）：生成盲盒图片的同时为每组意象预先生成反馈
+    FEEDBACK_PREFETCH_ENABLED = os.getenv("FEEDBACK_PREFETCH_ENABLED", "false").lower() == "true"
+    FEEDBACK_PREFETCH_TTL_SECONDS = float(os.getenv("FEEDBACK_PREFETCH_TTL_SECONDS", "600"))
+    FEEDBACK_PREFETCH_MAX_ENTRIES = int(os.getenv("FEEDBACK_PREFETCH_MAX_ENTRIES", "10000"))
+
+    # 热门意象预热池（默认关闭）：上游空闲时为最常请求的意象组合预先生成图片
+    PREFETCH_ENABLED = os.getenv("PREFETCH_ENABLED", "false").lower() == "true"
+    PREFETCH_TOP_PAIRS = int(os.getenv("PREFETCH_TOP_PAIRS", "50"))
+    PREFETCH_TOP_NAMES = int(os.getenv("PREFETCH_TOP_NAMES", "20"))
+    PREFETCH_POOL_DEPTH = int(os.getenv("PREFETCH_POOL_DEPTH", "2"))
+    # 池中图片总数上限（内存/磁盘预算），满时按请求频率最低的组合淘汰
+    PREFETCH_MAX_IMAGES = int(os.getenv("PREFETCH_MAX_IMAGES", "200"))
+    PREFETCH_MIN_REQUESTS = float(os.getenv("PREFETCH_MIN_REQUESTS", "3"))
+    PREFETCH_INTERVAL_SECONDS = float(os.getenv("PREFETCH_INTERVAL_SECONDS", "5"))
+    # 上游返回的图片链接是临时的，池中图片需在过期前使用
+    PREFETCH_IMAGE_TTL_SECONDS = float(os.getenv("PREFETCH_IMAGE_TTL_SECONDS", str(6 * 3600)))
+    PREFETCH_DECAY_INTERVAL_SECONDS = float(os.getenv("PREFETCH_DECAY_INTERVAL_SECONDS", "3600"))
+
+    # 名字解析本地快速路径：离线构建的逐字/拼音谐音意象索引（由 tools/build_name_index.py 生成）
+    NAME_INDEX_ENABLED = os.getenv("NAME_INDEX_ENABLED", "true").lower() == "true"
+    NAME_INDEX_PATH = os.getenv("NAME_INDEX_PATH", "data/name_index.json")
+    # 索引可覆盖的名字中仍交给 LLM 解析的比例，保证不断有新的解析结果
+    NAME_INDEX_LLM_RATIO = float(os.getenv("NAME_INDEX_LLM_RATIO", "0.1"))
+
+    # 上游原始请求/响应日志的采样比例（0 表示关闭；日志中的长字符串如 b64_json 会被截断）
+    UPSTREAM_DEBUG_SAMPLE_RATE = float(os.getenv("UPSTREAM_DEBUG_SAMPLE_RATE", "0"))
+
+    # 准入控制与削峰：按路由类别（LLM / 图片）限制并发，按客户端轮转排队，
+    # 预计排队时间超过上限时直接返回 503 + Retry-After
+    ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "true").lower() == "true"
+    ADMISSION_LLM_CONCURRENCY = int(os.getenv("ADMISSION_LLM_CONCURRENCY", "64"))
+    ADMISSION_LLM_MAX_WAIT_SECONDS = float(os.getenv("ADMISSION_LLM_MAX_WAIT_SECONDS", "10"))
+    ADMISSION_IMAGE_CONCURRENCY = int(os.getenv("ADMISSION_IMAGE_CONCURRENCY", "16"))
+    ADMISSION_IMAGE_MAX_WAIT_SECONDS = float(os.getenv("ADMISSION_IMAGE_MAX_WAIT_SECONDS", "30"))
+    ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "500"))
+    # 识别客户端的请求头（如部署在反向代理后时设为 X-Forwarded-For），为空时使用连接的对端地址
+    ADMISSION_CLIENT_HEADER = os.getenv("ADMISSION_CLIENT_HEADER", "")
+
+    # 降级策略：上游熔断、近期错误率或 p95 延迟超过阈值时进入降级模式（至少保持 DEGRADATION_HOLD_SECONDS）。
+    # 图片降级时用缓存的相同/相似意象图片代替实时生成，名字盲盒只返回解析结果、图片在后台生成；
+    # LLM 降级时切换到 LLM_FALLBACK_MODEL（为空则不切换，例如 doubao-1-5-lite-32k-250115）
+    DEGRADATION_ENABLED = os.getenv("DEGRADATION_ENABLED", "true").lower() == "true"
+    DEGRADATION_WINDOW_SECONDS = float(os.getenv("DEGRADATION_WINDOW_SECONDS", "60"))
+    DEGRADATION_MIN_SAMPLES = int(os.getenv("DEGRADATION_MIN_SAMPLES", "5"))
+    DEGRADATION_MAX_ERROR_RATE = float(os.getenv("DEGRADATION_MAX_ERROR_RATE", "0.5"))
+    DEGRADATION_LLM_MAX_P95_SECONDS = float(os.getenv("DEGRADATION_LLM_MAX_P95_SECONDS", "20"))
+    DEGRADATION_IMAGE_MAX_P95_SECONDS = float(os.getenv("DEGRADATION_IMAGE_MAX_P95_SECONDS", "60"))
+    DEGRADATION_HOLD_SECONDS = float(os.getenv("DEGRADATION_HOLD_SECONDS", "60"))
+    LLM_FALLBACK_MODEL = os.getenv("LLM_FALLBACK_MODEL", "")
+    # 降级时可代替实时生成的近期图片（上游图片链接是临时的，需在过期前使用）
+    FALLBACK_IMAGES_MAX_ENTRIES = int(os.getenv("FALLBACK_IMAGES_MAX_ENTRIES", "2000"))
+    FALLBACK_IMAGES_TTL_SECONDS = float(os.getenv("FALLBACK_IMAGES_TTL_SECONDS", str(6 * 3600)))
+    # 降级时为只返回解析结果的盲盒在后台生成的图片数上限
+    DEFERRED_IMAGES_MAX_PENDING = int(os.getenv("DEFERRED_IMAGES_MAX_PENDING", "200"))
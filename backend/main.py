@@ -1,10 +1,48 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from api.interpret_name import interpret_name_router
 from api.generate_image import generate_image_router
 from api.generate_feedback import generate_feedback_router
+from api.images import images_router
+from api.upstream_stats import upstream_stats_router
+from api.jobs import jobs_router, batch_job_manager
+from api.metrics import metrics_router, MetricsMiddleware
+from api.admission import admission_router, AdmissionMiddleware
+from api.degradation import degradation_router, ServiceModeMiddleware
+from api.generate_image import blindbox_pool, deferred_images
+from config import Config
+from services.llm import doubao_llm_service
+from services.vlm import doubao_vlm_service
+from services.name_index import name_index
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await name_index.load()
+    # 启动时创建上游连接池，关闭时释放
+    await doubao_llm_service.start()
+    await doubao_vlm_service.start()
+    await batch_job_manager.start()
+    await blindbox_pool.start()
+    try:
+        yield
+    finally:
+        await deferred_images.stop()
+        await blindbox_pool.stop()
+        await batch_job_manager.stop()
+        await doubao_vlm_service.aclose()
+        await doubao_llm_service.aclose()
+
+
+# 其余路由的 JSON 响应同样使用 orjson 序列化
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
+
+# 准入控制：按路由类别排队与削峰（在 CORS 之内，拒绝响应同样带 CORS 头）
+app.add_middleware(AdmissionMiddleware, enabled=Config.ADMISSION_ENABLED)
+# 在响应头 X-Service-Mode 中标明当前是否处于降级模式
+app.add_middleware(ServiceModeMiddleware)
 
 # 配置 CORS
 origins = [
@@ -21,13 +59,23 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],  # 允许所有方法
     allow_headers=["*"],  # 允许所有头部
+    expose_headers=["X-Service-Mode"],  # 允许前端读取降级模式
 )
+# 记录每个路由的延迟与进行中的请求数，由 /metrics 导出
+app.add_middleware(MetricsMiddleware)
 
 # Include routers
 app.include_router(interpret_name_router)
 app.include_router(generate_image_router)
 app.include_router(generate_feedback_router)
+app.include_router(images_router)
+app.include_router(upstream_stats_router)
+app.include_router(jobs_router)
+app.include_router(metrics_router)
+app.include_router(admission_router)
+app.include_router(degradation_router)
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    # 多 worker（WEB_CONCURRENCY）时 uvicorn 需要以导入字符串的形式加载 app
+    uvicorn.run("main:app", host="0.0.0.0", port=8000, workers=Config.WORKERS)
\ No newline at end of file
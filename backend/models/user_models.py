@@ -1,6 +1,6 @@
 # backend/user_models.py
 from pydantic import BaseModel, Field, RootModel, HttpUrl
-from typing import List
+from typing import List, Literal, Optional
 
 
 class NameInput(BaseModel):
@@ -8,6 +8,11 @@ class NameInput(BaseModel):
     Represents the input for name interpretation.
     """
     name: str = Field(..., description="The name to be interpreted.")
+    cache: Literal["default", "bypass", "refresh"] = Field(
+        "default",
+        description="Interpretation cache mode: 'bypass' neither reads nor writes the cache, "
+                    "'refresh' skips the lookup and replaces the cached entry.",
+    )
 
 
 # 定义单个意象组合的模型
@@ -50,6 +55,11 @@ class ImageResponse(BaseModel):
     # HttpUrl 类型会自动校验字符串是否是有效的URL格式
     # 并且在返回时，Pydantic 会将其转换为字符串
     images: List[HttpUrl] = Field(..., description="A list of URLs for the generated images.")
+    degraded: Optional[Literal["cached", "similar"]] = Field(
+        None,
+        description="Set when the image upstream is degraded and the image was not generated for this request: "
+                    "'cached' is an earlier image of the same imagery pair, 'similar' one sharing an imagery element.",
+    )
 
 
 class FeedbackResponse(BaseModel):
@@ -62,11 +72,17 @@ class FeedbackResponse(BaseModel):
 class NameImagesResponseItem(BaseModel):
     """
     Represents one blind box image result, including its imagery and generated image URL.
+    A failed generation keeps its imagery so the box can still be shown without an image. While the
+    image upstream is degraded an item may be "pending": its image is generated in the background
+    and returned by /api/generate_image for the same imagery pair.
     """
     id: int = Field(..., description="Unique identifier for the imagery combination.")
     imagery1: str = Field(..., description="The first concrete, representable imagery element.")
     imagery2: str = Field(..., description="The second concrete, representable imagery element.")
-    image_url: HttpUrl = Field(..., description="URL of the generated image.")
+    status: Literal["success", "failed", "pending"] = Field("success", description="Whether the image for this combination was generated.")
+    image_url: Optional[HttpUrl] = Field(None, description="URL of the generated image, absent when generation failed or is pending.")
+    error: Optional[str] = Field(None, description="Reason the image generation failed, if it did.")
+    degraded: Optional[Literal["cached", "similar"]] = Field(None, description="See ImageResponse.degraded.")
 
 # for api:generate_name_images
 class NameImagesResponse(RootModel):
@@ -74,3 +90,24 @@ class NameImagesResponse(RootModel):
     Represents a list of blind box image results.
     """
     root: List[NameImagesResponseItem] = Field(..., description="A list of blind box image results.")
+
+
+# for api:jobs
+class BatchNameInput(BaseModel):
+    """
+    Represents a batch of names submitted for blind box pre-generation.
+    """
+    names: List[str] = Field(..., min_length=1, description="The names to generate blind boxes for.")
+
+
+class BatchJobStatus(BaseModel):
+    """
+    Represents the progress of a batch blind box job.
+    """
+    job_id: str = Field(..., description="Unique identifier of the job.")
+    status: Literal["queued", "running", "completed"] = Field(..., description="Overall job status.")
+    total: int = Field(..., description="Number of names in the job.")
+    succeeded: int = Field(..., description="Number of names whose blind box was generated.")
+    failed: int = Field(..., description="Number of names whose blind box could not be generated.")
+    created_at: float = Field(..., description="Submission time (Unix timestamp).")
+    updated_at: float = Field(..., description="Time of the last progress update (Unix timestamp).")
@@ -1,5 +1,8 @@
 # backend/prompts/llm_prompts.py
 
+# 修改 get_interpret_name_prompt 时递增，使旧的名字解析缓存自动失效
+INTERPRET_NAME_PROMPT_VERSION = "v1"
+
 def get_interpret_name_prompt(name: str) -> str:
     """
     Generates the prompt for the LLM to interpret a name into structured imagery combinations.
@@ -0,0 +1,127 @@
+# backend/services/admission.py
+import asyncio
+import time
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, Optional
+from services.metrics import Counter, Gauge, Histogram, registry
+
+admission_requests = registry.register(Counter(
+    "admission_requests_total", "Requests seen by admission control, by outcome.", ("route_class", "outcome"),
+))
+admission_queue_depth = registry.register(Gauge(
+    "admission_queue_depth", "Requests waiting for an admission slot.", ("route_class",),
+))
+admission_wait = registry.register(Histogram(
+    "admission_wait_seconds", "Time admitted requests spent queued.", ("route_class",),
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60),
+))
+
+
+class AdmissionRejectedError(Exception):
+    """Raised when a request would wait longer than the route class allows."""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class AdmissionQueue:
+    """
+    Concurrency slots for one class of routes, with a per-client fair waiting line.
+
+    Up to `concurrency` requests run at once. Others wait in per-client FIFO queues that are served
+    round-robin, so one client flooding the service only delays its own requests. A request is
+    rejected up front when its estimated wait exceeds `max_wait` seconds (or the line holds
+    `max_queue` requests). The estimate is the number of requests that round-robin would serve
+    first, divided by `concurrency`, times the average time a request holds its slot (an EWMA
+    seeded with `initial_service_time`).
+    """
+
+    def __init__(self, name: str, concurrency: int, max_wait: float, max_queue: int, initial_service_time: float):
+        self.name = name
+        self.concurrency = max(1, concurrency)
+        self.max_wait = max_wait
+        self.max_queue = max_queue
+        self.service_time = initial_service_time
+        self._active = 0
+        self._queued = 0
+        # client -> 等待中的 future；字典顺序即轮转顺序
+        self._waiters: "OrderedDict[str, Deque[asyncio.Future]]" = OrderedDict()
+
+    def estimated_wait(self, client: str) -> float:
+        """Seconds a new request from `client` is expected to wait for a slot."""
+        if self._active < self.concurrency and not self._queued:
+            return 0.0
+        own = len(self._waiters.get(client, ()))
+        # 轮转调度下，排在它前面的是自己已排队的请求，以及其他客户端各自最多 own+1 个请求
+        ahead = own + sum(min(len(waiters), own + 1) for key, waiters in self._waiters.items() if key != client)
+        return (ahead + 1) / self.concurrency * self.service_time
+
+    async def acquire(self, client: str):
+        """Waits for a slot; raises AdmissionRejectedError instead of queueing past the SLO."""
+        if self._active < self.concurrency and not self._queued:
+            self._active += 1
+            admission_requests.inc(route_class=self.name, outcome="admitted")
+            return
+
+        estimate = self.estimated_wait(client)
+        if estimate > self.max_wait or self._queued >= self.max_queue:
+            admission_requests.inc(route_class=self.name, outcome="rejected")
+            raise AdmissionRejectedError(
+                f"Server busy: estimated wait {estimate:.1f}s exceeds {self.max_wait:.0f}s", retry_after=estimate,
+            )
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(client, deque()).append(future)
+        self._set_queued(self._queued + 1)
+        start = time.monotonic()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # 槽位已经移交给本请求，但请求被取消：继续移交给下一个
+                self.release(0.0)
+            else:
+                self._remove(client, future)
+            raise
+        admission_requests.inc(route_class=self.name, outcome="queued")
+        admission_wait.observe(time.monotonic() - start, route_class=self.name)
+
+    def release(self, held: float):
+        """Frees a slot held for `held` seconds, handing it to the next client in round-robin order."""
+        if held > 0:
+            self.service_time = 0.8 * self.service_time + 0.2 * held
+        while self._waiters:
+            client, waiters = next(iter(self._waiters.items()))
+            future = waiters.popleft()
+            if waiters:
+                self._waiters.move_to_end(client)
+            else:
+                del self._waiters[client]
+            self._set_queued(self._queued - 1)
+            if not future.done():
+                future.set_result(None)
+                return
+        self._active -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "active": self._active,
+            "queued": self._queued,
+            "clients_waiting": len(self._waiters),
+            "concurrency": self.concurrency,
+            "service_time": round(self.service_time, 3),
+            "max_wait": self.max_wait,
+        }
+
+    def _remove(self, client: str, future: asyncio.Future):
+        waiters: Optional[Deque[asyncio.Future]] = self._waiters.get(client)
+        if waiters and future in waiters:
+            waiters.remove(future)
+            self._set_queued(self._queued - 1)
+            if not waiters:
+                del self._waiters[client]
+
+    def _set_queued(self, value: int):
+        self._queued = value
+        admission_queue_depth.set(value, route_class=self.name)
@@ -0,0 +1,232 @@
+# backend/services/degradation.py
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Set, Tuple
+from services.metrics import Counter, Gauge, registry
+from services.upstream import UpstreamController, upstream_priority
+
+Pair = Tuple[str, str]
+
+upstream_degraded = registry.register(Gauge(
+    "upstream_degraded", "1 while the degradation policy serves the upstream's routes in degraded mode.", ("upstream",),
+))
+degraded_results = registry.register(Counter(
+    "degraded_results_total", "Results served in a degraded mode, by how they were degraded.", ("mode",),
+))
+
+
+class DegradationPolicy:
+    """
+    Decides whether an upstream is healthy enough for normal serving.
+
+    The upstream is degraded while its circuit breaker is open, or while the calls that ended in the
+    last `window` seconds (at least `min_samples` of them) have an error rate above `max_error_rate`
+    or a p95 latency above `max_p95`. Once degraded it stays so for at least `hold` seconds, so the
+    mode does not flap as soon as the fallbacks have taken the load off the upstream.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        controller: UpstreamController,
+        enabled: bool,
+        max_error_rate: float,
+        max_p95: float,
+        window: float,
+        min_samples: int,
+        hold: float,
+    ):
+        self.name = name
+        self.controller = controller
+        self.enabled = enabled
+        self.max_error_rate = max_error_rate
+        self.max_p95 = max_p95
+        self.window = window
+        self.min_samples = min_samples
+        self.hold = hold
+        self.reason: Optional[str] = None
+        self.times_degraded = 0
+        self._until = 0.0
+        upstream_degraded.set(0, upstream=name)
+
+    @property
+    def degraded(self) -> bool:
+        return self.evaluate() is not None
+
+    def evaluate(self) -> Optional[str]:
+        """Returns why the upstream is degraded ("circuit_open", "error_rate" or "latency"), or None."""
+        if not self.enabled:
+            return None
+        # 与 controller.health() 使用同一个时钟
+        now = self.controller.clock()
+        reason = self._check()
+        if reason is not None:
+            if self.reason is None:
+                self.times_degraded += 1
+            self.reason = reason
+            self._until = now + self.hold
+        elif self.reason is not None and now >= self._until:
+            self.reason = None
+        upstream_degraded.set(1 if self.reason else 0, upstream=self.name)
+        return self.reason
+
+    def _check(self) -> Optional[str]:
+        breaker = self.controller.breaker
+        # 只在熔断的冷却期内算作降级；冷却期过后由下一次调用（半开探测）决定
+        if breaker.status == "open" and breaker.retry_after() > 0:
+            return "circuit_open"
+        health = self.controller.health(self.window)
+        if health["samples"] < self.min_samples:
+            return None
+        if health["error_rate"] > self.max_error_rate:
+            return "error_rate"
+        if health["p95"] is not None and health["p95"] > self.max_p95:
+            return "latency"
+        return None
+
+    def state(self) -> Dict[str, Any]:
+        reason = self.evaluate()
+        return {
+            "mode": "degraded" if reason else "normal",
+            "reason": reason,
+            "held_for": round(max(0.0, self._until - self.controller.clock()), 3) if reason else 0.0,
+            "times_degraded": self.times_degraded,
+            "recent": self.controller.health(self.window),
+            "max_error_rate": self.max_error_rate,
+            "max_p95": self.max_p95,
+        }
+
+
+class FallbackImageCache:
+    """
+    Recently generated image URLs by imagery pair, served instead of a live generation while the
+    image upstream is degraded or failing. A pair sharing one imagery element with the requested
+    pair counts as similar; an exact match is preferred, then the most recent similar image.
+    """
+
+    def __init__(self, max_entries: int, ttl: float, clock: Callable[[], float] = time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        # (imagery1, imagery2) -> (生成时间, URL)；字典顺序即新旧顺序
+        self._entries: "OrderedDict[Pair, Tuple[float, str]]" = OrderedDict()
+        self._by_imagery: Dict[str, Set[Pair]] = {}
+        self.counters: Dict[str, int] = {"exact": 0, "similar": 0, "misses": 0}
+
+    def add(self, imagery1: str, imagery2: str, url: str):
+        pair = (imagery1, imagery2)
+        self._entries[pair] = (self.clock(), url)
+        self._entries.move_to_end(pair)
+        for imagery in pair:
+            self._by_imagery.setdefault(imagery, set()).add(pair)
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+
+    def find(self, imagery1: str, imagery2: str) -> Optional[Tuple[str, bool]]:
+        """Returns (url, is_exact_match) of the best fresh cached image, or None."""
+        pair = (imagery1, imagery2)
+        url = self._fresh(pair)
+        if url is not None:
+            self.counters["exact"] += 1
+            return url, True
+
+        best: Optional[Tuple[float, str]] = None
+        for candidate in self._by_imagery.get(imagery1, set()) | self._by_imagery.get(imagery2, set()):
+            url = self._fresh(candidate)
+            if url is not None and (best is None or self._entries[candidate][0] > best[0]):
+                best = (self._entries[candidate][0], url)
+        if best is None:
+            self.counters["misses"] += 1
+            return None
+        self.counters["similar"] += 1
+        return best[1], False
+
+    def _fresh(self, pair: Pair) -> Optional[str]:
+        entry = self._entries.get(pair)
+        if entry is None:
+            return None
+        if self.clock() - entry[0] > self.ttl:
+            self._remove(pair)
+            return None
+        return entry[1]
+
+    def _remove(self, pair: Pair):
+        self._entries.pop(pair, None)
+        for imagery in pair:
+            pairs = self._by_imagery.get(imagery)
+            if pairs is not None:
+                pairs.discard(pair)
+                if not pairs:
+                    del self._by_imagery[imagery]
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self.counters, "entries": len(self._entries)}
+
+
+class DeferredImages:
+    """
+    Image generations started in the background for blind box items that were returned without an
+    image. A later request for the same pair takes over the generation, whether it is still running
+    or already finished, instead of starting another one. Generations run at batch priority, so they
+    only use the upstream capacity that interactive requests leave free.
+    """
+
+    def __init__(self, generate: Callable[[str, str], Awaitable[Optional[str]]], max_pending: int, ttl: float):
+        self._generate = generate
+        self.max_pending = max_pending
+        self.ttl = ttl
+        self._tasks: Dict[Pair, Tuple[float, asyncio.Task]] = {}
+        self.counters: Dict[str, int] = {"deferred": 0, "taken": 0, "dropped": 0}
+
+    def defer(self, imagery1: str, imagery2: str) -> bool:
+        """Starts generating the pair in the background; False when the backlog is full."""
+        pair = (imagery1, imagery2)
+        self._expire()
+        if pair in self._tasks:
+            return True
+        if len(self._tasks) >= self.max_pending:
+            self.counters["dropped"] += 1
+            return False
+        task = asyncio.create_task(self._run(imagery1, imagery2))
+        # 无人取走的失败结果也标记为已读取，避免 "exception was never retrieved" 警告
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        self._tasks[pair] = (time.monotonic(), task)
+        self.counters["deferred"] += 1
+        return True
+
+    async def take(self, imagery1: str, imagery2: str) -> Optional[str]:
+        """Waits for the deferred image of the pair, if there is one; None if there is none or it failed."""
+        entry = self._tasks.pop((imagery1, imagery2), None)
+        if entry is None:
+            return None
+        self.counters["taken"] += 1
+        try:
+            return await asyncio.shield(entry[1])
+        except Exception:
+            return None
+
+    async def _run(self, imagery1: str, imagery2: str) -> Optional[str]:
+        upstream_priority.set("batch")
+        return await self._generate(imagery1, imagery2)
+
+    def _expire(self):
+        # 长时间无人取走的已完成结果（临时链接可能已过期）直接丢弃
+        now = time.monotonic()
+        for pair, (created, task) in list(self._tasks.items()):
+            if task.done() and now - created > self.ttl:
+                del self._tasks[pair]
+
+    async def stop(self):
+        tasks = [task for _, task in self._tasks.values()]
+        self._tasks.clear()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.counters,
+            "pending": sum(not task.done() for _, task in self._tasks.values()),
+            "ready": sum(task.done() for _, task in self._tasks.values()),
+        }
@@ -0,0 +1,126 @@
+# backend/services/feedback_cache.py
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from config import Config
+from services.upstream import upstream_priority
+
+
+class _Speculation:
+    def __init__(self, task: asyncio.Task, created_at: float):
+        self.task = task
+        self.created_at = created_at
+
+
+class SpeculativeFeedbackCache:
+    """
+    Short-lived cache of feedback generated speculatively for imagery pairs the user may pick.
+
+    A speculation is a background task keyed by (imagery1, imagery2); it runs with batch upstream
+    priority so it never competes with interactive requests for rate-limit capacity. Each result is
+    served at most once (later requests for the same pair get a fresh live call), and a pair
+    requested while its speculation is still running waits for it instead of starting a new call.
+    """
+
+    def __init__(self, enabled: bool, ttl_seconds: float, max_entries: int, clock: Callable[[], float] = time.monotonic):
+        self.enabled = enabled
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.clock = clock
+        self._entries: "OrderedDict[Tuple[str, str], _Speculation]" = OrderedDict()
+        self.counters: Dict[str, int] = {
+            "speculated": 0,
+            "hits": 0,
+            "hits_in_flight": 0,
+            "misses": 0,
+            "failed": 0,
+            "wasted": 0,
+        }
+
+    def speculate(self, imagery1: str, imagery2: str, fn: Callable[[], Awaitable[str]]):
+        """
+        Starts generating feedback for the pair in the background unless it is already cached.
+        Skipped for batch jobs, where nobody is going to pick a pair.
+        """
+        if not self.enabled or upstream_priority.get() == "batch":
+            return
+        self._purge()
+        key = (imagery1, imagery2)
+        if key in self._entries:
+            return
+
+        async def run() -> str:
+            upstream_priority.set("batch")
+            return await fn()
+
+        task = asyncio.create_task(run())
+        # 取走异常，避免未被使用的失败推测产生 "exception was never retrieved" 警告
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        self._entries[key] = _Speculation(task, self.clock())
+        self.counters["speculated"] += 1
+        while len(self._entries) > self.max_entries:
+            _, evicted = self._entries.popitem(last=False)
+            self._discard(evicted)
+
+    async def get(self, imagery1: str, imagery2: str) -> Optional[str]:
+        """
+        Returns the speculated feedback for the pair (waiting for it if still running),
+        or None when there is none or it failed.
+        """
+        if not self.enabled:
+            return None
+        self._purge()
+        entry = self._entries.pop((imagery1, imagery2), None)
+        if entry is None:
+            self.counters["misses"] += 1
+            return None
+
+        in_flight = not entry.task.done()
+        try:
+            result = await asyncio.shield(entry.task)
+        except asyncio.CancelledError:
+            if not entry.task.cancelled():
+                raise
+            self.counters["failed"] += 1
+            return None
+        except Exception as e:
+            print(f"Speculative feedback failed, falling back to a live call: {e}")
+            self.counters["failed"] += 1
+            return None
+
+        self.counters["hits_in_flight" if in_flight else "hits"] += 1
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        served = self.counters["hits"] + self.counters["hits_in_flight"]
+        requests = served + self.counters["misses"] + self.counters["failed"]
+        return {
+            **self.counters,
+            "pending": len(self._entries),
+            # 推测结果被使用的比例（成本效率）与反馈请求命中推测的比例
+            "speculation_use_rate": round(served / self.counters["speculated"], 4) if self.counters["speculated"] else 0.0,
+            "request_hit_rate": round(served / requests, 4) if requests else 0.0,
+        }
+
+    def _purge(self):
+        now = self.clock()
+        while self._entries:
+            key, entry = next(iter(self._entries.items()))
+            if now - entry.created_at < self.ttl_seconds:
+                break
+            del self._entries[key]
+            self._discard(entry)
+
+    def _discard(self, entry: _Speculation):
+        # 从未被使用的推测计为浪费；仍在进行的直接取消，不再继续付费
+        self.counters["wasted"] += 1
+        if not entry.task.done():
+            entry.task.cancel()
+
+
+speculative_feedback_cache = SpeculativeFeedbackCache(
+    enabled=Config.FEEDBACK_PREFETCH_ENABLED,
+    ttl_seconds=Config.FEEDBACK_PREFETCH_TTL_SECONDS,
+    max_entries=Config.FEEDBACK_PREFETCH_MAX_ENTRIES,
+)
@@ -0,0 +1,131 @@
+# backend/services/hedging.py
+import asyncio
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class LatencyTracker:
+    """Sliding window of recent successful call latencies (in seconds)."""
+
+    def __init__(self, window: int = 200):
+        self._samples: Deque[float] = deque(maxlen=window)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def record(self, seconds: float):
+        self._samples.append(seconds)
+
+    def percentile(self, p: float) -> Optional[float]:
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        index = min(len(ordered) - 1, max(0, int(round(p / 100 * len(ordered))) - 1))
+        return ordered[index]
+
+    def summary(self) -> Dict[str, Optional[float]]:
+        """p50/p95/p99 of the window, rounded to milliseconds."""
+        return {
+            f"p{p}": round(value, 3) if value is not None else None
+            for p, value in ((p, self.percentile(p)) for p in (50, 95, 99))
+        }
+
+
+class Hedger:
+    """
+    Issues a duplicate ("hedge") call when the first one is slower than a percentile of recent
+    latency; the first successful result wins and the other call is cancelled.
+
+    Extra upstream spend is capped by a budget: every call earns `budget_ratio` hedge tokens
+    (up to `max_budget`) and every hedge spends one, so at most ~budget_ratio of calls are duplicated.
+    """
+
+    def __init__(
+        self,
+        enabled: bool,
+        percentile: float,
+        min_delay: float,
+        budget_ratio: float,
+        max_budget: float = 10.0,
+        min_samples: int = 20,
+        window: int = 200,
+    ):
+        self.enabled = enabled
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.budget_ratio = budget_ratio
+        self.max_budget = max_budget
+        self.min_samples = min_samples
+        self.latency = LatencyTracker(window)
+        self._budget = 0.0
+        self.counters: Dict[str, int] = {"calls": 0, "hedged": 0, "hedge_wins": 0, "budget_exhausted": 0}
+
+    def hedge_delay(self) -> Optional[float]:
+        """Seconds to wait before hedging, or None while there are too few samples to tell."""
+        if len(self.latency) < self.min_samples:
+            return None
+        return max(self.min_delay, self.latency.percentile(self.percentile))
+
+    async def run(self, fn: Callable[[], Awaitable[T]]) -> T:
+        """
+        Runs fn(), hedging it with a second fn() call if it is too slow.
+
+        Latency is always recorded so the hedge delay keeps tracking upstream conditions,
+        even while hedging itself is disabled.
+        """
+        self.counters["calls"] += 1
+        self._budget = min(self.max_budget, self._budget + self.budget_ratio)
+
+        primary = asyncio.create_task(self._timed(fn))
+        tasks = {primary}
+        try:
+            delay = self.hedge_delay() if self.enabled else None
+            if delay is None:
+                return await primary
+
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if done:
+                return primary.result()
+            if self._budget < 1:
+                self.counters["budget_exhausted"] += 1
+                return await primary
+
+            self._budget -= 1
+            self.counters["hedged"] += 1
+            hedge = asyncio.create_task(self._timed(fn))
+            tasks.add(hedge)
+
+            pending = set(tasks)
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            self.counters["hedge_wins"] += 1
+                        return task.result()
+                    error = task.exception()
+            # 两个请求都失败时，抛出最后一个错误
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _timed(self, fn: Callable[[], Awaitable[T]]) -> T:
+        start = time.monotonic()
+        result = await fn()
+        self.latency.record(time.monotonic() - start)
+        return result
+
+    def state(self) -> Dict[str, Any]:
+        delay = self.hedge_delay()
+        return {
+            **self.counters,
+            "enabled": self.enabled,
+            "samples": len(self.latency),
+            "hedge_delay": round(delay, 3) if delay is not None else None,
+            "budget": round(self._budget, 3),
+        }
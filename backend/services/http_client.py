@@ -0,0 +1,78 @@
+# backend/services/http_client.py
+from typing import Any, Dict, Optional
+import httpx
+from config import Config
+
+try:
+    import h2  # noqa: F401  httpx 的 HTTP/2 支持依赖 h2
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+class UpstreamHTTPClient:
+    """
+    Owns a pooled httpx.AsyncClient for one upstream service.
+
+    The client is created in start() and closed in aclose(), both driven by the FastAPI lifespan.
+    Pool limits, keepalive, HTTP/2 and split connect/read/write/pool timeouts come from Config.
+    New TCP connections and TLS handshakes are counted through httpcore's trace extension.
+    """
+
+    def __init__(self, name: str, read_timeout: float):
+        self.name = name
+        self.read_timeout = read_timeout
+        self.client: Optional[httpx.AsyncClient] = None
+        self.counters: Dict[str, int] = {"requests": 0, "connections_opened": 0, "tls_handshakes": 0}
+
+    async def start(self) -> httpx.AsyncClient:
+        if self.client is None:
+            http2 = Config.UPSTREAM_HTTP2 and HTTP2_AVAILABLE
+            if Config.UPSTREAM_HTTP2 and not HTTP2_AVAILABLE:
+                print(f"{self.name}: HTTP/2 requested but the 'h2' package is not installed, using HTTP/1.1")
+            self.client = httpx.AsyncClient(
+                http2=http2,
+                limits=httpx.Limits(
+                    max_connections=Config.UPSTREAM_MAX_CONNECTIONS,
+                    max_keepalive_connections=Config.UPSTREAM_MAX_KEEPALIVE_CONNECTIONS,
+                    keepalive_expiry=Config.UPSTREAM_KEEPALIVE_EXPIRY,
+                ),
+                timeout=httpx.Timeout(
+                    connect=Config.UPSTREAM_CONNECT_TIMEOUT,
+                    read=self.read_timeout,
+                    write=Config.UPSTREAM_WRITE_TIMEOUT,
+                    pool=Config.UPSTREAM_POOL_TIMEOUT,
+                ),
+                event_hooks={"request": [self._on_request]},
+            )
+        return self.client
+
+    async def aclose(self):
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+    async def _on_request(self, request: httpx.Request):
+        self.counters["requests"] += 1
+        request.extensions["trace"] = self._trace
+
+    async def _trace(self, event_name: str, info: Dict[str, Any]):
+        if event_name == "connection.connect_tcp.complete":
+            self.counters["connections_opened"] += 1
+        elif event_name == "connection.start_tls.complete":
+            self.counters["tls_handshakes"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        stats: Dict[str, Any] = {**self.counters, "started": self.client is not None}
+        # httpx 没有公开连接池状态，这里读取其 httpcore 连接池
+        pool = getattr(getattr(self.client, "_transport", None), "_pool", None)
+        connections = getattr(pool, "connections", None)
+        if connections is not None:
+            stats["pool"] = {
+                "connections": len(connections),
+                "idle": sum(1 for conn in connections if conn.is_idle()),
+                "active": sum(1 for conn in connections if not conn.is_idle() and not conn.is_closed()),
+                "max_connections": Config.UPSTREAM_MAX_CONNECTIONS,
+                "max_keepalive_connections": Config.UPSTREAM_MAX_KEEPALIVE_CONNECTIONS,
+            }
+        return stats
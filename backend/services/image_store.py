@@ -0,0 +1,154 @@
+# backend/services/image_store.py
+import asyncio
+import hashlib
+import io
+import json
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import List, Optional
+from config import Config
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow 未安装时只保存原图，不生成缩略图
+    Image = None
+
+DIGEST_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+# 通过文件头识别图片类型，避免额外保存元数据
+_MAGIC_CONTENT_TYPES = [
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"GIF8", "image/gif"),
+]
+
+
+def sniff_content_type(head: bytes) -> str:
+    for magic, content_type in _MAGIC_CONTENT_TYPES:
+        if head.startswith(magic):
+            return content_type
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    return "application/octet-stream"
+
+
+class ImageStore:
+    """
+    Content-addressed on-disk store for generated images.
+
+    Each image is saved once under its SHA-256 digest (plus resized JPEG variants when Pillow is
+    available) and served by /api/images/{digest}. A small SQLite index maps generation parameters
+    (imagery1, imagery2, size, seed, model) to a digest so that repeated generations can be skipped.
+    """
+
+    def __init__(self, directory: str, public_base_url: str, variant_widths: List[int], enabled: bool = True):
+        self.directory = directory
+        self.public_base_url = public_base_url.rstrip("/")
+        self.variant_widths = sorted(set(variant_widths))
+        self.enabled = enabled
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(imagery1: str, imagery2: str, size: str, seed: Optional[int], model: str) -> str:
+        return json.dumps([imagery1, imagery2, size, seed, model], ensure_ascii=False)
+
+    def url_for(self, digest: str) -> str:
+        return f"{self.public_base_url}/api/images/{digest}"
+
+    def path_for(self, digest: str, width: Optional[int] = None) -> str:
+        """Path of the original image, or of its resized variant when width is given."""
+        name = digest if width is None else f"{digest}_w{width}.jpg"
+        return os.path.join(self.directory, digest[:2], digest[2:4], name)
+
+    async def lookup(self, key: str) -> Optional[str]:
+        """Returns the digest stored for these generation parameters, if its file still exists."""
+        digest = await asyncio.to_thread(self._index_get, key)
+        if digest and os.path.exists(self.path_for(digest)):
+            return digest
+        return None
+
+    async def save(self, data: bytes, key: Optional[str] = None) -> str:
+        """
+        Saves image bytes (idempotently) and their variants, optionally indexing them under key.
+
+        Returns:
+            str: The SHA-256 hex digest identifying the image.
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        await asyncio.to_thread(self._write, digest, data)
+        if key is not None:
+            await asyncio.to_thread(self._index_put, key, digest)
+        return digest
+
+    def _write(self, digest: str, data: bytes):
+        path = self.path_for(digest)
+        if not os.path.exists(path):
+            _atomic_write(path, data)
+        if Image is None:
+            return
+        for width in self.variant_widths:
+            variant_path = self.path_for(digest, width)
+            if os.path.exists(variant_path):
+                continue
+            try:
+                with Image.open(io.BytesIO(data)) as image:
+                    image = image.convert("RGB")
+                    image.thumbnail((width, width))
+                    buffer = io.BytesIO()
+                    image.save(buffer, format="JPEG", quality=85, optimize=True, progressive=True)
+                _atomic_write(variant_path, buffer.getvalue())
+            except Exception as e:
+                print(f"Failed to create {width}px variant for image {digest}: {e}")
+
+    # 以下方法在线程池中执行，通过 self._lock 串行访问 SQLite 连接
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(self.directory, exist_ok=True)
+            self._conn = sqlite3.connect(os.path.join(self.directory, "index.sqlite3"), check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS image_index (key TEXT PRIMARY KEY, digest TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            self._conn.commit()
+        return self._conn
+
+    def _index_get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._connection().execute("SELECT digest FROM image_index WHERE key = ?", (key,)).fetchone()
+            return row[0] if row else None
+
+    def _index_put(self, key: str, digest: str):
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO image_index (key, digest, created_at) VALUES (?, ?, ?)",
+                (key, digest, time.time()),
+            )
+            conn.commit()
+
+
+def _atomic_write(path: str, data: bytes):
+    # 先写临时文件再 rename，保证并发读取时不会看到写了一半的文件
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+image_store = ImageStore(
+    directory=Config.IMAGE_STORE_DIR,
+    public_base_url=Config.PUBLIC_BASE_URL,
+    variant_widths=Config.IMAGE_STORE_VARIANT_WIDTHS,
+    enabled=Config.IMAGE_STORE_ENABLED,
+)
@@ -0,0 +1,290 @@
+# backend/services/jobs.py
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, Set, Tuple
+from services.upstream import upstream_priority
+
+# 单个名字的处理函数：输入名字，返回结果 JSON；失败时抛出异常
+JobWorker = Callable[[str], Awaitable[str]]
+
+
+class JobStore:
+    """
+    SQLite-backed state of batch jobs and their per-name items.
+    All methods are blocking and are meant to be run through asyncio.to_thread.
+
+    A running item is leased to the process that claimed it for `lease` seconds; the process renews
+    the lease while it works on the item. Only items whose lease has expired (their process died)
+    are handed out again, so worker processes that start later never take over live work.
+    """
+
+    def __init__(self, path: str, lease: float = 60.0, clock: Callable[[], float] = time.time):
+        self.path = path
+        self.lease = lease
+        # 租约与时间戳使用的时钟，测试中可替换
+        self.clock = clock
+        # 进程标识，用于条目租约的归属
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    total INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS job_items (
+                    job_id TEXT NOT NULL,
+                    idx INTEGER NOT NULL,
+                    name TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    result TEXT,
+                    error TEXT,
+                    claimed_by TEXT,
+                    lease_until REAL,
+                    PRIMARY KEY (job_id, idx)
+                );
+                CREATE INDEX IF NOT EXISTS idx_job_items_status ON job_items (status);
+                """
+            )
+            # 旧版本创建的表没有租约列
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(job_items)")}
+            for column, type_ in (("claimed_by", "TEXT"), ("lease_until", "REAL")):
+                if column not in columns:
+                    self._conn.execute(f"ALTER TABLE job_items ADD COLUMN {column} {type_}")
+            self._conn.commit()
+        return self._conn
+
+    def create(self, names: List[str]) -> str:
+        job_id = uuid.uuid4().hex
+        now = self.clock()
+        with self._lock:
+            conn = self._connection()
+            conn.execute("INSERT INTO jobs (id, total, created_at, updated_at) VALUES (?, ?, ?, ?)",
+                         (job_id, len(names), now, now))
+            conn.executemany("INSERT INTO job_items (job_id, idx, name, status) VALUES (?, ?, ?, 'pending')",
+                             [(job_id, idx, name) for idx, name in enumerate(names)])
+            conn.commit()
+        return job_id
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            conn = self._connection()
+            job = conn.execute("SELECT total, created_at, updated_at FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if job is None:
+                return None
+            counts = dict(conn.execute(
+                "SELECT status, COUNT(*) FROM job_items WHERE job_id = ? GROUP BY status", (job_id,)
+            ).fetchall())
+        total, created_at, updated_at = job
+        succeeded, failed = counts.get("succeeded", 0), counts.get("failed", 0)
+        if succeeded + failed == total:
+            status = "completed"
+        elif succeeded + failed + counts.get("running", 0) > 0:
+            status = "running"
+        else:
+            status = "queued"
+        return {
+            "job_id": job_id,
+            "status": status,
+            "total": total,
+            "succeeded": succeeded,
+            "failed": failed,
+            "created_at": created_at,
+            "updated_at": updated_at,
+        }
+
+    def claim_item(self, job_id: str, idx: int) -> Optional[str]:
+        """
+        Leases a pending item (or a running one whose lease has expired) to this process and returns
+        its name, or None if it is not available (e.g. another worker process is processing it).
+        """
+        now = self.clock()
+        with self._lock:
+            conn = self._connection()
+            claimed = conn.execute(
+                "UPDATE job_items SET status = 'running', claimed_by = ?, lease_until = ? "
+                "WHERE job_id = ? AND idx = ? "
+                "AND (status = 'pending' OR (status = 'running' AND COALESCE(lease_until, 0) < ?))",
+                (self.owner, now + self.lease, job_id, idx, now),
+            ).rowcount
+            conn.commit()
+            if not claimed:
+                return None
+            conn.execute("UPDATE jobs SET updated_at = ? WHERE id = ?", (self.clock(), job_id))
+            conn.commit()
+            row = conn.execute("SELECT name FROM job_items WHERE job_id = ? AND idx = ?", (job_id, idx)).fetchone()
+        return row[0] if row else None
+
+    def renew_item(self, job_id: str, idx: int) -> bool:
+        """Extends this process's lease on a running item; False if the lease was lost."""
+        with self._lock:
+            conn = self._connection()
+            renewed = conn.execute(
+                "UPDATE job_items SET lease_until = ? WHERE job_id = ? AND idx = ? AND status = 'running' AND claimed_by = ?",
+                (self.clock() + self.lease, job_id, idx, self.owner),
+            ).rowcount
+            conn.commit()
+        return bool(renewed)
+
+    def set_item(self, job_id: str, idx: int, status: str, result: Optional[str] = None, error: Optional[str] = None) -> bool:
+        """Records the outcome of an item this process holds; False (nothing written) if it lost the lease."""
+        with self._lock:
+            conn = self._connection()
+            updated = conn.execute(
+                "UPDATE job_items SET status = ?, result = ?, error = ?, lease_until = NULL "
+                "WHERE job_id = ? AND idx = ? AND status = 'running' AND claimed_by = ?",
+                (status, result, error, job_id, idx, self.owner),
+            ).rowcount
+            if updated:
+                conn.execute("UPDATE jobs SET updated_at = ? WHERE id = ?", (self.clock(), job_id))
+            conn.commit()
+        return bool(updated)
+
+    def unfinished_items(self) -> List[Tuple[str, int]]:
+        """Pending items, and running items whose lease has expired (their process died)."""
+        with self._lock:
+            return self._connection().execute(
+                "SELECT job_id, idx FROM job_items WHERE status = 'pending' "
+                "OR (status = 'running' AND COALESCE(lease_until, 0) < ?) ORDER BY rowid",
+                (self.clock(),),
+            ).fetchall()
+
+    def iter_results(self, job_id: str, page_size: int = 500) -> Iterator[List[Tuple[int, str, str, Optional[str], Optional[str]]]]:
+        """Yields pages of (idx, name, status, result, error) rows in submission order."""
+        last_idx = -1
+        while True:
+            with self._lock:
+                rows = self._connection().execute(
+                    "SELECT idx, name, status, result, error FROM job_items WHERE job_id = ? AND idx > ? ORDER BY idx LIMIT ?",
+                    (job_id, last_idx, page_size),
+                ).fetchall()
+            if not rows:
+                return
+            yield rows
+            last_idx = rows[-1][0]
+
+
+class BatchJobManager:
+    """
+    In-process job queue for batch blind box generation.
+
+    Items are processed by a bounded pool of worker tasks started from the FastAPI lifespan.
+    Workers run with batch upstream priority, so they only use rate-limit capacity that
+    interactive requests leave unused. Unfinished items (pending, or running under an expired
+    lease) are queued on startup and then once per lease period, which also picks up the items
+    of a worker process that died. A worker that loses an item's lease cancels its work and
+    drops the result, leaving the item to the process that took it over.
+    """
+
+    def __init__(self, store: JobStore, worker: JobWorker, concurrency: int):
+        self.store = store
+        self.worker = worker
+        self.concurrency = max(1, concurrency)
+        self._queue: "asyncio.Queue[Tuple[str, int]]" = asyncio.Queue()
+        # 本进程已入队或正在处理的条目，避免重复入队
+        self._queued: Set[Tuple[str, int]] = set()
+        self._tasks: List[asyncio.Task] = []
+
+    async def start(self):
+        await self._requeue_unfinished()
+        self._tasks = [asyncio.create_task(self._run()) for _ in range(self.concurrency)]
+        self._tasks.append(asyncio.create_task(self._recover()))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def submit(self, names: List[str]) -> str:
+        job_id = await asyncio.to_thread(self.store.create, names)
+        for idx in range(len(names)):
+            self._enqueue((job_id, idx))
+        return job_id
+
+    async def status(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(self.store.get, job_id)
+
+    def stats(self) -> Dict[str, int]:
+        return {"queued_items": self._queue.qsize(), "workers": self.concurrency if self._tasks else 0}
+
+    def _enqueue(self, item: Tuple[str, int]):
+        if item not in self._queued:
+            self._queued.add(item)
+            self._queue.put_nowait(item)
+
+    async def _requeue_unfinished(self):
+        for item in await asyncio.to_thread(self.store.unfinished_items):
+            self._enqueue(item)
+
+    async def _recover(self):
+        # 定期接手租约已过期的条目（其所属进程已退出），以及其他进程未来得及处理的条目
+        while True:
+            await asyncio.sleep(self.store.lease)
+            try:
+                await self._requeue_unfinished()
+            except Exception as e:
+                print(f"Batch job recovery error: {e}")
+
+    async def _run(self):
+        # 每个 worker 任务有自己的 context，这里的设置只影响该 worker 及其派生的任务
+        upstream_priority.set("batch")
+        while True:
+            job_id, idx = await self._queue.get()
+            try:
+                await self._process(job_id, idx)
+            except Exception as e:
+                print(f"Batch job worker error on {job_id}[{idx}]: {e}")
+            finally:
+                self._queued.discard((job_id, idx))
+                self._queue.task_done()
+
+    async def _process(self, job_id: str, idx: int):
+        # 多 worker 部署时同一条目可能被多个进程入队，这里原子地认领（取得租约），避免重复处理
+        name = await asyncio.to_thread(self.store.claim_item, job_id, idx)
+        if name is None:
+            return
+        work = asyncio.create_task(self.worker(name))
+        renew = asyncio.create_task(self._renew(job_id, idx))
+        try:
+            await asyncio.wait({work, renew}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            renew.cancel()
+            if not work.done():
+                # 续约结束说明租约已丢失（条目已由其他进程接手），或本 worker 正在停止：放弃处理
+                work.cancel()
+                await asyncio.gather(work, return_exceptions=True)
+        if work.cancelled():
+            print(f"Batch job lease on {job_id}[{idx}] was lost, processing cancelled")
+            return
+        try:
+            status, result, error = "succeeded", work.result(), None
+        except Exception as e:
+            status, result, error = "failed", None, str(getattr(e, "detail", e))
+        if not await asyncio.to_thread(self.store.set_item, job_id, idx, status, result, error):
+            print(f"Batch job lease on {job_id}[{idx}] was lost, result discarded")
+
+    async def _renew(self, job_id: str, idx: int):
+        while True:
+            await asyncio.sleep(self.store.lease / 3)
+            try:
+                if not await asyncio.to_thread(self.store.renew_item, job_id, idx):
+                    return
+            except Exception as e:
+                # 续约失败（如数据库暂时被锁）时继续尝试，租约在 lease 秒内仍然有效
+                print(f"Batch job lease renewal error on {job_id}[{idx}]: {e}")
@@ -0,0 +1,108 @@
+# backend/services/json_stream.py
+import json
+from typing import Any, Dict, List, Optional
+
+
+class IncrementalJSONArrayParser:
+    """
+    Incrementally parses a top-level JSON array of objects from a token stream.
+
+    Text is fed chunk by chunk (e.g. LLM deltas); every object is returned as soon as its closing
+    brace arrives, without waiting for the rest of the array. Anything before the opening '['
+    (such as a Markdown code fence) or after the closing ']' is ignored; inside the array, anything
+    but objects separated by commas is an error. Call finish() once the stream has ended, so that a
+    truncated array is not mistaken for a complete one.
+    """
+
+    def __init__(self):
+        self._depth = 0  # 0: 尚未进入数组；1: 数组内部；>=2: 对象内部
+        self._in_string = False
+        self._escape = False
+        self._closed = False
+        # 数组内部下一个允许的内容："value_or_end"、"value"（逗号之后）或 "comma_or_end"（元素之后）
+        self._expect = "value_or_end"
+        # 当前正在累积的对象文本，只保留未闭合的那一个
+        self._current: Optional[List[str]] = None
+
+    @property
+    def closed(self) -> bool:
+        """Whether the top-level array has been closed."""
+        return self._closed
+
+    def feed(self, chunk: str) -> List[Dict[str, Any]]:
+        """
+        Feeds a chunk of text into the parser.
+
+        Args:
+            chunk (str): The next piece of the streamed text.
+
+        Returns:
+            List[Dict[str, Any]]: Objects completed by this chunk, in order.
+
+        Raises:
+            ValueError: If a completed element is not valid JSON, or the array holds anything but
+                comma-separated objects.
+        """
+        completed: List[Dict[str, Any]] = []
+        for char in chunk:
+            if self._closed:
+                break
+            if self._current is not None:
+                self._current.append(char)
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                continue
+
+            if self._depth == 0:
+                if char == "[":
+                    self._depth = 1
+                continue
+
+            if self._depth == 1:
+                self._array_char(char)
+            elif char == '"':
+                self._in_string = True
+            elif char in "{[":
+                self._depth += 1
+            elif char in "}]":
+                self._depth -= 1
+                if self._depth == 1 and self._current is not None:
+                    text = "".join(self._current)
+                    self._current = None
+                    value = json.loads(text)
+                    if not isinstance(value, dict):
+                        raise ValueError("Expected a JSON object inside the array")
+                    completed.append(value)
+                    self._expect = "comma_or_end"
+        return completed
+
+    def finish(self):
+        """
+        Marks the end of the stream.
+
+        Raises:
+            ValueError: If the stream ended before the array was opened and closed.
+        """
+        if not self._closed:
+            raise ValueError("JSON array is incomplete")
+
+    def _array_char(self, char: str):
+        # 数组内部（对象之间）：只接受空白、逗号、对象的开始与数组的结束
+        if char.isspace():
+            return
+        if char == "{" and self._expect != "comma_or_end":
+            self._current = [char]
+            self._depth = 2
+        elif char == "," and self._expect == "comma_or_end":
+            self._expect = "value"
+        elif char == "]" and self._expect != "value":
+            self._depth = 0
+            self._closed = True
+        else:
+            raise ValueError(f"Unexpected {char!r} in the JSON array, expected a JSON object")
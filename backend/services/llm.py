@@ -1,13 +1,106 @@
+import asyncio
+import json
+import time
 import httpx
-from typing import List, Optional, Dict, Any
+from contextlib import aclosing
+from typing import AsyncIterator, List, Optional, Dict, Any, Tuple
 from config import Config
+from services.singleflight import SingleFlight, make_request_key
+from services.upstream import UpstreamController, UpstreamError, parse_retry_after
+from services.http_client import UpstreamHTTPClient
+from services.shared_state import make_token_bucket, shared_state_store
+from services.hedging import Hedger, LatencyTracker
+from services.degradation import DegradationPolicy, degraded_results
+from services.metrics import debug_payload, debug_sampled, record_usage, track_upstream
 
 class DoubaoLLMService:
     def __init__(self):
         self.api_key = Config.DOUBAO_SEEDREAM_API_KEY
-        self.endpoint = "https://ark.cn-beijing.volces.com/api/v3/chat/completions"
+        self.endpoint = Config.DOUBAO_LLM_ENDPOINT
         self.model_name = "doubao-seed-1-6-flash-250615"
-        self.client = httpx.AsyncClient()
+        # 对冲请求：超过近期延迟分位数仍未返回时再发一个相同请求，先成功者胜出
+        self.hedger = Hedger(
+            enabled=Config.LLM_HEDGING_ENABLED,
+            percentile=Config.LLM_HEDGE_PERCENTILE,
+            min_delay=Config.LLM_HEDGE_MIN_DELAY,
+            budget_ratio=Config.LLM_HEDGE_BUDGET_RATIO,
+        )
+        # 流式调用的首 token 延迟（TTFT）与总耗时，用于区分用户感知延迟与上游完成时间
+        self.stream_ttft = LatencyTracker()
+        self.stream_duration = LatencyTracker()
+        self.stream_counters: Dict[str, int] = {"calls": 0, "completed": 0, "failed": 0}
+        # 连接池由 FastAPI lifespan 通过 start()/aclose() 管理
+        self.http = UpstreamHTTPClient("Doubao LLM", read_timeout=Config.LLM_READ_TIMEOUT)
+        self.client: Optional[httpx.AsyncClient] = None
+        # 合并并发的相同请求（相同 prompt 与参数），共享同一个上游调用
+        self.singleflight = SingleFlight(enabled=Config.SINGLEFLIGHT_ENABLED, shared=shared_state_store)
+        # 限流、重试与熔断
+        self.controller = UpstreamController(
+            name="Doubao LLM",
+            rate=Config.LLM_RATE_LIMIT_RPS,
+            burst=Config.LLM_RATE_LIMIT_BURST,
+            min_rate=Config.LLM_RATE_LIMIT_MIN_RPS,
+            max_retries=Config.UPSTREAM_MAX_RETRIES,
+            retry_base_delay=Config.UPSTREAM_RETRY_BASE_DELAY,
+            retry_max_delay=Config.UPSTREAM_RETRY_MAX_DELAY,
+            failure_threshold=Config.CIRCUIT_FAILURE_THRESHOLD,
+            reset_timeout=Config.CIRCUIT_RESET_TIMEOUT,
+            batch_reserve_ratio=Config.BATCH_UPSTREAM_RESERVE_RATIO,
+            bucket=make_token_bucket(
+                "llm", Config.LLM_RATE_LIMIT_RPS, Config.LLM_RATE_LIMIT_BURST, Config.LLM_RATE_LIMIT_MIN_RPS
+            ),
+        )
+        # 降级策略：根据熔断状态、近期错误率与延迟判断是否进入降级模式
+        self.degradation = DegradationPolicy(
+            "llm",
+            self.controller,
+            enabled=Config.DEGRADATION_ENABLED,
+            max_error_rate=Config.DEGRADATION_MAX_ERROR_RATE,
+            max_p95=Config.DEGRADATION_LLM_MAX_P95_SECONDS,
+            window=Config.DEGRADATION_WINDOW_SECONDS,
+            min_samples=Config.DEGRADATION_MIN_SAMPLES,
+            hold=Config.DEGRADATION_HOLD_SECONDS,
+        )
+        # 后备模型有独立的限流与熔断：主模型熔断时仍可调用，其结果也不影响主模型的健康统计
+        self.fallback_controller = UpstreamController(
+            name="Doubao LLM (fallback model)",
+            rate=Config.LLM_RATE_LIMIT_RPS,
+            burst=Config.LLM_RATE_LIMIT_BURST,
+            min_rate=Config.LLM_RATE_LIMIT_MIN_RPS,
+            max_retries=Config.UPSTREAM_MAX_RETRIES,
+            retry_base_delay=Config.UPSTREAM_RETRY_BASE_DELAY,
+            retry_max_delay=Config.UPSTREAM_RETRY_MAX_DELAY,
+            failure_threshold=Config.CIRCUIT_FAILURE_THRESHOLD,
+            reset_timeout=Config.CIRCUIT_RESET_TIMEOUT,
+            batch_reserve_ratio=Config.BATCH_UPSTREAM_RESERVE_RATIO,
+            bucket=make_token_bucket(
+                "llm_fallback", Config.LLM_RATE_LIMIT_RPS, Config.LLM_RATE_LIMIT_BURST, Config.LLM_RATE_LIMIT_MIN_RPS
+            ),
+        )
+
+    @property
+    def active_model(self) -> str:
+        """The model for new calls: LLM_FALLBACK_MODEL while the LLM is degraded (if configured)."""
+        if Config.LLM_FALLBACK_MODEL and self.degradation.degraded:
+            return Config.LLM_FALLBACK_MODEL
+        return self.model_name
+
+    def _route(self) -> Tuple[str, UpstreamController]:
+        """The model and upstream controller for a new call."""
+        model = self.active_model
+        if model == self.model_name:
+            return model, self.controller
+        degraded_results.inc(mode="fallback_model")
+        return model, self.fallback_controller
+
+    async def start(self):
+        """创建 HTTP 连接池，在应用启动时调用。"""
+        self.client = await self.http.start()
+
+    async def aclose(self):
+        """关闭 HTTP 连接池，在应用关闭时调用。"""
+        await self.http.aclose()
+        self.client = None
 
     async def generate_response(
         self,
@@ -27,29 +120,41 @@ class DoubaoLLMService:
             str: 生成的文本回复。
 
         Raises:
-            Exception: 如果API调用失败或返回错误消息。
+            Exception: 如果API调用失败或返回错误消息（可重试的错误会带抖动地指数退避重试）。
+            UpstreamUnavailableError: 如果熔断器处于打开状态。
         """
 
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {self.api_key}"
-        }
-
+        model, controller = self._route()
         payload = {
-            "model": self.model_name,
+            "model": model,
             "messages": messages,
             "temperature": temperature,
             "top_p": top_p,
         }
+        return await self.singleflight.do(
+            make_request_key(payload),
+            lambda: self.hedger.run(lambda: controller.call(lambda: self._complete(payload))),
+        )
+
+    async def _complete(self, payload: Dict[str, Any]) -> str:
+        headers = {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {self.api_key}"
+        }
 
-        print(f"Calling Doubao LLM with payload: {payload}") # For debugging
+        debug = debug_sampled()
+        if debug:
+            debug_payload("Calling Doubao LLM with payload", payload)
 
         try:
-            response = await self.client.post(self.endpoint, headers=headers, json=payload, timeout=60)
-            response.raise_for_status()
+            with track_upstream("llm", "chat"):
+                response = await self.client.post(self.endpoint, headers=headers, json=payload)
+                response.raise_for_status()
 
             response_data = response.json()
-            print(f"Doubao LLM response: {response_data}") # For debugging
+            if debug:
+                debug_payload("Doubao LLM response", response_data)
+            record_usage("llm", response_data.get("usage"))
 
             if response_data.get("error"):
                 error_message = response_data["error"]
@@ -66,13 +171,169 @@ class DoubaoLLMService:
             status_code = e.response.status_code
             error_details = e.response.text
             print(f"Doubao LLM HTTP error {status_code}: {error_details}")
-            raise Exception(f"Doubao LLM API request failed: {status_code} - {error_details}")
+            raise UpstreamError(
+                f"Doubao LLM API request failed: {status_code} - {error_details}",
+                status_code=status_code,
+                retry_after=parse_retry_after(e.response.headers.get("retry-after")),
+            )
         except httpx.RequestError as e:
             print(f"Doubao LLM request error: {e}")
-            raise Exception(f"Network or request error, unable to connect to Doubao LLM service: {e}")
+            raise UpstreamError(f"Network or request error, unable to connect to Doubao LLM service: {e}")
         except Exception as e:
             print(f"An unexpected error occurred during Doubao LLM call: {e}")
             raise Exception(f"LLM service internal error: {e}")
 
+    async def stream_response(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float = 0.7,
+        top_p: float = 0.9,
+    ) -> AsyncIterator[str]:
+        """
+        以流式方式调用豆包LLM API，逐段产出生成的文本增量。
+
+        Args:
+            messages (List[Dict[str, str]]): 对话消息列表，包含 "role" 和 "content"。
+            temperature (float): 控制生成文本的随机性，值越高越随机。
+            top_p (float): 控制生成文本的多样性，值越高越多样。
+
+        Yields:
+            str: 每个 chunk 中 choices[0].delta.content 的文本增量（空增量会被跳过）。
+            调用方提前停止读取时应调用 aclose()（如使用 contextlib.aclosing），以便及时释放连接并记录结果；
+            已收到内容后被关闭视为调用成功。
+
+        Raises:
+            Exception: 如果API调用失败或返回错误消息（首个增量之前的可重试错误会带抖动地指数退避重试）。
+            UpstreamUnavailableError: 如果熔断器处于打开状态。
+        """
+
+        model, controller = self._route()
+        payload = {
+            "model": model,
+            "messages": messages,
+            "temperature": temperature,
+            "top_p": top_p,
+            "stream": True,
+            "stream_options": {"include_usage": True},
+        }
+
+        self.stream_counters["calls"] += 1
+        attempt = 0
+        while True:
+            await controller.acquire()
+            start = time.monotonic()
+            first_token_at = None
+            try:
+                async with aclosing(self._stream(payload)) as deltas:
+                    async for delta in deltas:
+                        if first_token_at is None:
+                            first_token_at = time.monotonic()
+                            self.stream_ttft.record(first_token_at - start)
+                        yield delta
+            except GeneratorExit:
+                # 调用方已得到所需内容（如 JSON 数组已闭合）或客户端断开：上游本身是正常响应的
+                if first_token_at is not None:
+                    self._stream_succeeded(controller, start)
+                else:
+                    controller.breaker.release()
+                raise
+            except BaseException as e:
+                controller.record_failure(e, time.monotonic() - start)
+                # 429、5xx 与连接错误都发生在首个增量之前，此时重试是安全的；
+                # 已经产出内容后重试会让调用方收到重复的文本，只能失败
+                delay = controller.retry_delay(e, attempt + 1) if first_token_at is None else None
+                if delay is None:
+                    if isinstance(e, Exception):
+                        self.stream_counters["failed"] += 1
+                    raise
+                attempt += 1
+                controller.counters["retries"] += 1
+                await asyncio.sleep(delay)
+                continue
+            self._stream_succeeded(controller, start)
+            return
+
+    def _stream_succeeded(self, controller: UpstreamController, start: float):
+        duration = time.monotonic() - start
+        controller.record_success(duration)
+        self.stream_counters["completed"] += 1
+        self.stream_duration.record(duration)
+
+    async def _stream(self, payload: Dict[str, Any]) -> AsyncIterator[str]:
+        headers = {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {self.api_key}"
+        }
+
+        debug = debug_sampled()
+        if debug:
+            debug_payload("Calling Doubao LLM (stream) with payload", payload)
+
+        try:
+            with track_upstream("llm", "chat_stream"):
+                async with self.client.stream("POST", self.endpoint, headers=headers, json=payload) as response:
+                    if response.is_error:
+                        await response.aread()
+                    response.raise_for_status()
+
+                    # 响应为 SSE 格式：每行 "data: {...}"，以 "data: [DONE]" 结束
+                    async for line in response.aiter_lines():
+                        if not line.startswith("data:"):
+                            continue
+                        data = line[len("data:"):].strip()
+                        if data == "[DONE]":
+                            break
+
+                        chunk = json.loads(data)
+                        if debug:
+                            debug_payload("Doubao LLM stream chunk", chunk)
+                        if chunk.get("error"):
+                            error_message = chunk["error"]
+                            print(f"Doubao LLM API returned error: {error_message}")
+                            raise Exception(f"Doubao LLM API error: {error_message}")
+                        # 开启 include_usage 时，最后一个 chunk 携带 token 用量
+                        record_usage("llm", chunk.get("usage"))
+
+                        choices = chunk.get("choices") or []
+                        if choices:
+                            delta = choices[0].get("delta", {}).get("content")
+                            if delta:
+                                yield delta
+
+        except httpx.HTTPStatusError as e:
+            status_code = e.response.status_code
+            error_details = e.response.text
+            print(f"Doubao LLM HTTP error {status_code}: {error_details}")
+            raise UpstreamError(
+                f"Doubao LLM API request failed: {status_code} - {error_details}",
+                status_code=status_code,
+                retry_after=parse_retry_after(e.response.headers.get("retry-after")),
+            )
+        except httpx.RequestError as e:
+            print(f"Doubao LLM request error: {e}")
+            raise UpstreamError(f"Network or request error, unable to connect to Doubao LLM service: {e}")
+        except Exception as e:
+            print(f"An unexpected error occurred during Doubao LLM stream: {e}")
+            raise Exception(f"LLM service internal error: {e}")
+
+    async def stats(self) -> Dict[str, Any]:
+        """供监控使用的服务内部状态。"""
+        return {
+            "singleflight": self.singleflight.stats(),
+            "upstream": await self.controller.state(),
+            "degradation": {
+                **self.degradation.state(),
+                "active_model": self.active_model,
+                "fallback_upstream": await self.fallback_controller.state(),
+            },
+            "hedging": self.hedger.state(),
+            "streaming": {
+                **self.stream_counters,
+                "ttft": self.stream_ttft.summary(),
+                "duration": self.stream_duration.summary(),
+            },
+            "http": self.http.stats(),
+        }
+
 # 实例化服务
 doubao_llm_service = DoubaoLLMService()
\ No newline at end of file
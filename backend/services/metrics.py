@@ -0,0 +1,234 @@
+# backend/services/metrics.py
+import abc
+import json
+import random
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+import httpx
+from config import Config
+
+LabelValues = Tuple[str, ...]
+
+# 覆盖快速的 LLM 调用到最长 2 分钟的图片生成
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric(abc.ABC):
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}", *self._samples()]
+
+    @abc.abstractmethod
+    def _samples(self) -> List[str]:
+        """Sample lines of the metric in the Prometheus text format."""
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+                for key, value in self._values.items()]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels: str):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels: str):
+        self._values[self._key(labels)] = value
+
+    def _samples(self) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+                for key, value in self._values.items()]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # key -> ([每个桶的计数（非累计）..., +Inf 桶], 总和)
+        self._values: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: str):
+        key = self._key(labels)
+        if key not in self._values:
+            self._values[key] = ([0] * (len(self.buckets) + 1), [0.0])
+        counts, total = self._values[key]
+        counts[bisect_left(self.buckets, value)] += 1
+        total[0] += value
+
+    def _samples(self) -> List[str]:
+        lines = []
+        for key, (counts, total) in self._values.items():
+            cumulative = 0
+            for bound, count in zip((*self.buckets, float("inf")), counts):
+                cumulative += count
+                labels = _format_labels((*self.labelnames, "le"), (*key, _format_value(bound)))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total[0])}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    """Process-local metrics, rendered in the Prometheus text exposition format."""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> Any:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(line for metric in self._metrics.values() for line in metric.render()) + "\n"
+
+
+registry = Registry()
+
+upstream_request_duration = registry.register(Histogram(
+    "upstream_request_duration_seconds",
+    "Duration of upstream HTTP calls (each retry or hedge is one call).",
+    ("upstream", "operation", "outcome"),
+))
+upstream_in_flight = registry.register(Gauge(
+    "upstream_requests_in_flight", "Upstream HTTP calls currently in progress.", ("upstream", "operation"),
+))
+upstream_errors = registry.register(Counter(
+    "upstream_errors_total", "Failed upstream HTTP calls by error class.", ("upstream", "operation", "error_class"),
+))
+upstream_tokens = registry.register(Counter(
+    "upstream_tokens_total", "LLM tokens reported in upstream usage.", ("upstream", "kind"),
+))
+upstream_images = registry.register(Counter(
+    "upstream_generated_images_total", "Images reported as generated in upstream usage.", ("upstream",),
+))
+http_request_duration = registry.register(Histogram(
+    "http_request_duration_seconds",
+    "Duration of API requests until the last response byte.",
+    ("method", "route", "status"),
+))
+http_in_flight = registry.register(Gauge(
+    "http_requests_in_flight", "API requests currently in progress.", ("method", "route"),
+))
+
+
+def classify_error(error: BaseException) -> str:
+    """Maps an httpx failure of an upstream call to a low-cardinality error class."""
+    if isinstance(error, httpx.TimeoutException):
+        return "timeout"
+    if isinstance(error, httpx.HTTPStatusError):
+        status_code = error.response.status_code
+        if status_code == 429:
+            return "rate_limited"
+        if "SensitiveContent" in error.response.text:
+            return "sensitive_content"
+        return "server_error" if status_code >= 500 else "client_error"
+    if isinstance(error, httpx.RequestError):
+        return "network"
+    return "other"
+
+
+@contextmanager
+def track_upstream(upstream: str, operation: str) -> Iterator[None]:
+    """
+    Times one upstream HTTP call and counts it as in flight. Wrap the httpx call itself (including
+    raise_for_status) so that failures are classified from the original httpx exception.
+    """
+    upstream_in_flight.inc(upstream=upstream, operation=operation)
+    start = time.monotonic()
+    outcome = "success"
+    try:
+        yield
+    except BaseException as e:
+        if isinstance(e, Exception):
+            outcome = "error"
+            upstream_errors.inc(upstream=upstream, operation=operation, error_class=classify_error(e))
+        else:
+            outcome = "cancelled"
+        raise
+    finally:
+        upstream_in_flight.dec(upstream=upstream, operation=operation)
+        upstream_request_duration.observe(time.monotonic() - start, upstream=upstream, operation=operation, outcome=outcome)
+
+
+def record_usage(upstream: str, usage: Optional[Dict[str, Any]]):
+    """Counts token or image usage from an upstream response's "usage" object, if present."""
+    if not usage:
+        return
+    for kind in ("prompt_tokens", "completion_tokens"):
+        if usage.get(kind):
+            upstream_tokens.inc(usage[kind], upstream=upstream, kind=kind.replace("_tokens", ""))
+    if usage.get("generated_images"):
+        upstream_images.inc(usage["generated_images"], upstream=upstream)
+
+
+def _redact(value: Any) -> Any:
+    # 截断长字符串（主要是 b64_json 图片数据），避免日志中出现整张图片
+    if isinstance(value, str) and len(value) > 512:
+        return f"{value[:64]}...<{len(value)} chars>"
+    if isinstance(value, dict):
+        return {k: _redact(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_redact(v) for v in value]
+    return value
+
+
+def debug_sampled() -> bool:
+    """Whether to log the raw payload and response of this upstream call (UPSTREAM_DEBUG_SAMPLE_RATE)."""
+    rate = Config.UPSTREAM_DEBUG_SAMPLE_RATE
+    return rate > 0 and random.random() < rate
+
+
+def debug_payload(message: str, data: Any):
+    """Prints a raw upstream payload or response with long strings truncated."""
+    print(f"{message}: {json.dumps(_redact(data), ensure_ascii=False, default=str)}")
@@ -0,0 +1,260 @@
+# backend/services/name_cache.py
+import asyncio
+import os
+import random
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+from config import Config
+from prompts.llm_prompts import INTERPRET_NAME_PROMPT_VERSION
+
+# 每写入这么多次才做一次过期清理并重新统计行数
+_SWEEP_EVERY = 100
+# 内存中积累的访问时间达到这么多个 key 时批量写回
+_ACCESS_FLUSH_SIZE = 1000
+
+
+def normalize_name(name: str) -> str:
+    """
+    Normalizes a name for cache lookups: NFKC (full-width → half-width), surrounding
+    whitespace removed, inner whitespace dropped and Latin letters case-folded.
+    """
+    return "".join(unicodedata.normalize("NFKC", name).split()).casefold()
+
+
+class NameInterpretationCache:
+    """
+    Two-tier cache for validated name interpretations: an in-memory LRU in front of a SQLite store.
+
+    Entries are keyed by prompt version and normalized name, and each key may hold up to `variants`
+    different interpretations. Because interpretation runs at a high temperature on purpose, a key
+    only counts as a hit once all of its variants are filled; a random one is then served.
+    Capacity eviction drops the least recently read keys; read times are kept in memory and written
+    back in batches, so that lookups never write to SQLite.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        ttl_seconds: float,
+        memory_max_entries: int,
+        disk_max_entries: int,
+        variants: int = 1,
+        enabled: bool = True,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.memory_max_entries = memory_max_entries
+        self.disk_max_entries = disk_max_entries
+        self.variants = max(1, variants)
+        self.enabled = enabled
+        # 条目时间戳与过期判断使用的时钟，测试中可替换
+        self.clock = clock
+        # key -> [(created_at, payload)]，payload 为 InterpretNameLLMResponse 的 JSON
+        self._memory: "OrderedDict[str, List[Tuple[float, str]]]" = OrderedDict()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        # SQLite 中的行数，由写入维护，避免每次写入都 COUNT(*) 全表
+        self._rows = 0
+        self._writes = 0
+        # 磁盘命中的 key 的最近访问时间，批量写回 accessed_at，读取路径不写 SQLite
+        self._accessed: Dict[str, float] = {}
+        self.counters: Dict[str, int] = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "stores": 0,
+            "memory_evictions": 0,
+            "disk_evictions": 0,
+            "errors": 0,
+        }
+
+    def make_key(self, name: str) -> str:
+        return f"{INTERPRET_NAME_PROMPT_VERSION}:{normalize_name(name)}"
+
+    async def get(self, name: str) -> Optional[str]:
+        """
+        Looks up a cached interpretation.
+
+        Returns:
+            Optional[str]: A randomly chosen cached payload, or None on a miss.
+        """
+        if not self.enabled:
+            return None
+
+        key = self.make_key(name)
+        now = self.clock()
+
+        entries = self._fresh(self._memory.get(key, []), now)
+        if len(entries) >= self.variants:
+            self._memory.move_to_end(key)
+            self.counters["memory_hits"] += 1
+            return random.choice(entries)[1]
+
+        try:
+            entries = self._fresh(await asyncio.to_thread(self._disk_load, key, now), now)
+        except Exception as e:
+            print(f"Name cache read error: {e}")
+            self.counters["errors"] += 1
+            entries = []
+        if entries:
+            self._remember(key, entries)
+        if len(entries) >= self.variants:
+            self.counters["disk_hits"] += 1
+            return random.choice(entries)[1]
+
+        self.counters["misses"] += 1
+        return None
+
+    async def put(self, name: str, payload: str, replace: bool = False):
+        """
+        Stores a validated interpretation as a new variant of its key.
+
+        Args:
+            name (str): The name as entered by the user.
+            payload (str): The InterpretNameLLMResponse JSON.
+            replace (bool): Drop the key's existing variants first (used to refresh an entry).
+        """
+        if not self.enabled:
+            return
+
+        key = self.make_key(name)
+        now = self.clock()
+        entries = [] if replace else self._fresh(self._memory.get(key, []), now)
+        entries = (entries + [(now, payload)])[-self.variants:]
+        self._remember(key, entries)
+        self.counters["stores"] += 1
+
+        try:
+            await asyncio.to_thread(self._disk_store, key, now, payload, replace)
+        except Exception as e:
+            print(f"Name cache write error: {e}")
+            self.counters["errors"] += 1
+
+    def stats(self) -> Dict[str, int]:
+        lookups = self.counters["memory_hits"] + self.counters["disk_hits"] + self.counters["misses"]
+        hits = self.counters["memory_hits"] + self.counters["disk_hits"]
+        return {
+            **self.counters,
+            "memory_entries": len(self._memory),
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+        }
+
+    def _fresh(self, entries: List[Tuple[float, str]], now: float) -> List[Tuple[float, str]]:
+        return [entry for entry in entries if now - entry[0] < self.ttl_seconds]
+
+    def _remember(self, key: str, entries: List[Tuple[float, str]]):
+        self._memory[key] = entries
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_max_entries:
+            self._memory.popitem(last=False)
+            self.counters["memory_evictions"] += 1
+
+    # 以下方法在线程池中执行，通过 self._lock 串行访问 SQLite 连接
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS name_interpretations (
+                    key TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+                """
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_name_interpretations_key ON name_interpretations (key)")
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_name_interpretations_accessed ON name_interpretations (accessed_at)"
+            )
+            self._conn.commit()
+            (self._rows,) = self._conn.execute("SELECT COUNT(*) FROM name_interpretations").fetchone()
+        return self._conn
+
+    def _disk_load(self, key: str, now: float) -> List[Tuple[float, str]]:
+        with self._lock:
+            conn = self._connection()
+            rows = conn.execute(
+                "SELECT created_at, payload FROM name_interpretations WHERE key = ? AND created_at > ? ORDER BY created_at",
+                (key, now - self.ttl_seconds),
+            ).fetchall()
+            if rows:
+                self._accessed[key] = now
+                if len(self._accessed) >= _ACCESS_FLUSH_SIZE:
+                    self._flush_accessed(conn)
+                    conn.commit()
+            return [(created_at, payload) for created_at, payload in rows]
+
+    def _disk_store(self, key: str, now: float, payload: str, replace: bool):
+        with self._lock:
+            conn = self._connection()
+            if replace:
+                self._rows -= conn.execute("DELETE FROM name_interpretations WHERE key = ?", (key,)).rowcount
+            conn.execute(
+                "INSERT INTO name_interpretations (key, payload, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, payload, now, now),
+            )
+            self._rows += 1
+            # 每个 key 只保留最新的 variants 条
+            self._rows -= conn.execute(
+                """
+                DELETE FROM name_interpretations WHERE key = ? AND rowid NOT IN (
+                    SELECT rowid FROM name_interpretations WHERE key = ? ORDER BY created_at DESC LIMIT ?
+                )
+                """,
+                (key, key, self.variants),
+            ).rowcount
+            # 过期清理只是回收空间（读取时已过滤过期条目），定期执行；
+            # 同时重新统计行数，纠正其他进程写入同一文件造成的偏差
+            expired = 0
+            self._writes += 1
+            if self._writes % _SWEEP_EVERY == 0:
+                self._flush_accessed(conn)
+                expired = conn.execute(
+                    "DELETE FROM name_interpretations WHERE created_at <= ?", (now - self.ttl_seconds,)
+                ).rowcount
+                (self._rows,) = conn.execute("SELECT COUNT(*) FROM name_interpretations").fetchone()
+            # 按最近访问时间的容量淘汰
+            overflow = max(0, self._rows - self.disk_max_entries)
+            if overflow:
+                # 淘汰按访问时间排序，先写回内存中的访问时间
+                self._flush_accessed(conn)
+                overflow = conn.execute(
+                    """
+                    DELETE FROM name_interpretations WHERE rowid IN (
+                        SELECT rowid FROM name_interpretations ORDER BY accessed_at LIMIT ?
+                    )
+                    """,
+                    (overflow,),
+                ).rowcount
+                self._rows -= overflow
+            conn.commit()
+            self.counters["disk_evictions"] += expired + overflow
+
+    def _flush_accessed(self, conn: sqlite3.Connection):
+        if self._accessed:
+            conn.executemany(
+                "UPDATE name_interpretations SET accessed_at = ? WHERE key = ?",
+                [(accessed_at, key) for key, accessed_at in self._accessed.items()],
+            )
+            self._accessed.clear()
+
+
+name_interpretation_cache = NameInterpretationCache(
+    path=Config.NAME_CACHE_PATH,
+    ttl_seconds=Config.NAME_CACHE_TTL_SECONDS,
+    memory_max_entries=Config.NAME_CACHE_MEMORY_MAX_ENTRIES,
+    disk_max_entries=Config.NAME_CACHE_DISK_MAX_ENTRIES,
+    variants=Config.NAME_CACHE_VARIANTS,
+    enabled=Config.NAME_CACHE_ENABLED,
+)
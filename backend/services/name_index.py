@@ -0,0 +1,154 @@
+# backend/services/name_index.py
+import asyncio
+import json
+import os
+import random
+import sys
+from itertools import product
+from typing import Any, Dict, List, Optional, Set, Tuple
+from config import Config
+from prompts.llm_prompts import INTERPRET_NAME_PROMPT_VERSION
+from services.name_cache import normalize_name
+
+try:
+    from pypinyin import Style, lazy_pinyin, pinyin
+except ImportError:  # pypinyin 未安装时只按字查找，不做谐音（拼音）匹配
+    lazy_pinyin = pinyin = Style = None
+
+Pair = Tuple[str, str]
+
+
+def name_syllables(name: str) -> List[Optional[str]]:
+    """Toneless pinyin of each character of a name, read in context (None without pypinyin)."""
+    if lazy_pinyin is None:
+        return [None] * len(name)
+    # 非汉字按字符逐个返回空串，保证结果与输入逐字对齐
+    return [s or None for s in lazy_pinyin(name, errors=lambda chars: [""] * len(chars))]
+
+
+def char_syllables(text: str) -> Set[str]:
+    """Every toneless reading (heteronyms included) of the characters in text."""
+    if pinyin is None:
+        return set()
+    readings = pinyin(text, style=Style.NORMAL, heteronym=True, errors="ignore")
+    return {syllable for options in readings for syllable in options}
+
+
+class HomophoneIndex:
+    """
+    Per-character and per-pinyin table of vetted imagery candidates, used to interpret names
+    without an LLM call.
+
+    The index is built offline by tools/build_name_index.py from validated LLM interpretations and
+    is read-only at runtime. Candidate strings are stored once and referenced by position, so the
+    whole table stays small enough to keep in memory.
+
+    A name is covered when both its first and last characters (looked up by character, or by
+    pinyin for unseen homophones) have candidates that form 3 distinct pairs; imagery1 comes from
+    the first character and imagery2 from the last, as in the prompt's example. A covered name is
+    still sent to the LLM with probability `llm_ratio`, so fresh interpretations keep flowing into
+    the name cache (and from there into the next index build).
+    """
+
+    def __init__(self, path: str, llm_ratio: float, enabled: bool = True):
+        self.path = path
+        self.llm_ratio = llm_ratio
+        self.enabled = enabled
+        self._imagery: List[str] = []
+        self._chars: Dict[str, Tuple[int, ...]] = {}
+        self._pinyin: Dict[str, Tuple[int, ...]] = {}
+        self.counters: Dict[str, int] = {"hits": 0, "misses": 0, "freshness_calls": 0}
+
+    async def load(self):
+        """Loads the index file if it exists; a missing or stale index leaves the fast path off."""
+        if not self.enabled:
+            return
+        try:
+            await asyncio.to_thread(self._read)
+        except Exception as e:
+            print(f"Failed to load name index {self.path}: {e}")
+
+    def lookup(self, name: str, freshness: bool = True) -> Optional[List[Pair]]:
+        """
+        Returns 3 (imagery1, imagery2) pairs for a covered name, or None when the name is not
+        covered or was picked for a freshness LLM call (never when `freshness` is False).
+        """
+        if not self.enabled or not self._chars:
+            return None
+        pairs = self.interpret(name)
+        if pairs is None:
+            self.counters["misses"] += 1
+            return None
+        if freshness and random.random() < self.llm_ratio:
+            self.counters["freshness_calls"] += 1
+            return None
+        self.counters["hits"] += 1
+        return pairs
+
+    def interpret(self, name: str) -> Optional[List[Pair]]:
+        """Deterministic index answer for a name, without counters or the freshness ratio."""
+        chars = normalize_name(name)
+        if len(chars) < 2:
+            return None
+        syllables = name_syllables(chars)
+        first = self._candidates(chars[0], syllables[0])
+        last = self._candidates(chars[-1], syllables[-1])
+        if not first or not last:
+            return None
+
+        # 按候选排名之和排序；先选不重复使用意象的组合，不足 3 组时再放宽
+        ranked = [
+            (first[i], last[j])
+            for i, j in sorted(product(range(len(first)), range(len(last))), key=lambda ij: (ij[0] + ij[1], ij))
+            if first[i] != last[j]
+        ]
+        chosen: List[Pair] = []
+        used: Set[str] = set()
+        for pair in ranked:
+            if len(chosen) < 3 and pair[0] not in used and pair[1] not in used:
+                chosen.append(pair)
+                used.update(pair)
+        for pair in ranked:
+            if len(chosen) < 3 and pair not in chosen:
+                chosen.append(pair)
+        return chosen if len(chosen) == 3 else None
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.counters["hits"] + self.counters["misses"] + self.counters["freshness_calls"]
+        return {
+            **self.counters,
+            "enabled": self.enabled,
+            "loaded": bool(self._chars),
+            "characters": len(self._chars),
+            "syllables": len(self._pinyin),
+            "imagery": len(self._imagery),
+            "llm_ratio": self.llm_ratio,
+            "hit_rate": round(self.counters["hits"] / lookups, 4) if lookups else 0.0,
+        }
+
+    def _candidates(self, char: str, syllable: Optional[str]) -> List[str]:
+        positions = self._chars.get(char)
+        if positions is None and syllable is not None:
+            positions = self._pinyin.get(syllable)
+        return [self._imagery[i] for i in positions or ()]
+
+    def _read(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("prompt_version") != INTERPRET_NAME_PROMPT_VERSION:
+            print(f"Ignoring name index {self.path}: built for prompt {data.get('prompt_version')}, "
+                  f"current is {INTERPRET_NAME_PROMPT_VERSION}")
+            return
+        self._imagery = [sys.intern(text) for text in data["imagery"]]
+        self._chars = {sys.intern(char): tuple(positions) for char, positions in data["chars"].items()}
+        self._pinyin = {sys.intern(syllable): tuple(positions) for syllable, positions in data["pinyin"].items()}
+        print(f"Loaded name index {self.path}: {len(self._chars)} characters, {len(self._imagery)} imagery candidates")
+
+
+name_index = HomophoneIndex(
+    path=Config.NAME_INDEX_PATH,
+    llm_ratio=Config.NAME_INDEX_LLM_RATIO,
+    enabled=Config.NAME_INDEX_ENABLED,
+)
@@ -0,0 +1,226 @@
+# backend/services/prefetch.py
+import asyncio
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+from services.upstream import upstream_priority
+
+Pair = Tuple[str, str]
+
+
+class BlindBoxPool:
+    """
+    Background prefetcher that keeps ready-made images for the most requested imagery pairs.
+
+    Request frequencies of pairs and interpreted names are tracked LFU-style (counts are halved
+    every `decay_interval` so popularity follows recent traffic). While the image upstream is idle,
+    a background task tops up the pool of the `top_pairs` most popular pairs to `depth` images each,
+    generating at batch upstream priority. Popular names are re-interpreted to keep their
+    interpretation warm, and their pairs inherit the name's popularity.
+
+    The pool holds at most `max_images` images; when full, images of the least frequently requested
+    pair are evicted first. Pooled images are served once and expire after `image_ttl` seconds
+    (upstream URLs are temporary). Pairs for which `is_stored` reports an already stored image are
+    not prewarmed, since serving them costs no upstream call anyway.
+    """
+
+    def __init__(
+        self,
+        generate: Callable[[str, str], Awaitable[Optional[str]]],
+        interpret: Callable[[str], Awaitable[List[Pair]]],
+        is_idle: Callable[[], bool],
+        enabled: bool,
+        top_pairs: int,
+        top_names: int,
+        depth: int,
+        max_images: int,
+        min_requests: int,
+        interval: float,
+        image_ttl: float,
+        decay_interval: float,
+        max_tracked: int = 5000,
+        is_stored: Optional[Callable[[str, str], Awaitable[bool]]] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.generate = generate
+        self.interpret = interpret
+        self.is_idle = is_idle
+        self.is_stored = is_stored
+        # 计数衰减与图片过期使用的时钟，测试中可替换
+        self.clock = clock
+        self.enabled = enabled
+        self.top_pairs = top_pairs
+        self.top_names = top_names
+        self.depth = depth
+        self.max_images = max_images
+        self.min_requests = min_requests
+        self.interval = interval
+        self.image_ttl = image_ttl
+        self.decay_interval = decay_interval
+        self.max_tracked = max_tracked
+
+        self._pair_counts: Dict[Pair, float] = {}
+        self._name_counts: Dict[str, float] = {}
+        self._pool: Dict[Pair, Deque[Tuple[float, str]]] = {}
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._last_decay = clock()
+        self._last_name_refresh: Dict[str, float] = {}
+        self.counters: Dict[str, int] = {
+            "hits": 0,
+            "misses": 0,
+            "refills": 0,
+            "refill_failures": 0,
+            "name_refreshes": 0,
+            "evicted": 0,
+            "expired": 0,
+            "skipped_stored": 0,
+        }
+
+    async def start(self):
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def _active(self) -> bool:
+        # 批量任务的请求不代表用户热度，也不应消耗为交互请求预热的图片
+        return self.enabled and upstream_priority.get() != "batch"
+
+    def record_pair(self, imagery1: str, imagery2: str):
+        if self._active():
+            self._bump(self._pair_counts, (imagery1, imagery2), 1)
+
+    def record_name(self, name: str):
+        if self._active():
+            self._bump(self._name_counts, name, 1)
+
+    def take(self, imagery1: str, imagery2: str) -> Optional[str]:
+        """Pops a ready image for the pair, if any, and wakes the refill loop."""
+        if not self._active():
+            return None
+        images = self._pool.get((imagery1, imagery2))
+        now = self.clock()
+        while images:
+            created_at, url = images.popleft()
+            if now - created_at < self.image_ttl:
+                self.counters["hits"] += 1
+                self._wakeup.set()
+                return url
+            self.counters["expired"] += 1
+        self.counters["misses"] += 1
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        hottest = sorted(self._pair_counts.items(), key=lambda kv: kv[1], reverse=True)[:10]
+        return {
+            **self.counters,
+            "enabled": self.enabled,
+            "pooled_images": self._pooled_count(),
+            "tracked_pairs": len(self._pair_counts),
+            "tracked_names": len(self._name_counts),
+            "hottest_pairs": [{"imagery1": p[0], "imagery2": p[1], "score": round(c, 2)} for p, c in hottest],
+        }
+
+    async def _run(self):
+        upstream_priority.set("batch")
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                self._decay()
+                await self._refresh_names()
+                await self._refill()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Blind box prefetch error: {e}")
+
+    async def _refresh_names(self):
+        # 热门名字每个衰减周期最多重新解析一次（命中名字缓存时不会调用 LLM）
+        now = self.clock()
+        for name, count in self._top(self._name_counts, self.top_names):
+            if not self.is_idle():
+                return
+            if now - self._last_name_refresh.get(name, float("-inf")) < self.decay_interval:
+                continue
+            self._last_name_refresh[name] = now
+            self.counters["name_refreshes"] += 1
+            for pair in await self.interpret(name):
+                self._pair_counts[pair] = max(self._pair_counts.get(pair, 0), count)
+
+    async def _refill(self):
+        for pair, count in self._top(self._pair_counts, self.top_pairs):
+            images = self._pool.setdefault(pair, deque())
+            self._drop_expired(images)
+            if len(images) < self.depth and self.is_stored is not None and await self.is_stored(*pair):
+                self.counters["skipped_stored"] += 1
+                continue
+            while len(images) < self.depth:
+                if not self.is_idle():
+                    return
+                if self._pooled_count() >= self.max_images and not self._evict_below(count):
+                    return
+                try:
+                    url = await self.generate(*pair)
+                except Exception as e:
+                    print(f"Failed to prefetch image for {pair}: {e}")
+                    self.counters["refill_failures"] += 1
+                    break
+                if url is None:
+                    break
+                images.append((self.clock(), url))
+                self.counters["refills"] += 1
+
+    def _evict_below(self, count: float) -> bool:
+        """Evicts one image of the least popular pooled pair, if it is less popular than `count`."""
+        candidates = [pair for pair, images in self._pool.items() if images]
+        if not candidates:
+            return False
+        coldest = min(candidates, key=lambda pair: self._pair_counts.get(pair, 0))
+        if self._pair_counts.get(coldest, 0) >= count:
+            return False
+        self._pool[coldest].popleft()
+        self.counters["evicted"] += 1
+        return True
+
+    def _top(self, counts: Dict[Any, float], limit: int) -> List[Tuple[Any, float]]:
+        ranked = sorted(counts.items(), key=lambda kv: kv[1], reverse=True)[:limit]
+        return [(key, count) for key, count in ranked if count >= self.min_requests]
+
+    def _bump(self, counts: Dict[Any, float], key: Any, amount: float):
+        counts[key] = counts.get(key, 0) + amount
+        # 超出跟踪上限时只保留计数最高的 max_tracked 个（LFU）
+        if len(counts) > self.max_tracked * 1.2:
+            kept = sorted(counts.items(), key=lambda kv: kv[1], reverse=True)[:self.max_tracked]
+            counts.clear()
+            counts.update(kept)
+
+    def _decay(self):
+        now = self.clock()
+        if now - self._last_decay < self.decay_interval:
+            return
+        self._last_decay = now
+        for counts in (self._pair_counts, self._name_counts):
+            for key in list(counts):
+                counts[key] /= 2
+                if counts[key] < 0.5:
+                    del counts[key]
+        for pair in [pair for pair, images in self._pool.items() if not images and pair not in self._pair_counts]:
+            del self._pool[pair]
+
+    def _drop_expired(self, images: Deque[Tuple[float, str]]):
+        now = self.clock()
+        while images and now - images[0][0] >= self.image_ttl:
+            images.popleft()
+            self.counters["expired"] += 1
+
+    def _pooled_count(self) -> int:
+        return sum(len(images) for images in self._pool.values())
@@ -0,0 +1,272 @@
+# backend/services/shared_state.py
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Dict, Optional, Tuple
+from config import Config
+from services.upstream import AdaptiveTokenBucket, UpstreamError, UpstreamUnavailableError
+
+
+class SharedStateStore:
+    """
+    SQLite (WAL) store for state shared by the uvicorn worker processes of one host:
+    upstream token buckets and in-flight coalesced calls.
+
+    Each process opens its own connection; read-modify-write updates run in BEGIN IMMEDIATE
+    transactions, so they are atomic across processes. All methods are blocking and are meant to be
+    run through asyncio.to_thread.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        # 进程标识，用于 in-flight 调用的归属
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            # isolation_level=None：事务由下面的 BEGIN IMMEDIATE 显式控制
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=10)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS token_buckets (
+                    name TEXT PRIMARY KEY,
+                    tokens REAL NOT NULL,
+                    rate REAL NOT NULL,
+                    updated REAL NOT NULL,
+                    paused_until REAL NOT NULL DEFAULT 0,
+                    throttles INTEGER NOT NULL DEFAULT 0
+                );
+                CREATE TABLE IF NOT EXISTS inflight_calls (
+                    key TEXT PRIMARY KEY,
+                    call_id TEXT NOT NULL,
+                    owner TEXT NOT NULL,
+                    lease_until REAL NOT NULL,
+                    done INTEGER NOT NULL DEFAULT 0,
+                    result TEXT,
+                    error TEXT,
+                    finished_at REAL
+                );
+                """
+            )
+        return self._conn
+
+    def _transaction(self, fn):
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn(conn)
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+            return result
+
+    # 令牌桶
+
+    def bucket_take(self, name: str, max_rate: float, capacity: float, reserve: float) -> float:
+        """Takes a token if more than `reserve` would remain; returns 0, or the seconds to wait first."""
+
+        def take(conn: sqlite3.Connection) -> float:
+            now = time.time()
+            row = conn.execute(
+                "SELECT tokens, rate, updated, paused_until FROM token_buckets WHERE name = ?", (name,)
+            ).fetchone()
+            tokens, rate, updated, paused_until = row if row else (capacity, max_rate, now, 0.0)
+            if now < paused_until:
+                wait = paused_until - now
+            else:
+                tokens = min(capacity, tokens + max(0.0, now - updated) * rate)
+                updated = now
+                if tokens >= 1 + reserve:
+                    tokens -= 1
+                    wait = 0.0
+                else:
+                    wait = (1 + reserve - tokens) / rate
+            conn.execute(
+                "INSERT OR REPLACE INTO token_buckets (name, tokens, rate, updated, paused_until, throttles) "
+                "VALUES (?, ?, ?, ?, ?, COALESCE((SELECT throttles FROM token_buckets WHERE name = ?), 0))",
+                (name, tokens, rate, updated, paused_until, name),
+            )
+            return wait
+
+        return self._transaction(take)
+
+    def bucket_throttle(self, name: str, min_rate: float, retry_after: Optional[float]):
+        def throttle(conn: sqlite3.Connection):
+            now = time.time()
+            conn.execute(
+                "UPDATE token_buckets SET rate = MAX(?, rate / 2), tokens = MIN(tokens, 0), "
+                "paused_until = MAX(paused_until, ?), throttles = throttles + 1 WHERE name = ?",
+                (min_rate, now + (retry_after or 0), name),
+            )
+
+        self._transaction(throttle)
+
+    def bucket_success(self, name: str, max_rate: float):
+        def success(conn: sqlite3.Connection):
+            conn.execute(
+                "UPDATE token_buckets SET rate = MIN(?, rate + ?) WHERE name = ? AND rate < ?",
+                (max_rate, max_rate * 0.05, name, max_rate),
+            )
+
+        self._transaction(success)
+
+    def bucket_state(self, name: str) -> Optional[Tuple[float, float, float, float, int]]:
+        with self._lock:
+            return self._connection().execute(
+                "SELECT tokens, rate, updated, paused_until, throttles FROM token_buckets WHERE name = ?", (name,)
+            ).fetchone()
+
+    # 跨进程的 in-flight 调用合并
+
+    def call_claim(self, key: str, lease: float) -> Tuple[bool, str]:
+        """
+        Becomes the leader for key unless a live (unexpired, unfinished) call exists.
+        Returns (is_leader, call_id).
+        """
+
+        def claim(conn: sqlite3.Connection) -> Tuple[bool, str]:
+            now = time.time()
+            row = conn.execute("SELECT call_id, lease_until, done FROM inflight_calls WHERE key = ?", (key,)).fetchone()
+            # 已完成的调用不复用：合并只针对并发中的请求，不是结果缓存
+            if row is not None and not row[2] and row[1] > now:
+                return False, row[0]
+            call_id = uuid.uuid4().hex
+            conn.execute(
+                "INSERT OR REPLACE INTO inflight_calls (key, call_id, owner, lease_until, done) VALUES (?, ?, ?, ?, 0)",
+                (key, call_id, self.owner, now + lease),
+            )
+            return True, call_id
+
+        return self._transaction(claim)
+
+    def call_renew(self, key: str, call_id: str, lease: float) -> bool:
+        """Extends the leader's lease; False if the call was taken over (or no longer exists)."""
+        with self._lock:
+            return self._connection().execute(
+                "UPDATE inflight_calls SET lease_until = ? WHERE key = ? AND call_id = ? AND done = 0",
+                (time.time() + lease, key, call_id),
+            ).rowcount > 0
+
+    def call_finish(self, key: str, call_id: str, result: Optional[str], error: Optional[str], keep: float):
+        def finish(conn: sqlite3.Connection):
+            now = time.time()
+            conn.execute(
+                "UPDATE inflight_calls SET done = 1, result = ?, error = ?, finished_at = ? WHERE key = ? AND call_id = ?",
+                (result, error, now, key, call_id),
+            )
+            conn.execute("DELETE FROM inflight_calls WHERE done = 1 AND finished_at < ?", (now - keep,))
+
+        self._transaction(finish)
+
+    def call_abandon(self, key: str, call_id: str):
+        with self._lock:
+            self._connection().execute("DELETE FROM inflight_calls WHERE key = ? AND call_id = ?", (key, call_id))
+
+    def call_poll(self, key: str, call_id: str) -> Optional[Tuple[int, Optional[str], Optional[str], float]]:
+        """Returns (done, result, error, lease_until) of the call, or None if it no longer exists."""
+        with self._lock:
+            return self._connection().execute(
+                "SELECT done, result, error, lease_until FROM inflight_calls WHERE key = ? AND call_id = ?",
+                (key, call_id),
+            ).fetchone()
+
+
+def encode_error(error: BaseException) -> str:
+    """Serializes a leader's exception so that followers in other processes can re-raise it."""
+    return json.dumps({
+        "type": type(error).__name__,
+        "message": str(error),
+        "status_code": getattr(error, "status_code", None),
+        "retry_after": getattr(error, "retry_after", None),
+    })
+
+
+def decode_error(data: str) -> Exception:
+    error = json.loads(data)
+    if error["type"] == "UpstreamUnavailableError":
+        return UpstreamUnavailableError(error["message"], error["retry_after"] or 0.0)
+    if error["type"] == "UpstreamError":
+        return UpstreamError(error["message"], status_code=error["status_code"], retry_after=error["retry_after"])
+    return Exception(error["message"])
+
+
+class SharedTokenBucket:
+    """
+    AdaptiveTokenBucket counterpart whose tokens, AIMD rate and Retry-After pause live in the shared
+    store, so the configured rate is a budget for all worker processes together rather than for each.
+    Local waiters are still served in FIFO order.
+    """
+
+    def __init__(self, store: SharedStateStore, name: str, rate: float, burst: int, min_rate: float):
+        self.store = store
+        self.name = name
+        self.max_rate = rate
+        self.min_rate = min(min_rate, rate)
+        self.capacity = max(1, burst)
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, reserve: float = 0.0):
+        if reserve > 0:
+            # 带预留的（批量）调用不排队，避免挡住本进程的交互请求
+            while True:
+                wait = await asyncio.to_thread(self.store.bucket_take, self.name, self.max_rate, self.capacity, reserve)
+                if wait <= 0:
+                    return
+                await asyncio.sleep(max(0.05, wait))
+
+        async with self._lock:
+            while True:
+                wait = await asyncio.to_thread(self.store.bucket_take, self.name, self.max_rate, self.capacity, 0.0)
+                if wait <= 0:
+                    return
+                await asyncio.sleep(wait)
+
+    def on_throttle(self, retry_after: Optional[float]):
+        self._background(self.store.bucket_throttle, self.name, self.min_rate, retry_after)
+
+    def on_success(self):
+        self._background(self.store.bucket_success, self.name, self.max_rate)
+
+    def _background(self, fn, *args):
+        # 在线程池中异步更新，不阻塞调用方（两者都在同步的回调中被调用）
+        task = asyncio.get_running_loop().create_task(asyncio.to_thread(fn, *args))
+        task.add_done_callback(self._log_error)
+
+    def _log_error(self, task: asyncio.Task):
+        if not task.cancelled() and task.exception() is not None:
+            print(f"Shared token bucket {self.name} update failed: {task.exception()}")
+
+    async def state(self) -> Dict[str, Any]:
+        row = await asyncio.to_thread(self.store.bucket_state, self.name)
+        tokens, rate, updated, paused_until, throttles = row or (self.capacity, self.max_rate, time.time(), 0.0, 0)
+        return {
+            "rate": round(rate, 3),
+            "max_rate": self.max_rate,
+            "tokens": round(min(self.capacity, tokens + max(0.0, time.time() - updated) * rate), 3),
+            "paused_for": round(max(0.0, paused_until - time.time()), 3),
+            "throttles": throttles,
+            "shared": True,
+        }
+
+
+shared_state_store = SharedStateStore(Config.SHARED_STATE_PATH) if Config.SHARED_STATE_ENABLED else None
+
+
+def make_token_bucket(name: str, rate: float, burst: int, min_rate: float):
+    """The upstream token bucket: shared across workers when SHARED_STATE_ENABLED, per-process otherwise."""
+    if shared_state_store is not None:
+        return SharedTokenBucket(shared_state_store, name, rate, burst, min_rate)
+    return AdaptiveTokenBucket(rate, burst, min_rate)
@@ -0,0 +1,150 @@
+# backend/services/singleflight.py
+import asyncio
+import hashlib
+import json
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, TypeVar
+from services.shared_state import SharedStateStore, decode_error, encode_error
+
+T = TypeVar("T")
+
+
+def make_request_key(payload: Dict[str, Any]) -> str:
+    """Stable key for an upstream request payload (same prompt + parameters → same key)."""
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+class _Call:
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent identical upstream calls into a single in-flight task.
+
+    Every caller with the same key awaits the same task through asyncio.shield, so a caller that is
+    cancelled (e.g. its client disconnected) only stops waiting. The upstream task itself is
+    cancelled once its last waiter has gone.
+
+    With a shared store, the per-process task additionally claims the key in the store: if another
+    worker process already runs the same call, the task polls for its (JSON-serializable) result
+    instead of calling the upstream. The leader holds a lease that it renews while running, so a
+    crashed leader is replaced once the lease expires.
+    """
+
+    def __init__(self, enabled: bool = True, shared: Optional[SharedStateStore] = None, lease: float = 30.0):
+        self.enabled = enabled
+        self.shared = shared
+        self.lease = lease
+        self._calls: Dict[str, _Call] = {}
+        self.counters: Dict[str, int] = {
+            "calls": 0,
+            "upstream_calls": 0,
+            "collapsed": 0,
+            "abandoned": 0,
+            "shared_collapsed": 0,
+            "lease_lost": 0,
+        }
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        """
+        Runs fn() unless an identical call is already in flight, in which case its result is shared.
+
+        Args:
+            key (str): Identifies identical calls, see make_request_key.
+            fn (Callable[[], Awaitable[T]]): Starts the upstream call.
+
+        Returns:
+            T: The result of the (possibly shared) call. Exceptions are shared as well.
+        """
+        self.counters["calls"] += 1
+        if not self.enabled:
+            self.counters["upstream_calls"] += 1
+            return await fn()
+
+        call = self._calls.get(key)
+        if call is None:
+            call = _Call(asyncio.create_task(fn() if self.shared is None else self._shared_call(key, fn)))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda _: self._forget(key, call))
+            self.counters["upstream_calls"] += 1
+        else:
+            self.counters["collapsed"] += 1
+
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                # 最后一个等待者也离开了，没有必要继续为上游调用付费
+                self._forget(key, call)
+                call.task.cancel()
+                self.counters["abandoned"] += 1
+
+    async def _shared_call(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        while True:
+            is_leader, call_id = await asyncio.to_thread(self.shared.call_claim, key, self.lease)
+            if is_leader:
+                return await self._lead(key, call_id, fn)
+
+            self.counters["shared_collapsed"] += 1
+            delay = 0.05
+            while True:
+                await asyncio.sleep(delay)
+                delay = min(0.5, delay * 2)
+                row = await asyncio.to_thread(self.shared.call_poll, key, call_id)
+                if row is None or (not row[0] and row[3] < time.time()):
+                    # 领导者放弃了调用或其租约已过期（进程退出），重新争夺
+                    break
+                done, result, error, _ = row
+                if done:
+                    if error is not None:
+                        raise decode_error(error)
+                    return json.loads(result)
+
+    async def _lead(self, key: str, call_id: str, fn: Callable[[], Awaitable[T]]) -> T:
+        renew = asyncio.create_task(self._renew(key, call_id))
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            await self._publish(self.shared.call_abandon, key, call_id)
+            raise
+        except Exception as e:
+            await self._publish(self.shared.call_finish, key, call_id, None, encode_error(e), self.lease)
+            raise
+        finally:
+            renew.cancel()
+        if renew.done() and not renew.cancelled():
+            # 续约任务已结束说明租约被其他进程接手，那边会发布自己的结果；本进程的结果照常返回给本地等待者
+            self.counters["lease_lost"] += 1
+            return result
+        await self._publish(self.shared.call_finish, key, call_id, json.dumps(result), None, self.lease)
+        return result
+
+    async def _renew(self, key: str, call_id: str):
+        while True:
+            await asyncio.sleep(self.lease / 3)
+            try:
+                if not await asyncio.to_thread(self.shared.call_renew, key, call_id, self.lease):
+                    print(f"Singleflight lease for {key[:12]} was taken over by another worker")
+                    return
+            except Exception as e:
+                # 续约失败（如数据库暂时被锁）时继续尝试，租约在 lease 秒内仍然有效
+                print(f"Singleflight lease renewal error for {key[:12]}: {e}")
+
+    async def _publish(self, fn: Callable[..., Any], *args: Any):
+        # 共享存储写入失败不应让已经拿到的结果（或原始异常）丢失；其他进程的等待者会在租约过期后重新调用
+        try:
+            await asyncio.to_thread(fn, *args)
+        except Exception as e:
+            print(f"Singleflight shared state update failed: {e}")
+
+    def stats(self) -> Dict[str, int]:
+        return {**self.counters, "in_flight": len(self._calls)}
+
+    def _forget(self, key: str, call: _Call):
+        if self._calls.get(key) is call:
+            del self._calls[key]
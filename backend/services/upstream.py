@@ -0,0 +1,316 @@
+# backend/services/upstream.py
+import asyncio
+import random
+import time
+from collections import deque
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+
+# 可以安全重试的上游状态码；None 表示网络错误或超时
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# 当前调用的优先级："interactive"（用户请求）或 "batch"（批量任务）。
+# 批量任务只使用令牌桶中预留份额之外的余量，避免挤占交互流量。
+upstream_priority: ContextVar[str] = ContextVar("upstream_priority", default="interactive")
+
+
+class UpstreamError(Exception):
+    """
+    An error returned by an upstream API, classified so that callers can decide whether to retry.
+    """
+
+    def __init__(self, message: str, status_code: Optional[int] = None, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+        self.retryable = status_code is None or status_code in RETRYABLE_STATUS_CODES
+
+
+class UpstreamUnavailableError(Exception):
+    """Raised without calling the upstream while its circuit breaker is open."""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Parses a Retry-After header given in seconds; HTTP dates are ignored."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        return None
+
+
+class AdaptiveTokenBucket:
+    """
+    Token bucket whose refill rate adapts to upstream throttling (AIMD).
+
+    A 429 halves the rate (down to min_rate) and pauses the bucket for its Retry-After; every
+    success adds back 5% of max_rate. Waiters are served in FIFO order.
+    """
+
+    def __init__(self, rate: float, burst: int, min_rate: float):
+        self.max_rate = rate
+        self.min_rate = min(min_rate, rate)
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.paused_until = 0.0
+        self.throttles = 0
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, reserve: float = 0.0):
+        """
+        Waits for a token. With a reserve, the token is only taken while more than `reserve` tokens
+        would remain and nobody else is waiting, so reserved capacity stays available to other callers.
+        """
+        if reserve > 0:
+            while True:
+                now = time.monotonic()
+                if now >= self.paused_until and not self._lock.locked():
+                    self._refill(now)
+                    if self.tokens >= 1 + reserve:
+                        self.tokens -= 1
+                        return
+                await asyncio.sleep(max(0.05, (1 + reserve - self.tokens) / self.rate))
+
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                self._refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def on_throttle(self, retry_after: Optional[float]):
+        self.throttles += 1
+        self.rate = max(self.min_rate, self.rate / 2)
+        self.tokens = min(self.tokens, 0.0)
+        if retry_after:
+            self.paused_until = max(self.paused_until, time.monotonic() + retry_after)
+
+    def on_success(self):
+        self.rate = min(self.max_rate, self.rate + self.max_rate * 0.05)
+
+    async def state(self) -> Dict[str, Any]:
+        return {
+            "rate": round(self.rate, 3),
+            "max_rate": self.max_rate,
+            "tokens": round(self.tokens, 3),
+            "paused_for": round(max(0.0, self.paused_until - time.monotonic()), 3),
+            "throttles": self.throttles,
+        }
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive retryable failures and rejects calls for
+    `reset_timeout` seconds, then lets a single probe through (half-open) to decide whether to close.
+    """
+
+    def __init__(self, failure_threshold: int, reset_timeout: float, clock: Callable[[], float] = time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.status = "closed"
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self._probe_in_flight = False
+        self.clock = clock
+
+    def retry_after(self) -> float:
+        return max(0.0, self.opened_at + self.reset_timeout - self.clock())
+
+    def allow(self) -> bool:
+        if self.status == "open":
+            if self.retry_after() > 0:
+                return False
+            self.status = "half_open"
+        if self.status == "half_open":
+            if self._probe_in_flight:
+                return False
+            self._probe_in_flight = True
+        return True
+
+    def record_success(self):
+        self.status = "closed"
+        self.consecutive_failures = 0
+        self._probe_in_flight = False
+
+    def record_failure(self):
+        self.consecutive_failures += 1
+        if self.status == "half_open" or self.consecutive_failures >= self.failure_threshold:
+            if self.status != "open":
+                self.times_opened += 1
+            self.status = "open"
+            self.opened_at = self.clock()
+        self._probe_in_flight = False
+
+    def release(self):
+        """Frees the half-open probe slot when a call ends without a verdict (e.g. it was cancelled)."""
+        self._probe_in_flight = False
+
+    def state(self) -> Dict[str, Any]:
+        return {
+            "status": self.status,
+            "consecutive_failures": self.consecutive_failures,
+            "retry_after": round(self.retry_after(), 3) if self.status == "open" else 0.0,
+            "times_opened": self.times_opened,
+        }
+
+
+class UpstreamController:
+    """
+    Shared upstream-control layer: adaptive rate limiting, jittered exponential retry of
+    retryable errors and a circuit breaker that fails fast while the upstream is unhealthy.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        rate: float,
+        burst: int,
+        min_rate: float,
+        max_retries: int,
+        retry_base_delay: float,
+        retry_max_delay: float,
+        failure_threshold: int,
+        reset_timeout: float,
+        batch_reserve_ratio: float = 0.0,
+        bucket: Optional[Any] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.name = name
+        self.clock = clock
+        # bucket 可替换为跨进程共享的实现（见 services/shared_state.py），接口与 AdaptiveTokenBucket 相同
+        self.bucket = bucket or AdaptiveTokenBucket(rate, burst, min_rate)
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout, clock)
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+        # 批量任务调用时保留给交互流量的令牌数
+        self.batch_reserve = batch_reserve_ratio * self.bucket.capacity
+        self.counters: Dict[str, int] = {"calls": 0, "retries": 0, "failures": 0, "rejected": 0}
+        # 近期调用的 (结束时间, 是否成功, 耗时)，供降级策略计算错误率与延迟
+        self.recent: Deque[Tuple[float, bool, Optional[float]]] = deque(maxlen=500)
+
+    async def acquire(self):
+        """
+        Admits one upstream call: fails fast while the breaker is open, then waits for a token.
+        Batch-priority calls (see upstream_priority) leave the reserved share of tokens untouched.
+
+        Raises:
+            UpstreamUnavailableError: If the circuit breaker is open.
+        """
+        if not self.breaker.allow():
+            self.counters["rejected"] += 1
+            raise UpstreamUnavailableError(
+                f"{self.name} is temporarily unavailable, please try again later.", self.breaker.retry_after()
+            )
+        # allow() 之后处于半开状态说明本次调用占用了唯一的探测名额
+        probing = self.breaker.status == "half_open"
+        self.counters["calls"] += 1
+        try:
+            await self.bucket.acquire(reserve=self.batch_reserve if upstream_priority.get() == "batch" else 0.0)
+        except BaseException:
+            # 等待令牌时被取消（对冲落败、合并的请求无人等待、客户端断开）：归还探测名额，
+            # 否则熔断器会一直停在半开状态并拒绝之后的所有调用
+            if probing:
+                self.breaker.release()
+            raise
+
+    def record_success(self, duration: Optional[float] = None):
+        self.breaker.record_success()
+        self.bucket.on_success()
+        self.recent.append((self.clock(), True, duration))
+
+    def record_failure(self, error: BaseException, duration: Optional[float] = None):
+        """Feeds the outcome of a failed call into the breaker and the rate limiter."""
+        if isinstance(error, UpstreamError) and error.retryable:
+            self.counters["failures"] += 1
+            self.breaker.record_failure()
+            if error.status_code == 429:
+                self.bucket.on_throttle(error.retry_after)
+            self.recent.append((self.clock(), False, duration))
+        elif isinstance(error, UpstreamError):
+            # 4xx 等不可重试的错误说明上游仍在正常响应
+            self.breaker.record_success()
+            self.recent.append((self.clock(), True, duration))
+        else:
+            self.breaker.release()
+
+    async def call(self, fn: Callable[[], Awaitable[T]]) -> T:
+        """
+        Runs fn() under rate limiting and the circuit breaker, retrying retryable UpstreamErrors.
+
+        Raises:
+            UpstreamUnavailableError: If the breaker is (or becomes) open.
+            Exception: The last error from fn() once retries are exhausted or for non-retryable errors.
+        """
+        attempt = 0
+        while True:
+            await self.acquire()
+            start = self.clock()
+            try:
+                result = await fn()
+            except BaseException as e:
+                self.record_failure(e, self.clock() - start)
+                delay = self.retry_delay(e, attempt + 1)
+                if delay is None:
+                    raise
+                attempt += 1
+                self.counters["retries"] += 1
+                await asyncio.sleep(delay)
+                continue
+            self.record_success(self.clock() - start)
+            return result
+
+    def retry_delay(self, error: BaseException, attempt: int) -> Optional[float]:
+        """
+        Seconds to wait before retry number `attempt` (1-based) after `error`, or None when the call
+        must not be retried: the error is not a retryable UpstreamError, retries are exhausted or the
+        breaker has opened. Honours the upstream's Retry-After.
+        """
+        if not (isinstance(error, UpstreamError) and error.retryable) or attempt > self.max_retries:
+            return None
+        if self.breaker.status == "open":
+            return None
+        return max(error.retry_after or 0.0, self._backoff(attempt))
+
+    def _backoff(self, attempt: int) -> float:
+        # Full jitter：在 [0, min(max_delay, base * 2^attempt)] 内均匀取值
+        return random.uniform(0, min(self.retry_max_delay, self.retry_base_delay * (2 ** attempt)))
+
+    def health(self, window: float) -> Dict[str, Any]:
+        """Call count, error rate and p95 latency of the calls that ended in the last `window` seconds."""
+        since = self.clock() - window
+        samples = [(ok, duration) for ended, ok, duration in self.recent if ended >= since]
+        durations = sorted(duration for _, duration in samples if duration is not None)
+        p95 = durations[min(len(durations) - 1, max(0, round(0.95 * len(durations)) - 1))] if durations else None
+        return {
+            "samples": len(samples),
+            "error_rate": round(sum(not ok for ok, _ in samples) / len(samples), 3) if samples else 0.0,
+            "p95": round(p95, 3) if p95 is not None else None,
+        }
+
+    async def state(self) -> Dict[str, Any]:
+        return {
+            "breaker": self.breaker.state(),
+            # 共享令牌桶的状态需要读取 SQLite，因此是异步的
+            "rate_limiter": await self.bucket.state(),
+            **self.counters,
+        }
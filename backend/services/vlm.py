@@ -1,7 +1,19 @@
 # backend/services/vlm.py
+import asyncio
+import contextlib
 import httpx
 from typing import List, Optional, Dict, Any
+from pydantic import HttpUrl, TypeAdapter
 from config import Config
+from services.singleflight import SingleFlight, make_request_key
+from services.upstream import UpstreamController, UpstreamError, parse_retry_after, upstream_priority
+from services.http_client import UpstreamHTTPClient
+from services.shared_state import make_token_bucket, shared_state_store
+from services.degradation import DegradationPolicy
+from services.metrics import debug_payload, debug_sampled, record_usage, track_upstream
+
+# Image URLs are validated once, here at the upstream boundary; the routes pass them on as trusted strings
+_IMAGE_URLS = TypeAdapter(List[HttpUrl])
 
 class DoubaoSeedreamService:
     def __init__(self):
@@ -9,7 +21,56 @@ class DoubaoSeedreamService:
         # This endpoint should be configured in your .env and config.py
         # Based on the documentation, it's typically: "https://ark.cn-beijing.volces.com/api/v3/images/generations"
         self.endpoint = Config.DOUBAO_SEEDREAM_ENDPOINT
-        self.client = httpx.AsyncClient()
+        self.model_id = "doubao-seedream-3-0-t2i-250415" # Default model ID as per docs
+        # The connection pool is managed by the FastAPI lifespan through start()/aclose()
+        self.http = UpstreamHTTPClient("Doubao-Seedream", read_timeout=Config.IMAGE_READ_TIMEOUT)
+        self.client: Optional[httpx.AsyncClient] = None
+        # Process-wide cap on concurrent Seedream calls, shared by every request
+        self.semaphore = asyncio.Semaphore(Config.IMAGE_GENERATION_MAX_CONCURRENCY)
+        # Batch-priority calls (batch jobs) must also hold one of these fewer slots, so they can never
+        # take more than BATCH_IMAGE_MAX_CONCURRENCY of the slots above away from interactive requests
+        self.batch_semaphore = asyncio.Semaphore(min(Config.BATCH_IMAGE_MAX_CONCURRENCY, Config.IMAGE_GENERATION_MAX_CONCURRENCY))
+        self.max_concurrency = Config.IMAGE_GENERATION_MAX_CONCURRENCY
+        # Seedream calls currently holding a slot of self.semaphore
+        self.active_calls = 0
+        # Concurrent identical requests (same prompt + parameters) share one upstream call
+        self.singleflight = SingleFlight(enabled=Config.SINGLEFLIGHT_ENABLED, shared=shared_state_store)
+        # Rate limiting, retries and circuit breaking
+        self.controller = UpstreamController(
+            name="Doubao-Seedream",
+            rate=Config.IMAGE_RATE_LIMIT_RPS,
+            burst=Config.IMAGE_RATE_LIMIT_BURST,
+            min_rate=Config.IMAGE_RATE_LIMIT_MIN_RPS,
+            max_retries=Config.UPSTREAM_MAX_RETRIES,
+            retry_base_delay=Config.UPSTREAM_RETRY_BASE_DELAY,
+            retry_max_delay=Config.UPSTREAM_RETRY_MAX_DELAY,
+            failure_threshold=Config.CIRCUIT_FAILURE_THRESHOLD,
+            reset_timeout=Config.CIRCUIT_RESET_TIMEOUT,
+            batch_reserve_ratio=Config.BATCH_UPSTREAM_RESERVE_RATIO,
+            bucket=make_token_bucket(
+                "seedream", Config.IMAGE_RATE_LIMIT_RPS, Config.IMAGE_RATE_LIMIT_BURST, Config.IMAGE_RATE_LIMIT_MIN_RPS
+            ),
+        )
+        # Degradation policy: breaker state, recent error rate and latency decide the serving mode
+        self.degradation = DegradationPolicy(
+            "seedream",
+            self.controller,
+            enabled=Config.DEGRADATION_ENABLED,
+            max_error_rate=Config.DEGRADATION_MAX_ERROR_RATE,
+            max_p95=Config.DEGRADATION_IMAGE_MAX_P95_SECONDS,
+            window=Config.DEGRADATION_WINDOW_SECONDS,
+            min_samples=Config.DEGRADATION_MIN_SAMPLES,
+            hold=Config.DEGRADATION_HOLD_SECONDS,
+        )
+
+    async def start(self):
+        """Creates the HTTP connection pool; called on application startup."""
+        self.client = await self.http.start()
+
+    async def aclose(self):
+        """Closes the HTTP connection pool; called on application shutdown."""
+        await self.http.aclose()
+        self.client = None
 
     async def generate_images(
         self,
@@ -17,7 +78,7 @@ class DoubaoSeedreamService:
         num_images: int = 1, # Default to 1 image for a general call, but can be changed
         size: str = "1024x1024", # Default image size
         response_format: str = "url", # Default to URL for download links
-        model_id: str = "doubao-seedream-3-0-t2i-250415", # Default model ID as per docs
+        model_id: Optional[str] = None, # Defaults to self.model_id
         seed: Optional[int] = None, # Optional random seed
         guidance_scale: Optional[float] = None, # Optional guidance scale
         watermark: bool = False # Optional watermark inclusion
@@ -38,7 +99,8 @@ class DoubaoSeedreamService:
                         Required to be between [512x512, 2048x2048].
             response_format (str): The desired format for the generated image(s).
                                    Options: "url" (downloadable JPEG link), "b64_json" (Base64 encoded string).
-            model_id (str): The Model ID for the text-to-image model or an Endpoint ID.
+            model_id (Optional[str]): The Model ID for the text-to-image model or an Endpoint ID.
+                                      Defaults to the service's model_id.
             seed (Optional[int]): An optional random seed to control the randomness of the generated content.
                                   Using the same seed can help maintain relative stability.
             guidance_scale (Optional[float]): An optional value for the consistency between the model's output
@@ -50,17 +112,14 @@ class DoubaoSeedreamService:
                        If 'response_format' is "b64_json", this will return Base64 strings.
 
         Raises:
-            Exception: If the API call fails or returns an error message.
+            Exception: If the API call fails or returns an error message. Retryable errors (429, 5xx,
+                       network) are retried with jittered exponential backoff first.
+            UpstreamUnavailableError: If the circuit breaker is open.
         """
 
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {self.api_key}"
-        }
-
         # The prompt is now directly passed to the method
         payload: Dict[str, Any] = {
-            "model": model_id,
+            "model": model_id or self.model_id,
             "prompt": prompt,
             "response_format": response_format,
             "size": size,
@@ -73,15 +132,38 @@ class DoubaoSeedreamService:
         if guidance_scale is not None:
             payload["guidance_scale"] = guidance_scale
 
-        print(f"Calling Doubao-Seedream with payload: {payload}") # For debugging
+        return await self.singleflight.do(
+            make_request_key(payload),
+            lambda: self.controller.call(lambda: self._generate(payload, num_images, response_format)),
+        )
+
+    async def _generate(self, payload: Dict[str, Any], num_images: int, response_format: str) -> List[str]:
+        headers = {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {self.api_key}"
+        }
+
+        debug = debug_sampled()
+        if debug:
+            debug_payload("Calling Doubao-Seedream with payload", payload)
 
         try:
-            # Increased timeout as image generation can be time-consuming
-            response = await self.client.post(self.endpoint, headers=headers, json=payload, timeout=120)
-            response.raise_for_status() # Raises HTTPStatusError for bad responses (4xx or 5xx)
+            # The client's read timeout (IMAGE_READ_TIMEOUT) is longer as image generation can be time-consuming
+            batch_slot = self.batch_semaphore if upstream_priority.get() == "batch" else contextlib.nullcontext()
+            async with batch_slot, self.semaphore:
+                self.active_calls += 1
+                try:
+                    with track_upstream("seedream", "image"):
+                        response = await self.client.post(self.endpoint, headers=headers, json=payload)
+                        response.raise_for_status() # Raises HTTPStatusError for bad responses (4xx or 5xx)
+                finally:
+                    self.active_calls -= 1
 
             response_data = response.json()
-            print(f"Doubao-Seedream response: {response_data}") # For debugging
+            if debug:
+                # Long strings (b64_json image data) are truncated
+                debug_payload("Doubao-Seedream response", response_data)
+            record_usage("seedream", response_data.get("usage"))
 
             if response_data.get("error"):
                 error_message = response_data["error"]
@@ -91,7 +173,8 @@ class DoubaoSeedreamService:
             if response_data and "data" in response_data and isinstance(response_data["data"], list):
                 # Extract URLs or Base64 strings based on response_format
                 if response_format == "url":
-                    results = [item["url"] for item in response_data["data"] if "url" in item]
+                    urls = _IMAGE_URLS.validate_python([item["url"] for item in response_data["data"] if "url" in item])
+                    results = [str(url) for url in urls]
                 elif response_format == "b64_json":
                     results = [item["b64_json"] for item in response_data["data"] if "b64_json" in item]
                 else:
@@ -102,25 +185,70 @@ class DoubaoSeedreamService:
                 return results
             else:
                 # If the response structure is unexpected
-                print(f"Unexpected Doubao-Seedream response structure: {response_data}")
+                print(f"Unexpected Doubao-Seedream response structure: {list(response_data)}")
                 raise Exception("Failed to parse Doubao-Seedream response: invalid data format or missing 'data' key.")
 
         except httpx.HTTPStatusError as e:
             status_code = e.response.status_code
             error_details = e.response.text
             print(f"Doubao-Seedream HTTP error {status_code}: {error_details}")
+            retry_after = parse_retry_after(e.response.headers.get("retry-after"))
             if status_code == 400 and "SensitiveContentDetected" in error_details:
-                raise Exception("Input or generated content may contain sensitive information. Please try a different prompt.")
+                raise UpstreamError(
+                    "Input or generated content may contain sensitive information. Please try a different prompt.",
+                    status_code=status_code,
+                )
             elif status_code == 429:
-                raise Exception("Request rate limit exceeded. Please try again later.")
+                raise UpstreamError(
+                    "Request rate limit exceeded. Please try again later.", status_code=status_code, retry_after=retry_after
+                )
             else:
-                raise Exception(f"Doubao-Seedream API request failed: {status_code} - {error_details}")
+                raise UpstreamError(
+                    f"Doubao-Seedream API request failed: {status_code} - {error_details}",
+                    status_code=status_code,
+                    retry_after=retry_after,
+                )
         except httpx.RequestError as e:
             print(f"Doubao-Seedream request error: {e}")
-            raise Exception(f"Network or request error, unable to connect to Doubao-Seedream service: {e}")
+            raise UpstreamError(f"Network or request error, unable to connect to Doubao-Seedream service: {e}")
         except Exception as e:
             print(f"An unexpected error occurred during Doubao-Seedream call: {e}")
             raise Exception(f"Image generation service internal error: {e}")
 
+    async def download_image(self, url: str) -> bytes:
+        """
+        Downloads a generated image from the temporary URL returned by Doubao-Seedream.
+
+        Args:
+            url (str): The image URL from a "url" format response.
+
+        Returns:
+            bytes: The raw image content.
+
+        Raises:
+            Exception: If the download fails.
+        """
+        try:
+            with track_upstream("seedream", "image_download"):
+                response = await self.client.get(url)
+                response.raise_for_status()
+            return response.content
+        except httpx.HTTPStatusError as e:
+            print(f"Doubao-Seedream image download HTTP error {e.response.status_code}")
+            raise Exception(f"Failed to download generated image: {e.response.status_code}")
+        except httpx.RequestError as e:
+            print(f"Doubao-Seedream image download error: {e}")
+            raise Exception(f"Network or request error while downloading generated image: {e}")
+
+    async def stats(self) -> Dict[str, Any]:
+        """Internal service state for monitoring."""
+        return {
+            "singleflight": self.singleflight.stats(),
+            "upstream": await self.controller.state(),
+            "slots": {"active": self.active_calls, "max": self.max_concurrency},
+            "degradation": self.degradation.state(),
+            "http": self.http.stats(),
+        }
+
 # Instantiate the service at the end of the file for import
 doubao_vlm_service = DoubaoSeedreamService()
\ No newline at end of file
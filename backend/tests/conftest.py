@@ -0,0 +1,40 @@
+# backend/tests/conftest.py
+from typing import Callable
+import httpx
+import pytest
+from tools.fake_ark import create_app, parse_args
+
+
+@pytest.fixture
+def fake_ark() -> Callable[..., httpx.AsyncClient]:
+    """
+    Returns a factory of httpx clients wired in-process to tools/fake_ark.py, started with the given
+    command line arguments. Latencies default to zero so that tests only wait where they sleep on purpose.
+    """
+
+    def client(*argv: str) -> httpx.AsyncClient:
+        args = parse_args(["--llm-latency", "0", "--image-latency", "0", "--public-url", "http://fake-ark", *argv])
+        return httpx.AsyncClient(transport=httpx.ASGITransport(app=create_app(args)), base_url=args.public_url)
+
+    return client
+
+
+@pytest.fixture
+def anyio_backend() -> str:
+    # 异步测试通过 anyio 的 pytest 插件（@pytest.mark.anyio）运行在 asyncio 上
+    return "asyncio"
+
+
+class Clock:
+    """Manually advanced time source for the `clock` parameters of the services."""
+
+    def __init__(self, now: float = 1_000_000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock() -> Clock:
+    return Clock()
@@ -0,0 +1,142 @@
+# backend/tests/test_admission.py
+import asyncio
+from typing import List
+import httpx
+import pytest
+from fastapi import FastAPI
+from api.admission import AdmissionMiddleware, admission_queues
+from services.admission import AdmissionQueue, AdmissionRejectedError
+
+
+async def enqueue(queue: AdmissionQueue, client: str, admitted: List[str]) -> asyncio.Task:
+    async def wait():
+        await queue.acquire(client)
+        admitted.append(client)
+
+    task = asyncio.create_task(wait())
+    await asyncio.sleep(0)
+    return task
+
+
+@pytest.mark.anyio
+async def test_free_slots_admit_immediately():
+    queue = AdmissionQueue(name="test", concurrency=2, max_wait=60, max_queue=100, initial_service_time=1.0)
+    await queue.acquire("a")
+    await queue.acquire("a")
+    assert queue.stats()["active"] == 2
+    assert queue.estimated_wait("a") == pytest.approx(0.5)
+
+
+@pytest.mark.anyio
+async def test_clients_are_served_round_robin():
+    queue = AdmissionQueue(name="test", concurrency=1, max_wait=60, max_queue=100, initial_service_time=1.0)
+    await queue.acquire("holder")
+    admitted: List[str] = []
+    # a 先排入 3 个请求，b、c 随后各排 1-2 个
+    tasks = [await enqueue(queue, client, admitted) for client in ("a", "a", "a", "b", "b", "c")]
+    assert queue.stats()["queued"] == 6
+    assert queue.stats()["clients_waiting"] == 3
+
+    for _ in tasks:
+        queue.release(0.0)
+        await asyncio.sleep(0)
+    await asyncio.gather(*tasks)
+    assert admitted == ["a", "b", "c", "a", "b", "a"]
+    assert queue.stats()["queued"] == 0
+    assert queue.stats()["active"] == 1
+
+
+@pytest.mark.anyio
+async def test_wait_estimate_only_counts_requests_served_first():
+    queue = AdmissionQueue(name="test", concurrency=1, max_wait=60, max_queue=100, initial_service_time=2.0)
+    await queue.acquire("holder")
+    admitted: List[str] = []
+    for client in ("a", "a", "a", "b"):
+        await enqueue(queue, client, admitted)
+    # a 的新请求排在自己的 3 个和 b 的 1 个之后；新客户端只排在 a、b 各 1 个之后
+    assert queue.estimated_wait("a") == pytest.approx((3 + 1 + 1) * 2.0)
+    assert queue.estimated_wait("c") == pytest.approx((1 + 1 + 1) * 2.0)
+
+
+@pytest.mark.anyio
+async def test_requests_past_the_slo_are_rejected():
+    queue = AdmissionQueue(name="test", concurrency=1, max_wait=5.0, max_queue=100, initial_service_time=2.0)
+    await queue.acquire("holder")
+    admitted: List[str] = []
+    await enqueue(queue, "flood", admitted)
+    await enqueue(queue, "flood", admitted)
+
+    with pytest.raises(AdmissionRejectedError) as error:
+        await queue.acquire("flood")
+    assert error.value.retry_after == pytest.approx(6.0)
+    # 其他客户端不受 flood 积压的影响
+    other = await enqueue(queue, "other", admitted)
+    assert not other.done()
+    assert queue.stats()["queued"] == 3
+
+
+@pytest.mark.anyio
+async def test_queue_length_limit():
+    queue = AdmissionQueue(name="test", concurrency=1, max_wait=60, max_queue=2, initial_service_time=1.0)
+    await queue.acquire("holder")
+    admitted: List[str] = []
+    await enqueue(queue, "a", admitted)
+    await enqueue(queue, "b", admitted)
+    with pytest.raises(AdmissionRejectedError):
+        await queue.acquire("c")
+
+
+@pytest.mark.anyio
+async def test_service_time_tracks_slot_hold_times():
+    queue = AdmissionQueue(name="test", concurrency=1, max_wait=60, max_queue=100, initial_service_time=10.0)
+    await queue.acquire("a")
+    queue.release(5.0)
+    assert queue.service_time == pytest.approx(9.0)
+
+
+@pytest.mark.anyio
+async def test_cancelled_waiters_give_up_their_place():
+    queue = AdmissionQueue(name="test", concurrency=1, max_wait=60, max_queue=100, initial_service_time=1.0)
+    await queue.acquire("holder")
+    admitted: List[str] = []
+    cancelled = await enqueue(queue, "a", admitted)
+    waiting = await enqueue(queue, "b", admitted)
+
+    cancelled.cancel()
+    await asyncio.gather(cancelled, return_exceptions=True)
+    assert queue.stats()["queued"] == 1
+    queue.release(0.0)
+    await waiting
+    assert admitted == ["b"]
+
+    # 槽位已移交后才被取消的请求，把槽位交给下一个
+    handed = await enqueue(queue, "c", admitted)
+    last = await enqueue(queue, "d", admitted)
+    queue.release(0.0)
+    handed.cancel()
+    await asyncio.gather(handed, return_exceptions=True)
+    await last
+    assert admitted == ["b", "d"]
+    assert queue.stats()["active"] == 1
+
+
+@pytest.mark.anyio
+async def test_middleware_rejects_with_503_and_retry_after(monkeypatch):
+    queue = AdmissionQueue(name="llm", concurrency=1, max_wait=1.0, max_queue=100, initial_service_time=3.0)
+    monkeypatch.setitem(admission_queues, "llm", queue)
+    app = FastAPI()
+
+    @app.post("/api/interpret_name")
+    async def interpret_name():
+        return {"ok": True}
+
+    transport = httpx.ASGITransport(app=AdmissionMiddleware(app))
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        assert (await client.post("/api/interpret_name")).json() == {"ok": True}
+        assert queue.stats()["active"] == 0
+
+        await queue.acquire("holder")
+        response = await client.post("/api/interpret_name")
+        assert response.status_code == 503
+        assert response.headers["retry-after"] == "3"
+        assert "estimated wait" in response.json()["detail"]
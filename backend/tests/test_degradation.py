@@ -0,0 +1,149 @@
+# backend/tests/test_degradation.py
+import asyncio
+import pytest
+from services.degradation import DeferredImages, DegradationPolicy, FallbackImageCache
+from services.upstream import UpstreamController, UpstreamError
+
+
+@pytest.fixture
+def controller(clock) -> UpstreamController:
+    return UpstreamController(
+        name="test", rate=100, burst=100, min_rate=1, max_retries=0, retry_base_delay=0, retry_max_delay=0,
+        failure_threshold=100, reset_timeout=5, clock=clock,
+    )
+
+
+def record(policy: DegradationPolicy, ok: int = 0, failed: int = 0, duration: float = 0.1):
+    for _ in range(ok):
+        policy.controller.record_success(duration)
+    for _ in range(failed):
+        policy.controller.record_failure(UpstreamError("unavailable", status_code=503), duration)
+
+
+def test_too_few_samples_stay_normal(controller):
+    policy = DegradationPolicy(
+        "test", controller, enabled=True, max_error_rate=0.5, max_p95=1.0, window=10, min_samples=4, hold=20,
+    )
+    record(policy, failed=3)
+    assert policy.evaluate() is None
+
+
+def test_error_rate_enters_holds_and_exits(controller, clock):
+    policy = DegradationPolicy(
+        "test", controller, enabled=True, max_error_rate=0.5, max_p95=1.0, window=10, min_samples=4, hold=20,
+    )
+    record(policy, ok=2, failed=2)
+    assert policy.evaluate() is None
+
+    record(policy, failed=1)
+    assert policy.evaluate() == "error_rate"
+    assert policy.times_degraded == 1
+
+    # 失败样本移出窗口后，仍保持降级直到 hold 结束
+    clock.now += 12
+    assert policy.controller.health(policy.window)["samples"] == 0
+    assert policy.evaluate() == "error_rate"
+    assert policy.state()["held_for"] == 8
+
+    clock.now += 8
+    assert policy.evaluate() is None
+    assert policy.state()["mode"] == "normal"
+    assert policy.times_degraded == 1
+
+
+def test_continued_errors_extend_the_hold(controller, clock):
+    policy = DegradationPolicy(
+        "test", controller, enabled=True, max_error_rate=0.5, max_p95=1.0, window=10, min_samples=4, hold=10,
+    )
+    record(policy, failed=4)
+    assert policy.degraded
+    clock.now += 6
+    record(policy, failed=4)
+    assert policy.degraded
+    clock.now += 6
+    # 距离进入降级已超过 hold，但第二批失败仍在窗口内，hold 从最近一次失败的检查重新计算
+    assert policy.degraded
+    assert policy.times_degraded == 1
+    clock.now += 10
+    assert not policy.degraded
+
+
+def test_latency_degrades(controller):
+    policy = DegradationPolicy(
+        "test", controller, enabled=True, max_error_rate=0.5, max_p95=0.5, window=10, min_samples=4, hold=20,
+    )
+    record(policy, ok=4, duration=0.2)
+    assert policy.evaluate() is None
+    record(policy, ok=4, duration=2.0)
+    assert policy.evaluate() == "latency"
+
+
+def test_open_breaker_degrades_only_during_its_cooldown(controller, clock):
+    policy = DegradationPolicy(
+        "test", controller, enabled=True, max_error_rate=0.5, max_p95=1.0, window=10, min_samples=4, hold=0,
+    )
+    breaker = policy.controller.breaker
+    breaker.failure_threshold = 1
+    breaker.record_failure()
+    assert policy.evaluate() == "circuit_open"
+
+    # 冷却期过后交给半开探测决定，不再算作降级
+    clock.now += 5
+    assert breaker.status == "open"
+    assert policy.evaluate() is None
+
+
+def test_disabled_policy_never_degrades(controller):
+    policy = DegradationPolicy(
+        "test", controller, enabled=False, max_error_rate=0.5, max_p95=1.0, window=10, min_samples=4, hold=20,
+    )
+    record(policy, failed=10)
+    assert policy.evaluate() is None
+    assert policy.state()["mode"] == "normal"
+
+
+def test_fallback_images_prefer_exact_then_recent_similar(clock):
+    cache = FallbackImageCache(max_entries=3, ttl=60, clock=clock)
+    for i, pair in enumerate([("猴子", "竹笋"), ("猴子", "锦鲤"), ("黄鹂", "羽毛")], start=1):
+        cache.add(*pair, f"https://img/{i}")
+        clock.now += 1
+
+    assert cache.find("猴子", "竹笋") == ("https://img/1", True)
+    assert cache.find("猴子", "雨伞") == ("https://img/2", False)
+    assert cache.find("白鹅", "星星") is None
+
+    # 超出容量时淘汰最早加入的条目
+    cache.add("白鹅", "星星", "https://img/4")
+    assert cache.find("猴子", "竹笋") == ("https://img/2", False)
+    assert cache.stats() == {"exact": 1, "similar": 2, "misses": 1, "entries": 3}
+
+
+def test_fallback_images_expire(clock):
+    cache = FallbackImageCache(max_entries=10, ttl=60, clock=clock)
+    cache.add("猴子", "竹笋", "https://img/1")
+    clock.now += 60
+    assert cache.find("猴子", "竹笋") == ("https://img/1", True)
+    clock.now += 1
+    assert cache.find("猴子", "竹笋") is None
+    assert cache.stats()["entries"] == 0
+
+
+@pytest.mark.anyio
+async def test_deferred_images_are_taken_over_once():
+    calls = []
+
+    async def generate(imagery1, imagery2):
+        calls.append((imagery1, imagery2))
+        await asyncio.sleep(0.01)
+        return f"https://img/{imagery1}-{imagery2}"
+
+    deferred = DeferredImages(generate, max_pending=1, ttl=60)
+    assert deferred.defer("猴子", "竹笋")
+    assert deferred.defer("猴子", "竹笋")
+    assert not deferred.defer("黄鹂", "羽毛")
+
+    assert await deferred.take("猴子", "竹笋") == "https://img/猴子-竹笋"
+    assert await deferred.take("猴子", "竹笋") is None
+    assert calls == [("猴子", "竹笋")]
+    assert deferred.stats() == {"deferred": 1, "taken": 1, "dropped": 1, "pending": 0, "ready": 0}
+    await deferred.stop()
@@ -0,0 +1,107 @@
+# backend/tests/test_feedback_cache.py
+import asyncio
+from typing import List
+import pytest
+from services.feedback_cache import SpeculativeFeedbackCache
+from services.upstream import upstream_priority
+
+
+class Feedback:
+    """Feedback generator that records the upstream priority of each call; `gate` holds calls back."""
+
+    def __init__(self, error: Exception = None):
+        self.error = error
+        self.priorities: List[str] = []
+        self.gate = asyncio.Event()
+        self.gate.set()
+
+    def __call__(self, text: str):
+        async def generate() -> str:
+            self.priorities.append(upstream_priority.get())
+            await self.gate.wait()
+            if self.error is not None:
+                raise self.error
+            return text
+
+        return generate
+
+
+@pytest.fixture
+def cache(clock) -> SpeculativeFeedbackCache:
+    return SpeculativeFeedbackCache(enabled=True, ttl_seconds=60, max_entries=2, clock=clock)
+
+
+@pytest.mark.anyio
+async def test_speculation_is_served_once(cache):
+    feedback = Feedback()
+    cache.speculate("猴子", "竹笋", feedback("好运"))
+    # 已有推测时不重复生成
+    cache.speculate("猴子", "竹笋", feedback("重复"))
+    await asyncio.sleep(0)
+
+    assert await cache.get("猴子", "竹笋") == "好运"
+    assert await cache.get("猴子", "竹笋") is None
+    # 推测以批量优先级调用上游，不影响调用方的优先级
+    assert feedback.priorities == ["batch"]
+    assert upstream_priority.get() == "interactive"
+    assert cache.stats() == {
+        "speculated": 1, "hits": 1, "hits_in_flight": 0, "misses": 1, "failed": 0, "wasted": 0,
+        "pending": 0, "speculation_use_rate": 1.0, "request_hit_rate": 0.5,
+    }
+
+
+@pytest.mark.anyio
+async def test_request_waits_for_a_running_speculation(cache):
+    feedback = Feedback()
+    feedback.gate.clear()
+    cache.speculate("猴子", "竹笋", feedback("好运"))
+    waiting = asyncio.create_task(cache.get("猴子", "竹笋"))
+    await asyncio.sleep(0)
+    assert not waiting.done()
+
+    feedback.gate.set()
+    assert await waiting == "好运"
+    assert cache.counters["hits_in_flight"] == 1
+    assert cache.counters["hits"] == 0
+
+
+@pytest.mark.anyio
+async def test_failed_speculation_falls_back_to_a_live_call(cache):
+    cache.speculate("猴子", "竹笋", Feedback(error=RuntimeError("upstream failed"))("好运"))
+    assert await cache.get("猴子", "竹笋") is None
+    assert cache.counters["failed"] == 1
+    assert cache.stats()["request_hit_rate"] == 0.0
+
+
+@pytest.mark.anyio
+async def test_unused_speculations_are_wasted(cache, clock):
+    feedback = Feedback()
+    feedback.gate.clear()
+    for pair in [("猴子", "竹笋"), ("锦鲤", "鱼尾"), ("黄鹂", "羽毛")]:
+        cache.speculate(*pair, feedback("好运"))
+    # 超出容量时淘汰最早的推测，仍在进行的被取消
+    assert cache.stats()["pending"] == 2
+    assert await cache.get("猴子", "竹笋") is None
+
+    clock.now += 60
+    assert await cache.get("锦鲤", "鱼尾") is None
+    assert cache.stats()["pending"] == 0
+    assert cache.counters["wasted"] == 3
+    assert cache.stats()["speculation_use_rate"] == 0.0
+
+
+@pytest.mark.anyio
+async def test_batch_jobs_and_disabled_cache_do_not_speculate(cache, clock):
+    feedback = Feedback()
+    token = upstream_priority.set("batch")
+    try:
+        cache.speculate("猴子", "竹笋", feedback("好运"))
+    finally:
+        upstream_priority.reset(token)
+    assert cache.counters["speculated"] == 0
+
+    disabled = SpeculativeFeedbackCache(enabled=False, ttl_seconds=60, max_entries=2, clock=clock)
+    disabled.speculate("猴子", "竹笋", feedback("好运"))
+    assert await disabled.get("猴子", "竹笋") is None
+    assert feedback.priorities == []
+    assert disabled.counters["misses"] == 0
@@ -0,0 +1,107 @@
+# backend/tests/test_hedging.py
+import asyncio
+import pytest
+from services.hedging import Hedger, LatencyTracker
+
+
+def warm_up(hedger: Hedger, latency: float = 0.01) -> Hedger:
+    """Fills the latency window with enough samples for the hedger to start hedging."""
+    for _ in range(hedger.min_samples):
+        hedger.latency.record(latency)
+    return hedger
+
+
+class Upstream:
+    """Each call sleeps for the next of the given delays (the last one repeats)."""
+
+    def __init__(self, *delays: float, error: Exception = None):
+        self.delays = list(delays)
+        self.error = error
+        self.calls = 0
+        self.cancelled = 0
+
+    async def __call__(self):
+        delay = self.delays[min(self.calls, len(self.delays) - 1)]
+        self.calls += 1
+        call = self.calls
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if self.error is not None:
+            raise self.error
+        return call
+
+
+def test_latency_percentiles():
+    tracker = LatencyTracker(window=100)
+    assert tracker.percentile(95) is None
+    for ms in range(1, 101):
+        tracker.record(ms / 1000)
+    assert tracker.summary() == {"p50": 0.05, "p95": 0.095, "p99": 0.099}
+
+
+@pytest.mark.anyio
+async def test_no_hedge_until_there_are_enough_samples():
+    hedger = Hedger(enabled=True, percentile=95, min_delay=0.01, budget_ratio=0.5, max_budget=1.0, min_samples=50)
+    upstream = Upstream(0.05)
+    assert await hedger.run(upstream) == 1
+    assert upstream.calls == 1
+    assert hedger.counters["hedged"] == 0
+
+
+@pytest.mark.anyio
+async def test_slow_call_is_hedged_and_the_loser_cancelled():
+    hedger = warm_up(Hedger(
+        enabled=True, percentile=95, min_delay=0.01, budget_ratio=1.0, max_budget=1.0, min_samples=3,
+    ))
+    upstream = Upstream(1.0, 0.01)
+    assert await hedger.run(upstream) == 2
+    await asyncio.sleep(0)
+    assert upstream.cancelled == 1
+    assert hedger.counters["hedged"] == 1
+    assert hedger.counters["hedge_wins"] == 1
+
+
+@pytest.mark.anyio
+async def test_budget_caps_the_share_of_hedged_calls():
+    # 每次调用积累 0.25 个对冲名额，因此最多每 4 次调用对冲一次。
+    # 未对冲的慢调用也计入延迟窗口，用 p50 让对冲延迟保持在样本的 0.01 秒
+    hedger = warm_up(Hedger(
+        enabled=True, percentile=50, min_delay=0.01, budget_ratio=0.25, max_budget=1.0, min_samples=20,
+    ))
+    for _ in range(8):
+        await hedger.run(Upstream(0.05, 0.001))
+    assert hedger.counters["calls"] == 8
+    assert hedger.counters["hedged"] == 2
+    assert hedger.counters["budget_exhausted"] == 6
+
+
+@pytest.mark.anyio
+async def test_budget_does_not_accumulate_past_its_cap():
+    hedger = warm_up(Hedger(
+        enabled=False, percentile=50, min_delay=0.01, budget_ratio=1.0, max_budget=2.0, min_samples=20,
+    ))
+    for _ in range(10):
+        await hedger.run(Upstream(0))
+    assert hedger.state()["budget"] == 2.0
+
+    # 不再积累名额时，已积累的只够连续对冲两次
+    hedger.enabled = True
+    hedger.budget_ratio = 0.0
+    for _ in range(3):
+        await hedger.run(Upstream(0.05, 0.001))
+    assert hedger.counters["hedged"] == 2
+    assert hedger.counters["budget_exhausted"] == 1
+
+
+@pytest.mark.anyio
+async def test_error_is_raised_when_both_calls_fail():
+    hedger = warm_up(Hedger(
+        enabled=True, percentile=95, min_delay=0.01, budget_ratio=1.0, max_budget=1.0, min_samples=3,
+    ))
+    upstream = Upstream(0.05, 0.01, error=RuntimeError("upstream failed"))
+    with pytest.raises(RuntimeError):
+        await hedger.run(upstream)
+    assert upstream.calls == 2
@@ -0,0 +1,101 @@
+# backend/tests/test_images.py
+import asyncio
+import hashlib
+import os
+import httpx
+import pytest
+from fastapi import FastAPI
+from api.images import images_router
+from services.image_store import image_store
+
+CONTENT = b"\x89PNG\r\n\x1a\n" + bytes(range(256)) * 4
+DIGEST = hashlib.sha256(CONTENT).hexdigest()
+
+
+@pytest.fixture
+def stored_image(tmp_path, monkeypatch):
+    monkeypatch.setattr(image_store, "directory", str(tmp_path))
+    path = image_store.path_for(DIGEST)
+    os.makedirs(os.path.dirname(path))
+    with open(path, "wb") as f:
+        f.write(CONTENT)
+    return path
+
+
+def get(headers=None, path=f"/api/images/{DIGEST}") -> httpx.Response:
+    app = FastAPI()
+    app.include_router(images_router)
+
+    async def request():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            return await client.get(path, headers=headers or {})
+
+    return asyncio.run(request())
+
+
+def test_full_response(stored_image):
+    response = get()
+    assert response.status_code == 200
+    assert response.content == CONTENT
+    assert response.headers["content-type"] == "image/png"
+    assert response.headers["content-length"] == str(len(CONTENT))
+    assert response.headers["etag"] == f'"{DIGEST}"'
+    assert response.headers["accept-ranges"] == "bytes"
+    assert "immutable" in response.headers["cache-control"]
+
+
+@pytest.mark.parametrize("header, start, end", [
+    ("bytes=0-99", 0, 99),
+    ("bytes=100-", 100, len(CONTENT) - 1),
+    ("bytes=-10", len(CONTENT) - 10, len(CONTENT) - 1),
+    ("bytes=1000-99999", 1000, len(CONTENT) - 1),
+    ("bytes=-99999", 0, len(CONTENT) - 1),
+])
+def test_single_range(stored_image, header, start, end):
+    response = get({"Range": header})
+    assert response.status_code == 206
+    assert response.content == CONTENT[start:end + 1]
+    assert response.headers["content-range"] == f"bytes {start}-{end}/{len(CONTENT)}"
+    assert response.headers["content-length"] == str(end - start + 1)
+
+
+@pytest.mark.parametrize("header", ["bytes=99999-", "bytes=20-10", "bytes=-0"])
+def test_unsatisfiable_range(stored_image, header):
+    response = get({"Range": header})
+    assert response.status_code == 416
+    assert response.headers["content-range"] == f"bytes */{len(CONTENT)}"
+
+
+@pytest.mark.parametrize("header", ["bytes=0-1,5-6", "items=0-1", "bytes=-"])
+def test_ignored_range_serves_the_whole_image(stored_image, header):
+    response = get({"Range": header})
+    assert response.status_code == 200
+    assert response.content == CONTENT
+
+
+def test_if_none_match(stored_image):
+    response = get({"If-None-Match": f'"other", "{DIGEST}"'})
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["etag"] == f'"{DIGEST}"'
+
+    assert get({"If-None-Match": '"other"'}).status_code == 200
+
+
+def test_if_range(stored_image):
+    assert get({"Range": "bytes=0-9", "If-Range": f'"{DIGEST}"'}).status_code == 206
+    # 校验值不匹配时忽略 Range，返回完整内容
+    response = get({"Range": "bytes=0-9", "If-Range": '"stale"'})
+    assert response.status_code == 200
+    assert response.content == CONTENT
+
+
+def test_missing_variant_falls_back_to_original(stored_image):
+    response = get(path=f"/api/images/{DIGEST}?w=256")
+    assert response.status_code == 200
+    assert response.content == CONTENT
+
+
+def test_not_found(stored_image):
+    assert get(path=f"/api/images/{'0' * 64}").status_code == 404
+    assert get(path="/api/images/not-a-digest").status_code == 404
@@ -0,0 +1,152 @@
+# backend/tests/test_jobs.py
+import asyncio
+import json
+import time
+from typing import Dict, List
+import pytest
+from services.jobs import BatchJobManager, JobStore
+from services.upstream import upstream_priority
+
+
+class Worker:
+    """Batch worker that records its calls; names listed in `blocked` wait until released."""
+
+    def __init__(self, blocked=()):
+        self.calls: List[str] = []
+        self.priorities: List[str] = []
+        self.blocked = set(blocked)
+        self.started = asyncio.Event()
+        self.cancelled = asyncio.Event()
+        self.release = asyncio.Event()
+
+    async def __call__(self, name: str) -> str:
+        self.calls.append(name)
+        self.priorities.append(upstream_priority.get())
+        if name in self.blocked:
+            self.started.set()
+            try:
+                await self.release.wait()
+            except asyncio.CancelledError:
+                self.cancelled.set()
+                raise
+        if name == "失败":
+            raise ValueError("generation failed")
+        return json.dumps({"name": name}, ensure_ascii=False)
+
+
+async def wait_for_job(manager: BatchJobManager, job_id: str) -> Dict:
+    for _ in range(500):
+        job = await manager.status(job_id)
+        if job["status"] == "completed":
+            return job
+        await asyncio.sleep(0.01)
+    raise AssertionError(f"job {job_id} did not complete: {job}")
+
+
+def results(store: JobStore, job_id: str) -> List:
+    return [row for page in store.iter_results(job_id) for row in page]
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "jobs.sqlite3")
+
+
+@pytest.mark.anyio
+async def test_items_are_processed_at_batch_priority(db_path):
+    store, worker = JobStore(db_path), Worker()
+    manager = BatchJobManager(store, worker, concurrency=2)
+    await manager.start()
+    try:
+        job_id = await manager.submit(["张三", "失败", "李四"])
+        job = await wait_for_job(manager, job_id)
+    finally:
+        await manager.stop()
+
+    assert (job["succeeded"], job["failed"]) == (2, 1)
+    assert sorted(worker.calls) == sorted(["张三", "失败", "李四"])
+    assert set(worker.priorities) == {"batch"}
+    assert results(store, job_id) == [
+        (0, "张三", "succeeded", '{"name": "张三"}', None),
+        (1, "失败", "failed", None, "generation failed"),
+        (2, "李四", "succeeded", '{"name": "李四"}', None),
+    ]
+
+
+@pytest.mark.anyio
+async def test_items_claimed_elsewhere_are_skipped(db_path):
+    store = JobStore(db_path)
+    job_id = store.create(["张三", "李四"])
+    other = JobStore(db_path)
+    assert other.claim_item(job_id, 0) == "张三"
+
+    worker = Worker()
+    manager = BatchJobManager(store, worker, concurrency=1)
+    await manager.start()
+    try:
+        for _ in range(500):
+            if (await manager.status(job_id))["succeeded"] == 1:
+                break
+            await asyncio.sleep(0.01)
+    finally:
+        await manager.stop()
+    # 张三 由另一个进程持有租约，本进程不处理
+    assert worker.calls == ["李四"]
+    assert other.set_item(job_id, 0, "succeeded", result="{}")
+    assert store.get(job_id)["status"] == "completed"
+
+
+@pytest.mark.anyio
+async def test_expired_items_of_a_dead_process_are_recovered(db_path):
+    # 已退出的进程在很久以前认领了条目，它的租约早已过期
+    dead = JobStore(db_path, lease=60, clock=lambda: time.time() - 3600)
+    job_id = dead.create(["张三", "李四"])
+    assert dead.claim_item(job_id, 0) == "张三"
+
+    store, worker = JobStore(db_path), Worker()
+    manager = BatchJobManager(store, worker, concurrency=1)
+    await manager.start()
+    try:
+        job = await wait_for_job(manager, job_id)
+    finally:
+        await manager.stop()
+    assert job["succeeded"] == 2
+    assert sorted(worker.calls) == ["张三", "李四"]
+
+
+@pytest.mark.anyio
+async def test_lost_lease_cancels_the_work_and_drops_the_result(db_path):
+    store = JobStore(db_path, lease=0.03)
+    job_id = store.create(["张三"])
+    worker = Worker(blocked=["张三"])
+    manager = BatchJobManager(store, worker, concurrency=1)
+    await manager.start()
+    try:
+        await asyncio.wait_for(worker.started.wait(), 5)
+        # 另一个进程的时钟认为租约已过期，接手了条目
+        other = JobStore(db_path, clock=lambda: time.time() + 3600)
+        assert other.claim_item(job_id, 0) == "张三"
+        await asyncio.wait_for(worker.cancelled.wait(), 5)
+    finally:
+        await manager.stop()
+
+    assert results(store, job_id) == [(0, "张三", "running", None, None)]
+    assert other.set_item(job_id, 0, "succeeded", result='{"by": "other"}')
+    assert results(store, job_id) == [(0, "张三", "succeeded", '{"by": "other"}', None)]
+
+
+@pytest.mark.anyio
+async def test_stop_cancels_items_in_progress(db_path):
+    store = JobStore(db_path)
+    worker = Worker(blocked=["张三"])
+    manager = BatchJobManager(store, worker, concurrency=1)
+    await manager.start()
+    job_id = await manager.submit(["张三"])
+    await asyncio.wait_for(worker.started.wait(), 5)
+    await manager.stop()
+
+    assert worker.cancelled.is_set()
+    # 条目保持 running，租约过期后由重启的进程接手
+    assert results(store, job_id) == [(0, "张三", "running", None, None)]
+    assert store.unfinished_items() == []
+    assert JobStore(db_path, clock=lambda: time.time() + 3600).unfinished_items() == [(job_id, 0)]
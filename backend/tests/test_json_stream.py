@@ -0,0 +1,119 @@
+# backend/tests/test_json_stream.py
+import json
+import pytest
+from services.json_stream import IncrementalJSONArrayParser
+
+ITEMS = [
+    {"id": 1, "imagery1": "孙悟空的小猴", "imagery2": "鲜嫩竹笋"},
+    {"id": 2, "imagery1": "红色锦鲤", "imagery2": "灵动的小鱼尾"},
+    {"id": 3, "imagery1": "黄鹂鸟", "imagery2": "洁白的羽毛"},
+]
+
+
+def feed_all(parser: IncrementalJSONArrayParser, chunks):
+    completed = []
+    for chunk in chunks:
+        completed.append(parser.feed(chunk))
+    return completed
+
+
+def test_objects_are_returned_as_soon_as_they_close():
+    parser = IncrementalJSONArrayParser()
+    text = json.dumps(ITEMS, ensure_ascii=False)
+    first_end = text.index("}") + 1
+
+    assert parser.feed(text[:first_end - 1]) == []
+    assert parser.feed(text[first_end - 1:first_end]) == [ITEMS[0]]
+    assert not parser.closed
+    assert parser.feed(text[first_end:]) == ITEMS[1:]
+    assert parser.closed
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7])
+def test_split_at_any_point(size):
+    text = json.dumps(ITEMS, ensure_ascii=False, indent=2)
+    parser = IncrementalJSONArrayParser()
+    completed = feed_all(parser, [text[i:i + size] for i in range(0, len(text), size)])
+    assert [item for chunk in completed for item in chunk] == ITEMS
+    assert parser.closed
+
+
+def test_code_fence_and_trailing_text_are_ignored():
+    parser = IncrementalJSONArrayParser()
+    text = "```json\n" + json.dumps(ITEMS, ensure_ascii=False) + "\n```\n以上是解析结果 [1]"
+    assert parser.feed(text) == ITEMS
+    assert parser.closed
+    assert parser.feed('[{"id": 4}]') == []
+
+
+def test_braces_brackets_and_escapes_inside_strings():
+    items = [
+        {"id": 1, "imagery1": 'a "}] quote', "imagery2": "back\\slash"},
+        {"id": 2, "imagery1": "{[nested]}", "imagery2": "\\\"}"},
+    ]
+    text = json.dumps(items)
+    parser = IncrementalJSONArrayParser()
+    # 在转义符之后切分，检查跨 chunk 的转义状态
+    split = text.index("\\") + 1
+    assert parser.feed(text[:split]) == []
+    assert parser.feed(text[split:]) == items
+    assert parser.closed
+
+
+def test_nested_values_stay_in_their_object():
+    items = [{"id": 1, "tags": ["a", {"b": [1, 2]}]}, {"id": 2, "tags": []}]
+    parser = IncrementalJSONArrayParser()
+    assert parser.feed(json.dumps(items)) == items
+
+
+def test_non_object_element_is_rejected():
+    parser = IncrementalJSONArrayParser()
+    with pytest.raises(ValueError):
+        parser.feed('[{"id": 1}, [1, 2]]')
+
+
+def test_malformed_object_is_rejected():
+    parser = IncrementalJSONArrayParser()
+    assert parser.feed('[{"id": 1},') == [{"id": 1}]
+    with pytest.raises(ValueError):
+        parser.feed('{"id": 2,}]')
+
+
+@pytest.mark.parametrize("text", ['[{"id": 1}, 2]', '["a", {"id": 1}]', '[{"id": 1}, null]', "[true]"])
+def test_scalar_element_is_rejected(text):
+    parser = IncrementalJSONArrayParser()
+    with pytest.raises(ValueError):
+        parser.feed(text)
+
+
+@pytest.mark.parametrize("text", ['[{"id": 1} {"id": 2}]', '[{"id": 1},]', '[, {"id": 1}]', '[{"id": 1},, {"id": 2}]'])
+def test_misplaced_commas_are_rejected(text):
+    parser = IncrementalJSONArrayParser()
+    with pytest.raises(ValueError):
+        parser.feed(text)
+
+
+def test_empty_array():
+    parser = IncrementalJSONArrayParser()
+    assert parser.feed("[ ]") == []
+    parser.finish()
+
+
+def test_incomplete_array_is_not_closed():
+    parser = IncrementalJSONArrayParser()
+    assert parser.feed('[{"id": 1}, {"id": 2, "imagery1": "未完') == [{"id": 1}]
+    assert not parser.closed
+
+
+@pytest.mark.parametrize("text", ['[{"id": 1}, {"id": 2}', '[{"id": 1}, {"id": 2', "```json\n", ""])
+def test_truncated_stream_fails_on_finish(text):
+    parser = IncrementalJSONArrayParser()
+    parser.feed(text)
+    with pytest.raises(ValueError):
+        parser.finish()
+
+
+def test_complete_stream_finishes():
+    parser = IncrementalJSONArrayParser()
+    parser.feed(json.dumps(ITEMS))
+    parser.finish()
@@ -0,0 +1,104 @@
+# backend/tests/test_llm_stream.py
+import json
+from typing import AsyncIterator, List
+import httpx
+import pytest
+from services.llm import DoubaoLLMService
+from services.upstream import UpstreamController, UpstreamError
+from tools.fake_ark import FEEDBACK_TEXT, create_app, parse_args
+
+MESSAGES = [{"role": "user", "content": "你好"}]
+
+
+class ScriptedTransport(httpx.AsyncBaseTransport):
+    """Answers requests from a script of responses; once it runs out, requests go to tools/fake_ark.py."""
+
+    def __init__(self, *script: httpx.Response):
+        self.script = list(script)
+        self.requests = 0
+        args = parse_args(["--llm-latency", "0", "--stream-chunks", "4"])
+        self.fake_ark = httpx.ASGITransport(app=create_app(args))
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self.requests += 1
+        if self.script:
+            return self.script.pop(0)
+        return await self.fake_ark.handle_async_request(request)
+
+
+def broken_stream() -> httpx.Response:
+    """A stream that sends one delta and then loses the connection."""
+
+    async def body() -> AsyncIterator[bytes]:
+        chunk = {"choices": [{"index": 0, "delta": {"content": "哇"}}]}
+        yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode()
+        raise httpx.ReadError("connection reset")
+
+    return httpx.Response(200, content=body(), headers={"content-type": "text/event-stream"})
+
+
+def llm_service(transport: ScriptedTransport, max_retries: int = 2) -> DoubaoLLMService:
+    service = DoubaoLLMService()
+    service.client = httpx.AsyncClient(transport=transport, base_url="http://fake-ark")
+    service.endpoint = "/api/v3/chat/completions"
+    service.controller = UpstreamController(
+        name="test", rate=100, burst=100, min_rate=1, max_retries=max_retries, retry_base_delay=0,
+        retry_max_delay=0, failure_threshold=10, reset_timeout=60,
+    )
+    return service
+
+
+async def collect(service: DoubaoLLMService, deltas: List[str]):
+    async for delta in service.stream_response(MESSAGES):
+        deltas.append(delta)
+
+
+@pytest.mark.anyio
+async def test_errors_before_the_first_delta_are_retried():
+    transport = ScriptedTransport(
+        httpx.Response(429, headers={"Retry-After": "0"}, json={"error": {"code": "RateLimitExceeded"}}),
+        httpx.Response(503, json={"error": {"code": "ServiceUnavailable"}}),
+    )
+    service = llm_service(transport)
+    deltas: List[str] = []
+    await collect(service, deltas)
+
+    assert "".join(deltas) == FEEDBACK_TEXT
+    assert transport.requests == 3
+    assert service.controller.counters["retries"] == 2
+    assert service.controller.breaker.consecutive_failures == 0
+    assert service.stream_counters == {"calls": 1, "completed": 1, "failed": 0}
+
+
+@pytest.mark.anyio
+async def test_retries_are_bounded():
+    transport = ScriptedTransport(*(httpx.Response(500) for _ in range(3)))
+    service = llm_service(transport, max_retries=1)
+    with pytest.raises(UpstreamError) as error:
+        await collect(service, [])
+    assert error.value.status_code == 500
+    assert transport.requests == 2
+    assert service.stream_counters["failed"] == 1
+
+
+@pytest.mark.anyio
+async def test_non_retryable_errors_fail_at_once():
+    transport = ScriptedTransport(httpx.Response(400, json={"error": {"code": "InvalidParameter"}}))
+    service = llm_service(transport)
+    with pytest.raises(UpstreamError) as error:
+        await collect(service, [])
+    assert error.value.status_code == 400
+    assert transport.requests == 1
+
+
+@pytest.mark.anyio
+async def test_errors_after_the_first_delta_are_not_retried():
+    transport = ScriptedTransport(broken_stream())
+    service = llm_service(transport)
+    deltas: List[str] = []
+    with pytest.raises(UpstreamError):
+        await collect(service, deltas)
+    # 重试会让调用方收到重复的文本
+    assert deltas == ["哇"]
+    assert transport.requests == 1
+    assert service.controller.counters["retries"] == 0
@@ -0,0 +1,134 @@
+# backend/tests/test_name_cache.py
+import sqlite3
+import pytest
+from services.name_cache import NameInterpretationCache, normalize_name
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "name_cache.sqlite3")
+
+
+def disk_rows(path: str):
+    return sqlite3.connect(path).execute(
+        "SELECT key, payload, accessed_at FROM name_interpretations ORDER BY rowid"
+    ).fetchall()
+
+
+def test_names_are_normalized():
+    assert normalize_name(" Ｗang  Xiao　Yu ") == normalize_name("wangxiaoyu")
+
+
+@pytest.mark.anyio
+async def test_memory_and_disk_hits(db_path, clock):
+    cache = NameInterpretationCache(db_path, ttl_seconds=60, memory_max_entries=10, disk_max_entries=10, clock=clock)
+    assert await cache.get("王小鱼") is None
+    await cache.put("王小鱼", "payload")
+    assert await cache.get(" 王小鱼") == "payload"
+
+    # 新实例（如重启后的进程）从磁盘命中
+    restarted = NameInterpretationCache(db_path, ttl_seconds=60, memory_max_entries=10, disk_max_entries=10, clock=clock)
+    assert await restarted.get("王小鱼") == "payload"
+    assert (cache.counters["memory_hits"], cache.counters["misses"], restarted.counters["disk_hits"]) == (1, 1, 1)
+
+
+@pytest.mark.anyio
+async def test_a_key_hits_only_once_all_variants_are_filled(db_path, clock):
+    cache = NameInterpretationCache(
+        db_path, ttl_seconds=60, memory_max_entries=10, disk_max_entries=10, variants=3, clock=clock,
+    )
+    for payload in ("v1", "v2"):
+        await cache.put("王小鱼", payload)
+        clock.now += 1
+    assert await cache.get("王小鱼") is None
+
+    await cache.put("王小鱼", "v3")
+    clock.now += 1
+    served = {await cache.get("王小鱼") for _ in range(50)}
+    assert served == {"v1", "v2", "v3"}
+
+    # 超出 variants 时只保留最新的几个，内存与磁盘一致
+    await cache.put("王小鱼", "v4")
+    restarted = NameInterpretationCache(
+        db_path, ttl_seconds=60, memory_max_entries=10, disk_max_entries=10, variants=3, clock=clock,
+    )
+    assert {await restarted.get("王小鱼") for _ in range(50)} == {"v2", "v3", "v4"}
+    assert [payload for _, payload, _ in disk_rows(db_path)] == ["v2", "v3", "v4"]
+
+
+@pytest.mark.anyio
+async def test_expired_variants_do_not_count(db_path, clock):
+    cache = NameInterpretationCache(
+        db_path, ttl_seconds=60, memory_max_entries=10, disk_max_entries=10, variants=2, clock=clock,
+    )
+    await cache.put("王小鱼", "old")
+    clock.now += 50
+    await cache.put("王小鱼", "new")
+    assert await cache.get("王小鱼") in {"old", "new"}
+    clock.now += 20
+    assert await cache.get("王小鱼") is None
+
+
+@pytest.mark.anyio
+async def test_replace_drops_the_existing_variants(db_path, clock):
+    cache = NameInterpretationCache(db_path, ttl_seconds=60, memory_max_entries=10, disk_max_entries=10, clock=clock)
+    await cache.put("王小鱼", "old")
+    await cache.put("王小鱼", "new", replace=True)
+    assert await cache.get("王小鱼") == "new"
+    assert [payload for _, payload, _ in disk_rows(db_path)] == ["new"]
+
+
+@pytest.mark.anyio
+async def test_memory_lru_eviction(db_path, clock):
+    cache = NameInterpretationCache(db_path, ttl_seconds=60, memory_max_entries=2, disk_max_entries=10, clock=clock)
+    for name in ("甲", "乙", "丙"):
+        await cache.put(name, name)
+    assert cache.stats()["memory_entries"] == 2
+    assert cache.counters["memory_evictions"] == 1
+    # 被挤出内存的条目仍可从磁盘读取
+    assert await cache.get("甲") == "甲"
+    assert cache.counters["disk_hits"] == 1
+
+
+@pytest.mark.anyio
+async def test_disk_eviction_drops_the_least_recently_read(db_path, clock):
+    cache = NameInterpretationCache(db_path, ttl_seconds=3600, memory_max_entries=1, disk_max_entries=3, clock=clock)
+    for name in ("甲", "乙", "丙"):
+        await cache.put(name, name)
+        clock.now += 1
+    # 读取 甲（磁盘命中）使它成为最近访问的条目
+    assert await cache.get("甲") == "甲"
+    clock.now += 1
+    await cache.put("丁", "丁")
+
+    assert sorted(payload for _, payload, _ in disk_rows(db_path)) == ["丁", "丙", "甲"]
+    assert cache.counters["disk_evictions"] == 1
+
+
+@pytest.mark.anyio
+async def test_reads_do_not_write_to_disk(db_path, clock):
+    cache = NameInterpretationCache(db_path, ttl_seconds=3600, memory_max_entries=1, disk_max_entries=1000, clock=clock)
+    await cache.put("甲", "甲")
+    await cache.put("乙", "乙")
+    written = disk_rows(db_path)
+
+    clock.now += 10
+    assert await cache.get("甲") == "甲"
+    assert disk_rows(db_path) == written
+
+    # 访问时间随定期清理（每 100 次写入，或容量淘汰时）批量写回
+    for i in range(98):
+        await cache.put(f"名字{i}", "x")
+    accessed = {key: accessed_at for key, _, accessed_at in disk_rows(db_path)}
+    assert accessed[cache.make_key("甲")] == clock.now
+    assert accessed[cache.make_key("乙")] == clock.now - 10
+
+
+@pytest.mark.anyio
+async def test_disabled_cache(db_path, clock):
+    cache = NameInterpretationCache(
+        db_path, ttl_seconds=60, memory_max_entries=10, disk_max_entries=10, enabled=False, clock=clock,
+    )
+    await cache.put("王小鱼", "payload")
+    assert await cache.get("王小鱼") is None
+    assert cache.counters["stores"] == 0
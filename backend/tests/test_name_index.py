@@ -0,0 +1,78 @@
+# backend/tests/test_name_index.py
+import json
+import pytest
+from prompts.llm_prompts import INTERPRET_NAME_PROMPT_VERSION
+from services import name_index as name_index_module
+from services.name_index import HomophoneIndex
+
+pytest.importorskip("pypinyin")
+
+IMAGERY = ["王冠", "网兜", "旺仔", "小鱼尾", "玉石", "雨伞", "鲜嫩竹笋"]
+
+
+@pytest.fixture
+def index_path(tmp_path):
+    path = tmp_path / "name_index.json"
+    path.write_text(json.dumps({
+        "prompt_version": INTERPRET_NAME_PROMPT_VERSION,
+        "imagery": IMAGERY,
+        # 位置按候选排名排列
+        "chars": {"王": [0, 1, 2], "鱼": [3, 4, 5], "孙": [6]},
+        "pinyin": {"wang": [0, 1, 2], "yu": [3, 4, 5], "sun": [6]},
+    }, ensure_ascii=False), encoding="utf-8")
+    return str(path)
+
+
+async def loaded(path: str, llm_ratio: float = 0.0) -> HomophoneIndex:
+    index = HomophoneIndex(path, llm_ratio=llm_ratio)
+    await index.load()
+    return index
+
+
+@pytest.mark.anyio
+async def test_first_and_last_characters_give_the_pairs(index_path):
+    index = await loaded(index_path)
+    expected = [("王冠", "小鱼尾"), ("网兜", "玉石"), ("旺仔", "雨伞")]
+    assert index.lookup("王小鱼") == expected
+    # 未收录的字按拼音（谐音）查找：汪 → wang，余 → yu
+    assert index.lookup("汪小余") == expected
+    assert index.counters == {"hits": 2, "misses": 0, "freshness_calls": 0}
+
+
+@pytest.mark.anyio
+async def test_names_without_three_pairs_are_not_covered(index_path):
+    index = await loaded(index_path)
+    # 孙 只有 1 个候选，王 3 个，能组成 3 组；李 既不在字表也不在拼音表
+    assert index.lookup("王孙") == [("王冠", "鲜嫩竹笋"), ("网兜", "鲜嫩竹笋"), ("旺仔", "鲜嫩竹笋")]
+    assert index.lookup("孙孙") is None
+    assert index.lookup("王小李") is None
+    assert index.lookup("王") is None
+    assert index.counters["misses"] == 3
+
+
+@pytest.mark.anyio
+async def test_llm_ratio_sends_covered_names_to_the_llm(index_path, monkeypatch):
+    index = await loaded(index_path, llm_ratio=0.25)
+    draws = iter([0.1, 0.5, 0.2, 0.9])
+    monkeypatch.setattr(name_index_module.random, "random", lambda: next(draws))
+    results = [index.lookup("王小鱼") for _ in range(4)]
+    assert [pairs is None for pairs in results] == [True, False, True, False]
+    assert index.counters == {"hits": 2, "misses": 0, "freshness_calls": 2}
+    assert index.stats()["hit_rate"] == 0.5
+
+    # 上游降级时不做新鲜度调用
+    assert index.lookup("王小鱼", freshness=False) is not None
+
+
+@pytest.mark.anyio
+async def test_missing_or_stale_index_leaves_the_fast_path_off(tmp_path, index_path):
+    assert (await loaded(str(tmp_path / "missing.json"))).lookup("王小鱼") is None
+
+    with open(index_path, encoding="utf-8") as f:
+        data = json.load(f)
+    data["prompt_version"] = "stale"
+    with open(index_path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    index = await loaded(index_path)
+    assert index.lookup("王小鱼") is None
+    assert index.stats()["loaded"] is False
@@ -0,0 +1,210 @@
+# backend/tests/test_prefetch.py
+from typing import List, Optional, Set, Tuple
+import pytest
+from api import generate_image
+from services.prefetch import BlindBoxPool
+from services.upstream import upstream_priority
+
+Pair = Tuple[str, str]
+
+
+class Upstream:
+    """Generation and interpretation callbacks of the pool, with a switchable idle state."""
+
+    def __init__(self):
+        self.generated: List[Pair] = []
+        self.stored: Set[Pair] = set()
+        self.idle = True
+        self.idle_budget: Optional[int] = None
+
+    async def generate(self, imagery1: str, imagery2: str) -> str:
+        self.generated.append((imagery1, imagery2))
+        return f"https://img/{imagery1}-{imagery2}/{len(self.generated)}"
+
+    async def interpret(self, name: str) -> List[Pair]:
+        return [(f"{name}1", f"{name}2")]
+
+    def is_idle(self) -> bool:
+        # idle_budget：还能通过几次空闲检查（模拟预热途中实时流量到来）
+        if self.idle_budget is not None:
+            self.idle_budget -= 1
+            return self.idle_budget >= 0
+        return self.idle
+
+    async def is_stored(self, imagery1: str, imagery2: str) -> bool:
+        return (imagery1, imagery2) in self.stored
+
+
+@pytest.fixture
+def upstream():
+    return Upstream()
+
+
+@pytest.fixture
+def pool(clock, upstream):
+    return BlindBoxPool(
+        generate=upstream.generate,
+        interpret=upstream.interpret,
+        is_idle=upstream.is_idle,
+        is_stored=upstream.is_stored,
+        enabled=True,
+        top_pairs=2,
+        top_names=1,
+        depth=2,
+        max_images=4,
+        min_requests=2,
+        interval=60,
+        image_ttl=100,
+        decay_interval=10,
+        max_tracked=5,
+        clock=clock,
+    )
+
+
+def request(pool: BlindBoxPool, pair: Pair, times: int):
+    for _ in range(times):
+        pool.record_pair(*pair)
+
+
+def scores(pool: BlindBoxPool):
+    return {(p["imagery1"], p["imagery2"]): p["score"] for p in pool.stats()["hottest_pairs"]}
+
+
+def test_counts_decay_by_half_each_interval(pool, clock):
+    request(pool, ("猴子", "竹笋"), 8)
+    request(pool, ("锦鲤", "鱼尾"), 1)
+    pool.record_name("王小鱼")
+
+    pool._decay()
+    assert scores(pool) == {("猴子", "竹笋"): 8, ("锦鲤", "鱼尾"): 1}
+
+    clock.now += 10
+    pool._decay()
+    # 减半后低于 0.5 的计数被删除
+    assert scores(pool) == {("猴子", "竹笋"): 4, ("锦鲤", "鱼尾"): 0.5}
+    clock.now += 10
+    pool._decay()
+    assert scores(pool) == {("猴子", "竹笋"): 2}
+    assert pool.stats()["tracked_names"] == 0
+
+
+def test_tracking_keeps_the_most_frequent_keys(pool):
+    for i in range(6):
+        request(pool, (f"意象{i}", "x"), i + 2)
+    assert pool.stats()["tracked_pairs"] == 6
+    # 超过 max_tracked 的 1.2 倍时只保留计数最高的 max_tracked 个
+    request(pool, ("意象6", "x"), 1)
+    assert pool.stats()["tracked_pairs"] == 5
+    assert set(scores(pool)) == {(f"意象{i}", "x") for i in range(1, 6)}
+
+
+def test_batch_requests_do_not_count():
+    pool_ = BlindBoxPool(
+        generate=None, interpret=None, is_idle=lambda: True, enabled=True, top_pairs=1, top_names=1, depth=1,
+        max_images=1, min_requests=1, interval=60, image_ttl=100, decay_interval=10,
+    )
+    token = upstream_priority.set("batch")
+    try:
+        request(pool_, ("猴子", "竹笋"), 3)
+        assert pool_.take("猴子", "竹笋") is None
+    finally:
+        upstream_priority.reset(token)
+    assert pool_.stats()["tracked_pairs"] == 0
+
+
+@pytest.mark.anyio
+async def test_refill_tops_up_the_most_requested_pairs(pool, upstream):
+    request(pool, ("猴子", "竹笋"), 5)
+    request(pool, ("锦鲤", "鱼尾"), 3)
+    request(pool, ("黄鹂", "羽毛"), 2)
+    request(pool, ("雨伞", "白鹅"), 1)
+
+    await pool._refill()
+    # top_pairs=2：只预热最热门的两组，每组 depth=2 张
+    assert upstream.generated == [("猴子", "竹笋")] * 2 + [("锦鲤", "鱼尾")] * 2
+    assert pool.stats()["pooled_images"] == 4
+
+    # 图片只提供一次，取走后下一轮补齐
+    assert pool.take("猴子", "竹笋") == "https://img/猴子-竹笋/1"
+    assert pool.take("猴子", "竹笋") == "https://img/猴子-竹笋/2"
+    assert pool.take("猴子", "竹笋") is None
+    await pool._refill()
+    assert pool.stats()["pooled_images"] == 4
+    assert (pool.counters["hits"], pool.counters["misses"], pool.counters["refills"]) == (2, 1, 6)
+
+
+@pytest.mark.anyio
+async def test_pairs_below_min_requests_are_not_prewarmed(pool, upstream):
+    request(pool, ("猴子", "竹笋"), 1)
+    await pool._refill()
+    assert upstream.generated == []
+
+
+@pytest.mark.anyio
+async def test_refill_stops_when_the_upstream_is_busy(pool, upstream):
+    request(pool, ("猴子", "竹笋"), 5)
+    upstream.idle_budget = 1
+    await pool._refill()
+    assert upstream.generated == [("猴子", "竹笋")]
+
+
+@pytest.mark.anyio
+async def test_full_pool_evicts_only_less_popular_pairs(pool, upstream):
+    request(pool, ("猴子", "竹笋"), 5)
+    request(pool, ("锦鲤", "鱼尾"), 4)
+    await pool._refill()
+    assert pool.stats()["pooled_images"] == 4
+
+    # 更热门的新组合挤掉最冷门组合的图片，总数不超过 max_images
+    request(pool, ("黄鹂", "羽毛"), 10)
+    await pool._refill()
+    assert upstream.generated[-2:] == [("黄鹂", "羽毛")] * 2
+    assert pool.stats()["pooled_images"] == 4
+    assert pool.counters["evicted"] == 2
+    assert pool.take("锦鲤", "鱼尾") is None
+
+    # 不比池中组合更热门时不淘汰，也不生成
+    generated = len(upstream.generated)
+    request(pool, ("雨伞", "白鹅"), 3)
+    pool.top_pairs = 3
+    await pool._refill()
+    assert len(upstream.generated) == generated
+
+
+@pytest.mark.anyio
+async def test_expired_images_are_not_served(pool, upstream, clock):
+    request(pool, ("猴子", "竹笋"), 5)
+    await pool._refill()
+    clock.now += 100
+    assert pool.take("猴子", "竹笋") is None
+    assert pool.counters["expired"] == 2
+
+
+@pytest.mark.anyio
+async def test_stored_pairs_are_not_prewarmed(pool, upstream):
+    request(pool, ("猴子", "竹笋"), 5)
+    request(pool, ("锦鲤", "鱼尾"), 4)
+    upstream.stored.add(("猴子", "竹笋"))
+    await pool._refill()
+    assert upstream.generated == [("锦鲤", "鱼尾")] * 2
+    assert pool.counters["skipped_stored"] == 1
+
+
+@pytest.mark.anyio
+async def test_popular_names_pass_their_popularity_to_their_pairs(pool, upstream, clock):
+    for _ in range(4):
+        pool.record_name("王小鱼")
+    await pool._refresh_names()
+    assert scores(pool) == {("王小鱼1", "王小鱼2"): 4}
+    # 每个衰减周期最多重新解析一次
+    await pool._refresh_names()
+    assert pool.counters["name_refreshes"] == 1
+
+
+def test_prewarming_needs_half_the_image_slots_free(monkeypatch):
+    service = generate_image.doubao_vlm_service
+    monkeypatch.setattr(service, "max_concurrency", 8)
+    monkeypatch.setattr(service, "active_calls", 3)
+    assert generate_image._image_upstream_idle()
+    monkeypatch.setattr(service, "active_calls", 4)
+    assert not generate_image._image_upstream_idle()
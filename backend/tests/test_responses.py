@@ -0,0 +1,69 @@
+# backend/tests/test_responses.py
+from typing import List
+import httpx
+import pytest
+from fastapi import FastAPI
+from pydantic import BaseModel, field_validator
+from api.responses import json_response
+
+validated: List[str] = []
+
+
+class Item(BaseModel):
+    imagery: str
+    score: int
+
+    @field_validator("imagery")
+    @classmethod
+    def count(cls, value: str) -> str:
+        validated.append(value)
+        return value
+
+
+class Items(BaseModel):
+    items: List[Item]
+
+
+@pytest.fixture
+def client():
+    validated.clear()
+    app = FastAPI()
+    result = {"items": [{"imagery": "猴子", "score": 88}]}
+
+    @app.get("/plain", response_model=Items)
+    async def plain():
+        return result
+
+    @app.get("/dict", response_model=Items)
+    async def as_dict():
+        return json_response(result)
+
+    @app.get("/model", response_model=Items)
+    async def as_model():
+        return json_response(Items.model_validate(result), status_code=201)
+
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test")
+
+
+@pytest.mark.anyio
+async def test_response_model_validation_is_skipped(client):
+    async with client:
+        # 直接返回数据时 FastAPI 会按 response_model 再校验一次
+        assert (await client.get("/plain")).json() == {"items": [{"imagery": "猴子", "score": 88}]}
+        assert validated == ["猴子"]
+
+        validated.clear()
+        response = await client.get("/dict")
+        assert response.json() == {"items": [{"imagery": "猴子", "score": 88}]}
+        assert response.headers["content-type"] == "application/json"
+        assert validated == []
+
+
+@pytest.mark.anyio
+async def test_models_are_serialized_by_pydantic(client):
+    async with client:
+        response = await client.get("/model")
+        assert response.status_code == 201
+        # 只在构造模型时校验一次，中文不转义
+        assert validated == ["猴子"]
+        assert response.content == '{"items":[{"imagery":"猴子","score":88}]}'.encode()
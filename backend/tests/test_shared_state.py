@@ -0,0 +1,169 @@
+# backend/tests/test_shared_state.py
+import asyncio
+import json
+import time
+import pytest
+from services.jobs import JobStore
+from services.shared_state import SharedStateStore, SharedTokenBucket, decode_error, encode_error
+from services.singleflight import SingleFlight
+from services.upstream import UpstreamError
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "shared.sqlite3")
+
+
+def test_claim_is_exclusive_while_the_lease_lives(db_path):
+    # 两个实例各自持有连接，相当于同一主机上的两个 worker 进程
+    first, second = SharedStateStore(db_path), SharedStateStore(db_path)
+    is_leader, call_id = first.call_claim("key", lease=30)
+    assert is_leader
+    assert second.call_claim("key", lease=30) == (False, call_id)
+    assert first.call_claim("other", lease=30)[0]
+
+
+def test_renew_extends_the_lease(db_path):
+    store = SharedStateStore(db_path)
+    _, call_id = store.call_claim("key", lease=0.05)
+    time.sleep(0.03)
+    assert store.call_renew("key", call_id, lease=0.05)
+    time.sleep(0.03)
+    # 续约后租约仍然有效，其他进程只能等待
+    assert SharedStateStore(db_path).call_claim("key", lease=30) == (False, call_id)
+
+
+def test_expired_lease_is_taken_over(db_path):
+    crashed, survivor = SharedStateStore(db_path), SharedStateStore(db_path)
+    _, old_call = crashed.call_claim("key", lease=0.01)
+    time.sleep(0.02)
+    is_leader, new_call = survivor.call_claim("key", lease=30)
+    assert is_leader and new_call != old_call
+
+    # 旧领导者的续约与结果都作用不到新的调用上
+    assert not crashed.call_renew("key", old_call, lease=30)
+    crashed.call_finish("key", old_call, json.dumps("stale"), None, keep=30)
+    assert survivor.call_poll("key", new_call)[0] == 0
+    assert crashed.call_poll("key", old_call) is None
+
+
+def test_finished_and_abandoned_calls_are_not_reused(db_path):
+    store = SharedStateStore(db_path)
+    _, call_id = store.call_claim("key", lease=30)
+    store.call_finish("key", call_id, json.dumps({"ok": True}), None, keep=30)
+    done, result, error, _ = store.call_poll("key", call_id)
+    assert (done, json.loads(result), error) == (1, {"ok": True}, None)
+    assert not store.call_renew("key", call_id, lease=30)
+    assert store.call_claim("key", lease=30)[0]
+
+    _, call_id = store.call_claim("abandoned", lease=30)
+    store.call_abandon("abandoned", call_id)
+    assert store.call_poll("abandoned", call_id) is None
+    assert store.call_claim("abandoned", lease=30)[0]
+
+
+def test_errors_survive_the_round_trip():
+    error = decode_error(encode_error(UpstreamError("throttled", status_code=429, retry_after=2.0)))
+    assert isinstance(error, UpstreamError)
+    assert (str(error), error.status_code, error.retry_after, error.retryable) == ("throttled", 429, 2.0, True)
+
+
+@pytest.mark.anyio
+async def test_shared_bucket_state_is_shared_across_processes(db_path):
+    first = SharedTokenBucket(SharedStateStore(db_path), "llm", rate=10, burst=5, min_rate=1)
+    second = SharedTokenBucket(SharedStateStore(db_path), "llm", rate=10, burst=5, min_rate=1)
+    for _ in range(3):
+        await first.acquire()
+    state = await second.state()
+    assert state["shared"] is True
+    assert 2 <= state["tokens"] < 3
+    assert state["rate"] == 10
+
+
+@pytest.mark.anyio
+async def test_shared_bucket_update_errors_are_logged(tmp_path, capsys):
+    # 路径是一个目录，SQLite 无法打开
+    bucket = SharedTokenBucket(SharedStateStore(str(tmp_path)), "llm", rate=10, burst=5, min_rate=1)
+    bucket.on_throttle(retry_after=1.0)
+    for _ in range(100):
+        if "Shared token bucket llm update failed" in capsys.readouterr().out:
+            break
+        await asyncio.sleep(0.01)
+    else:
+        raise AssertionError("the failed update was not logged")
+
+
+def test_followers_in_other_processes_share_the_result(db_path):
+    async def main():
+        leader = SingleFlight(shared=SharedStateStore(db_path), lease=5)
+        follower = SingleFlight(shared=SharedStateStore(db_path), lease=5)
+        calls = 0
+
+        async def upstream():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.2)
+            return {"calls": calls}
+
+        first = asyncio.create_task(leader.do("key", upstream))
+        await asyncio.sleep(0.05)
+        second = asyncio.create_task(follower.do("key", upstream))
+        assert await asyncio.gather(first, second) == [{"calls": 1}, {"calls": 1}]
+        assert calls == 1
+        assert follower.counters["shared_collapsed"] == 1
+
+    asyncio.run(main())
+
+
+def test_leader_that_lost_its_lease_does_not_publish(db_path):
+    async def main():
+        store = SharedStateStore(db_path)
+        flight = SingleFlight(shared=store, lease=0.06)
+
+        async def upstream():
+            # 调用期间另一个进程接手了这个 key（例如本进程卡顿导致租约过期）
+            await asyncio.sleep(0.01)
+            with store._lock:
+                store._connection().execute("UPDATE inflight_calls SET call_id = 'other' WHERE key = 'key'")
+            await asyncio.sleep(0.1)
+            return "local"
+
+        assert await flight.do("key", upstream) == "local"
+        assert flight.counters["lease_lost"] == 1
+        assert store.call_poll("key", "other")[0] == 0
+
+    asyncio.run(main())
+
+
+def test_job_items_are_claimed_by_one_process(db_path):
+    first, second = JobStore(db_path, lease=30), JobStore(db_path, lease=30)
+    job_id = first.create(["张三", "李四"])
+
+    assert first.claim_item(job_id, 0) == "张三"
+    assert second.claim_item(job_id, 0) is None
+    assert second.claim_item(job_id, 1) == "李四"
+    # 持有租约的条目不会作为未完成条目交给其他进程
+    assert second.unfinished_items() == []
+
+    assert not second.set_item(job_id, 0, "succeeded", result="{}")
+    assert first.set_item(job_id, 0, "succeeded", result="{}")
+    assert second.set_item(job_id, 1, "failed", error="boom")
+    job = first.get(job_id)
+    assert (job["status"], job["succeeded"], job["failed"]) == ("completed", 1, 1)
+
+
+def test_expired_job_item_is_taken_over(db_path):
+    crashed, survivor = JobStore(db_path, lease=0.05), JobStore(db_path, lease=30)
+    job_id = crashed.create(["王五"])
+    assert crashed.claim_item(job_id, 0) == "王五"
+    assert crashed.renew_item(job_id, 0)
+    assert survivor.unfinished_items() == []
+
+    time.sleep(0.06)
+    assert survivor.unfinished_items() == [(job_id, 0)]
+    assert survivor.claim_item(job_id, 0) == "王五"
+    # 原进程失去租约：续约与写结果都不生效
+    assert not crashed.renew_item(job_id, 0)
+    assert not crashed.set_item(job_id, 0, "succeeded", result="stale")
+    assert survivor.set_item(job_id, 0, "succeeded", result="fresh")
+    assert [row for page in survivor.iter_results(job_id) for row in page] == [(0, "王五", "succeeded", "fresh", None)]
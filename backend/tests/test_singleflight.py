@@ -0,0 +1,113 @@
+# backend/tests/test_singleflight.py
+import asyncio
+import pytest
+from services.singleflight import SingleFlight, make_request_key
+
+
+class SlowUpstream:
+    """An upstream call that runs until released, recording how often it was started and cancelled."""
+
+    def __init__(self):
+        self.started = 0
+        self.cancelled = 0
+        self.release = asyncio.Event()
+
+    async def __call__(self):
+        self.started += 1
+        try:
+            await self.release.wait()
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        return f"result {self.started}"
+
+
+def test_request_key_ignores_dict_order():
+    assert make_request_key({"a": 1, "b": [1, 2]}) == make_request_key({"b": [1, 2], "a": 1})
+    assert make_request_key({"a": 1}) != make_request_key({"a": 2})
+
+
+def test_concurrent_calls_share_one_upstream_call():
+    async def main():
+        flight, upstream = SingleFlight(), SlowUpstream()
+        waiters = [asyncio.create_task(flight.do("key", upstream)) for _ in range(5)]
+        await asyncio.sleep(0)
+        assert flight.stats()["in_flight"] == 1
+        upstream.release.set()
+        assert await asyncio.gather(*waiters) == ["result 1"] * 5
+        assert upstream.started == 1
+        stats = flight.stats()
+        assert (stats["calls"], stats["upstream_calls"], stats["collapsed"], stats["in_flight"]) == (5, 1, 4, 0)
+
+        # 完成之后的调用不复用旧结果
+        assert await flight.do("key", upstream) == "result 2"
+
+    asyncio.run(main())
+
+
+def test_errors_are_shared():
+    async def main():
+        flight = SingleFlight()
+        calls = 0
+
+        async def failing():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            raise RuntimeError("upstream failed")
+
+        results = await asyncio.gather(*(flight.do("key", failing) for _ in range(3)), return_exceptions=True)
+        assert calls == 1
+        assert all(isinstance(r, RuntimeError) for r in results)
+
+    asyncio.run(main())
+
+
+def test_cancelled_waiter_does_not_cancel_the_call():
+    async def main():
+        flight, upstream = SingleFlight(), SlowUpstream()
+        first = asyncio.create_task(flight.do("key", upstream))
+        second = asyncio.create_task(flight.do("key", upstream))
+        await asyncio.sleep(0)
+
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        upstream.release.set()
+        assert await second == "result 1"
+        assert upstream.cancelled == 0
+        assert flight.counters["abandoned"] == 0
+
+    asyncio.run(main())
+
+
+def test_last_waiter_leaving_cancels_the_call():
+    async def main():
+        flight, upstream = SingleFlight(), SlowUpstream()
+        waiters = [asyncio.create_task(flight.do("key", upstream)) for _ in range(2)]
+        await asyncio.sleep(0)
+
+        for waiter in waiters:
+            waiter.cancel()
+        await asyncio.gather(*waiters, return_exceptions=True)
+        await asyncio.sleep(0)
+        assert upstream.cancelled == 1
+        assert flight.counters["abandoned"] == 1
+        assert flight.stats()["in_flight"] == 0
+
+        # 被放弃的调用不会留给后来的请求：它们发起新的上游调用
+        upstream.release.set()
+        assert await flight.do("key", upstream) == "result 2"
+
+    asyncio.run(main())
+
+
+def test_disabled_calls_upstream_every_time():
+    async def main():
+        flight, upstream = SingleFlight(enabled=False), SlowUpstream()
+        upstream.release.set()
+        await asyncio.gather(*(flight.do("key", upstream) for _ in range(3)))
+        assert upstream.started == 3
+        assert flight.counters["upstream_calls"] == 3
+
+    asyncio.run(main())
@@ -0,0 +1,199 @@
+# backend/tests/test_upstream.py
+import asyncio
+import time
+import pytest
+from services.llm import DoubaoLLMService
+from services.upstream import (
+    AdaptiveTokenBucket,
+    CircuitBreaker,
+    UpstreamController,
+    UpstreamError,
+    UpstreamUnavailableError,
+)
+
+PAYLOAD = {"model": "test", "messages": [{"role": "user", "content": "你好"}]}
+
+
+@pytest.fixture
+def controller(clock) -> UpstreamController:
+    return UpstreamController(
+        name="test", rate=100, burst=100, min_rate=1, max_retries=0, retry_base_delay=0.01, retry_max_delay=0.01,
+        failure_threshold=3, reset_timeout=60, clock=clock,
+    )
+
+
+def llm_service(client) -> DoubaoLLMService:
+    service = DoubaoLLMService()
+    service.client = client
+    # fake_ark 客户端带有 base_url，相对路径即可
+    service.endpoint = "/api/v3/chat/completions"
+    return service
+
+
+def test_breaker_opens_after_consecutive_failures(clock):
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=60, clock=clock)
+    for _ in range(2):
+        assert breaker.allow()
+        breaker.record_failure()
+    assert breaker.status == "closed"
+    # 成功会清零连续失败计数
+    breaker.record_success()
+    for _ in range(3):
+        assert breaker.allow()
+        breaker.record_failure()
+    assert breaker.status == "open"
+    assert breaker.times_opened == 1
+    assert not breaker.allow()
+    assert breaker.retry_after() == 60
+    clock.now += 59
+    assert breaker.retry_after() == 1 and not breaker.allow()
+
+
+def test_half_open_lets_a_single_probe_through(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60, clock=clock)
+    breaker.record_failure()
+    assert not breaker.allow()
+    clock.now += 60
+
+    assert breaker.allow()
+    assert breaker.status == "half_open"
+    assert not breaker.allow()
+    # 没有结论的探测（如被取消）释放名额，下一个调用成为探测
+    breaker.release()
+    assert breaker.allow()
+    assert not breaker.allow()
+
+    breaker.record_success()
+    assert breaker.status == "closed"
+    assert breaker.allow() and breaker.allow()
+
+
+def test_failed_probe_reopens_the_breaker(clock):
+    breaker = CircuitBreaker(failure_threshold=5, reset_timeout=60, clock=clock)
+    for _ in range(5):
+        breaker.record_failure()
+    clock.now += 60
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.status == "open"
+    assert breaker.times_opened == 2
+    assert not breaker.allow()
+
+
+def test_bucket_throttle_halves_the_rate_and_pauses():
+    bucket = AdaptiveTokenBucket(rate=10, burst=5, min_rate=2)
+    bucket.on_throttle(retry_after=0.2)
+    assert bucket.rate == 5
+    assert bucket.tokens <= 0
+    assert bucket.paused_until - time.monotonic() > 0.1
+    bucket.on_throttle(retry_after=None)
+    bucket.on_throttle(retry_after=None)
+    assert bucket.rate == 2
+    assert bucket.throttles == 3
+
+    # 每次成功加回 max_rate 的 5%，不超过 max_rate
+    for _ in range(10):
+        bucket.on_success()
+    assert bucket.rate == pytest.approx(7)
+    for _ in range(10):
+        bucket.on_success()
+    assert bucket.rate == 10
+
+
+@pytest.mark.anyio
+async def test_bucket_waits_out_the_pause():
+    bucket = AdaptiveTokenBucket(rate=1000, burst=10, min_rate=1)
+    bucket.on_throttle(retry_after=0.1)
+    start = time.monotonic()
+    await bucket.acquire()
+    assert time.monotonic() - start >= 0.09
+
+
+@pytest.mark.anyio
+async def test_throttled_upstream_slows_down_and_opens_the_breaker(fake_ark, controller):
+    async with fake_ark("--rate-429", "1", "--retry-after", "0.01") as client:
+        service = llm_service(client)
+        for expected_rate in (50, 25, 12.5):
+            with pytest.raises(UpstreamError) as error:
+                await controller.call(lambda: service._complete(PAYLOAD))
+            assert error.value.status_code == 429
+            assert error.value.retry_after == 0.01
+            assert controller.bucket.rate == expected_rate
+
+        assert controller.breaker.status == "open"
+        with pytest.raises(UpstreamUnavailableError):
+            await controller.call(lambda: service._complete(PAYLOAD))
+        assert controller.counters["rejected"] == 1
+        assert (await client.get("/stats")).json()["counters"]["llm.429"] == 3
+
+
+@pytest.mark.anyio
+async def test_retries_recover_from_transient_errors(fake_ark, controller):
+    controller.max_retries = 2
+    async with fake_ark("--rate-500", "1") as failing, fake_ark() as healthy:
+        service = llm_service(failing)
+        attempts = 0
+
+        async def call():
+            nonlocal attempts
+            attempts += 1
+            # 前两次打到返回 500 的上游，第三次成功
+            service.client = failing if attempts < 3 else healthy
+            return await service._complete(PAYLOAD)
+
+        assert await controller.call(call) == "哇，这对组合简直是好运磁铁！运气值 88 分，今天的你闪闪发光，好事正排队向你走来～"
+        assert attempts == 3
+        assert controller.counters["retries"] == 2
+        assert controller.breaker.status == "closed"
+        assert controller.breaker.consecutive_failures == 0
+
+
+@pytest.mark.anyio
+async def test_recovery_after_the_breaker_opens(fake_ark, clock):
+    controller = UpstreamController(
+        name="test", rate=100, burst=100, min_rate=10, max_retries=0, retry_base_delay=0.01, retry_max_delay=0.01,
+        failure_threshold=2, reset_timeout=60, clock=clock,
+    )
+    async with fake_ark("--rate-429", "1", "--retry-after", "0") as throttled, fake_ark() as healthy:
+        service = llm_service(throttled)
+        for _ in range(2):
+            with pytest.raises(UpstreamError):
+                await controller.call(lambda: service._complete(PAYLOAD))
+        assert controller.breaker.status == "open"
+        assert controller.bucket.rate == 25
+
+        clock.now += 60
+        # 半开探测成功后熔断关闭，限流速率随后续成功逐步恢复
+        service.client = healthy
+        await controller.call(lambda: service._complete(PAYLOAD))
+        assert controller.breaker.status == "closed"
+        for _ in range(20):
+            await controller.call(lambda: service._complete(PAYLOAD))
+        assert controller.bucket.rate == 100
+
+
+def test_non_retryable_errors_keep_the_breaker_closed(controller):
+    controller.breaker.failure_threshold = 1
+    controller.record_failure(UpstreamError("bad request", status_code=400))
+    assert controller.breaker.status == "closed"
+    assert controller.health(60) == {"samples": 1, "error_rate": 0.0, "p95": None}
+
+
+@pytest.mark.anyio
+async def test_cancelled_token_wait_releases_the_half_open_probe(controller, clock):
+    controller.breaker.failure_threshold = 1
+    controller.breaker.record_failure()
+    clock.now += 60
+    # 令牌桶暂停时，获得探测名额的调用停在令牌等待上
+    controller.bucket.on_throttle(retry_after=60)
+    waiting = asyncio.create_task(controller.acquire())
+    await asyncio.sleep(0)
+    assert controller.breaker.status == "half_open"
+    assert not controller.breaker.allow()
+
+    waiting.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiting
+    # 下一个调用仍然可以作为探测
+    assert controller.breaker.allow()
+    assert controller.breaker.status == "half_open"
@@ -0,0 +1,55 @@
+# backend/tests/test_vlm.py
+import asyncio
+from typing import List
+import httpx
+import pytest
+from config import Config
+from services.upstream import upstream_priority
+from services.vlm import DoubaoSeedreamService
+from tools.fake_ark import create_app, parse_args
+
+
+class GatedTransport(httpx.AsyncBaseTransport):
+    """Holds every request until the gate opens, recording the priority of the requests in flight."""
+
+    def __init__(self):
+        self.gate = asyncio.Event()
+        self.in_flight: List[str] = []
+        args = parse_args(["--image-latency", "0", "--public-url", "http://fake-ark"])
+        self.fake_ark = httpx.ASGITransport(app=create_app(args))
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        priority = upstream_priority.get()
+        self.in_flight.append(priority)
+        try:
+            await self.gate.wait()
+            return await self.fake_ark.handle_async_request(request)
+        finally:
+            self.in_flight.remove(priority)
+
+
+async def generate(service: DoubaoSeedreamService, prompt: str, priority: str) -> List[str]:
+    upstream_priority.set(priority)
+    return await service.generate_images(prompt)
+
+
+@pytest.mark.anyio
+async def test_batch_calls_leave_slots_to_interactive_calls(monkeypatch):
+    monkeypatch.setattr(Config, "IMAGE_GENERATION_MAX_CONCURRENCY", 4)
+    monkeypatch.setattr(Config, "BATCH_IMAGE_MAX_CONCURRENCY", 1)
+    transport = GatedTransport()
+    service = DoubaoSeedreamService()
+    service.client = httpx.AsyncClient(transport=transport, base_url="http://fake-ark")
+    service.endpoint = "/api/v3/images/generations"
+
+    batch = [asyncio.create_task(generate(service, f"batch {i}", "batch")) for i in range(6)]
+    await asyncio.sleep(0.01)
+    assert transport.in_flight == ["batch"]
+
+    interactive = [asyncio.create_task(generate(service, f"interactive {i}", "interactive")) for i in range(3)]
+    await asyncio.sleep(0.01)
+    assert sorted(transport.in_flight) == ["batch", "interactive", "interactive", "interactive"]
+
+    transport.gate.set()
+    results = await asyncio.gather(*batch, *interactive)
+    assert all(len(urls) == 1 for urls in results)
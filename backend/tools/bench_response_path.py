@@ -0,0 +1,157 @@
+# backend/tools/bench_response_path.py
+"""
+Micro-benchmark of the CPU spent building and serializing a name blind box response.
+
+Compares the current response path (LLM output validated once with model_validate_json, image
+URLs validated once at the Seedream boundary, items passed on as plain dicts and written by
+orjson) with the previous one, reproduced here: parse_raw on the LLM output, HttpUrl + ImageResponse
+per image, NameImagesResponseItem per item, NameImagesResponse, then FastAPI's response_model
+re-validation and JSONResponse. Upstream calls are replaced by ready-made results, so only the
+response path is measured.
+
+Each path is measured twice: called directly (build + serialize) and end to end through a FastAPI
+app over ASGI with --concurrency requests in flight. Reported numbers are process CPU time per
+request (time.process_time), the best of --repeat runs.
+
+Usage (from backend/):
+    python -m tools.bench_response_path --requests 5000 --concurrency 200
+"""
+import argparse
+import asyncio
+import json
+import time
+import warnings
+from typing import Any, Callable, Dict, List
+import httpx
+from fastapi import FastAPI
+from pydantic import HttpUrl
+from api.generate_image import _blindbox_item
+from api.responses import json_response
+from models.user_models import ImageResponse, InterpretNameLLMResponse, NameImagesResponse, NameImagesResponseItem, NameInput
+from services.vlm import _IMAGE_URLS
+
+LLM_OUTPUT = json.dumps([
+    {"id": 1, "imagery1": "孙悟空的小猴", "imagery2": "鲜嫩竹笋"},
+    {"id": 2, "imagery1": "红色锦鲤", "imagery2": "灵动的小鱼尾"},
+    {"id": 3, "imagery1": "黄鹂鸟", "imagery2": "洁白的羽毛"},
+], ensure_ascii=False)
+
+# 与 Seedream 返回的临时链接长度相当的 URL
+IMAGE_URL = (
+    "https://ark-content-generation-cn-beijing.tos-cn-beijing.volces.com/doubao-seedream-3-0-t2i/"
+    "0217{n}a8f3c2e1d4b5a6978.jpeg?X-Tos-Algorithm=TOS4-HMAC-SHA256&X-Tos-Credential=AKLTexample"
+    "%2F20250101%2Fcn-beijing%2Ftos%2Frequest&X-Tos-Date=20250101T000000Z&X-Tos-Expires=86400"
+    "&X-Tos-Signature=3f9a0c1d2e3f4a5b6c7d8e9f0a1b2c3d4e5f6a7b8c9d0e1f2a3b4c5d6e7f8a9b0&X-Tos-SignedHeaders=host"
+)
+
+
+def legacy_items() -> List[NameImagesResponseItem]:
+    """The previous path: every layer wraps the result in its own model."""
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", DeprecationWarning)
+        interpretations = InterpretNameLLMResponse.parse_raw(LLM_OUTPUT)
+    items = []
+    for item in interpretations.root:
+        urls = [IMAGE_URL.format(n=item.id)]
+        image_response = ImageResponse(images=[HttpUrl(url) for url in urls])
+        items.append(NameImagesResponseItem(
+            id=item.id, imagery1=item.imagery1, imagery2=item.imagery2, image_url=image_response.images[0]
+        ))
+    return items
+
+
+def current_items() -> List[Dict[str, Any]]:
+    """The current path: validate at the boundaries, then pass plain values on."""
+    interpretations = InterpretNameLLMResponse.model_validate_json(LLM_OUTPUT)
+    items = []
+    for item in interpretations.root:
+        url = str(_IMAGE_URLS.validate_python([IMAGE_URL.format(n=item.id)])[0])
+        items.append(_blindbox_item(item, image_url=url))
+    return items
+
+
+def legacy_direct() -> bytes:
+    # response_model 的处理：转为 dict、按响应模型重新校验、jsonable_encoder，再用 json.dumps 输出
+    response = NameImagesResponse(root=legacy_items())
+    revalidated = NameImagesResponse.model_validate(response.model_dump())
+    return json.dumps(revalidated.model_dump(mode="json"), ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def current_direct() -> bytes:
+    return json_response(current_items()).body
+
+
+def create_app() -> FastAPI:
+    app = FastAPI()
+
+    @app.post("/legacy", response_model=NameImagesResponse)
+    async def legacy(input: NameInput):
+        return NameImagesResponse(root=legacy_items())
+
+    @app.post("/current", response_model=NameImagesResponse)
+    async def current(input: NameInput):
+        return json_response(current_items())
+
+    return app
+
+
+def measure_direct(fn: Callable[[], bytes], requests: int) -> float:
+    start = time.process_time()
+    for _ in range(requests):
+        fn()
+    return (time.process_time() - start) / requests
+
+
+async def measure_asgi(client: httpx.AsyncClient, path: str, requests: int, concurrency: int) -> float:
+    remaining = iter(range(requests))
+
+    async def worker():
+        for _ in remaining:
+            response = await client.post(path, json={"name": "王小鱼"})
+            response.raise_for_status()
+
+    start = time.process_time()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return (time.process_time() - start) / requests
+
+
+async def main_async(args: argparse.Namespace):
+    # 两条路径的输出必须一致，否则比较没有意义
+    assert json.loads(legacy_direct()) == json.loads(current_direct())
+
+    results: Dict[str, Dict[str, float]] = {"direct": {}, "asgi": {}}
+    transport = httpx.ASGITransport(app=create_app())
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for name in ("legacy", "current"):
+            fn = legacy_direct if name == "legacy" else current_direct
+            # 预热（导入、校验器构建等一次性开销）
+            measure_direct(fn, 100)
+            await measure_asgi(client, f"/{name}", 100, args.concurrency)
+            results["direct"][name] = min(measure_direct(fn, args.requests) for _ in range(args.repeat))
+            results["asgi"][name] = min(
+                [await measure_asgi(client, f"/{name}", args.requests, args.concurrency) for _ in range(args.repeat)]
+            )
+
+    print(f"CPU per request ({args.requests} requests, concurrency {args.concurrency}, best of {args.repeat}):")
+    for mode, label in (("direct", "response path only"), ("asgi", "end to end over ASGI")):
+        legacy, current = results[mode]["legacy"], results[mode]["current"]
+        print(
+            f"  {label:<22} legacy {legacy * 1e6:8.1f} us   current {current * 1e6:8.1f} us   "
+            f"saved {(legacy - current) * 1e6:8.1f} us ({(1 - current / legacy) * 100:.0f}%)"
+        )
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the CPU cost of the blind box response path.")
+    parser.add_argument("--requests", type=int, default=5000, help="Requests per measurement.")
+    parser.add_argument("--concurrency", type=int, default=200, help="Requests in flight for the ASGI measurement.")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per measurement; the best one is reported.")
+    parser.add_argument("--json", default=None, help="Also write the results (seconds per request) to this JSON file.")
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+# backend/tools/benchmark.py
+"""
+Load-test harness for the backend API.
+
+Drives each scenario with a fixed number of requests at a target concurrency and reports latency
+percentiles, throughput, error counts and, when --fake-ark points at tools/fake_ark.py, the number
+of upstream calls each scenario caused (taken from the fake server's /stats before and after).
+
+Usage (from backend/, with the backend running against tools/fake_ark.py):
+    python -m tools.benchmark --scenario interpret_name --scenario generate_name_images \\
+        --concurrency 20 --requests 200 --names 50 --fake-ark http://127.0.0.1:9000
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import httpx
+from services.hedging import LatencyTracker
+
+SURNAMES = "王李张刘陈杨黄赵吴周徐孙马朱胡郭何林罗高"
+GIVEN = "小鱼雨晨星宇欣怡子涵梓轩浩然一诺佳琪明月思远"
+IMAGERY = ["孙悟空的小猴", "鲜嫩竹笋", "红色锦鲤", "灵动的小鱼尾", "黄鹂鸟", "羽毛", "雨伞", "白鹅", "星星兔", "松果"]
+
+
+def make_names(count: int, rng: random.Random) -> List[str]:
+    names = set()
+    while len(names) < count:
+        names.add(rng.choice(SURNAMES) + "".join(rng.choice(GIVEN) for _ in range(rng.choice((1, 2)))))
+    return sorted(names)
+
+
+def make_pairs(count: int, rng: random.Random) -> List[Tuple[str, str]]:
+    pairs = set()
+    while len(pairs) < min(count, len(IMAGERY) * (len(IMAGERY) - 1)):
+        pairs.add(tuple(rng.sample(IMAGERY, 2)))
+    return sorted(pairs)
+
+
+def build_scenarios(args: argparse.Namespace, rng: random.Random) -> Dict[str, Tuple[str, Callable[[], Dict[str, Any]]]]:
+    names = make_names(args.names, rng)
+    pairs = make_pairs(args.names, rng)
+
+    def name_body() -> Dict[str, Any]:
+        return {"name": rng.choice(names)}
+
+    def pair_body() -> Dict[str, Any]:
+        imagery1, imagery2 = rng.choice(pairs)
+        return {"imagery1": imagery1, "imagery2": imagery2}
+
+    return {
+        "interpret_name": ("/api/interpret_name", name_body),
+        "generate_image": ("/api/generate_image", pair_body),
+        "generate_name_images": ("/api/generate_name_images", name_body),
+        "generate_feedback": ("/api/generate_feedback", pair_body),
+    }
+
+
+async def upstream_counters(client: httpx.AsyncClient, fake_ark: Optional[str]) -> Counter:
+    if not fake_ark:
+        return Counter()
+    try:
+        response = await client.get(f"{fake_ark.rstrip('/')}/stats")
+        return Counter(response.json()["counters"])
+    except Exception as e:
+        print(f"Could not read fake Ark stats: {e}")
+        return Counter()
+
+
+async def run_scenario(
+    client: httpx.AsyncClient, args: argparse.Namespace, path: str, make_body: Callable[[], Dict[str, Any]]
+) -> Dict[str, Any]:
+    latency = LatencyTracker(window=args.requests)
+    statuses: Counter = Counter()
+    remaining = iter(range(args.requests))
+
+    async def worker():
+        for _ in remaining:
+            start = time.monotonic()
+            try:
+                response = await client.post(f"{args.base_url.rstrip('/')}{path}", json=make_body())
+                status = str(response.status_code)
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            if status == "200":
+                latency.record(time.monotonic() - start)
+            statuses[status] += 1
+
+    before = await upstream_counters(client, args.fake_ark)
+    start = time.monotonic()
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    elapsed = time.monotonic() - start
+    after = await upstream_counters(client, args.fake_ark)
+
+    upstream = after - before
+    return {
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(statuses["200"] / elapsed, 2) if elapsed else 0.0,
+        "latency_s": latency.summary(),
+        "statuses": dict(statuses),
+        "upstream_calls": {key: upstream[key] for key in sorted(upstream)},
+    }
+
+
+def print_report(name: str, result: Dict[str, Any]):
+    latency = result["latency_s"]
+    print(f"\n== {name} ({result['requests']} requests, concurrency {result['concurrency']})")
+    print(f"  elapsed     {result['elapsed_s']}s, throughput {result['throughput_rps']} req/s (200s only)")
+    print(f"  latency     p50 {latency['p50']}s  p95 {latency['p95']}s  p99 {latency['p99']}s")
+    print(f"  statuses    {result['statuses']}")
+    if result["upstream_calls"]:
+        print(f"  upstream    {result['upstream_calls']}")
+
+
+async def main_async(args: argparse.Namespace):
+    rng = random.Random(args.seed)
+    scenarios = build_scenarios(args, rng)
+    limits = httpx.Limits(max_connections=args.concurrency + 2, max_keepalive_connections=args.concurrency + 2)
+    results = {}
+    async with httpx.AsyncClient(timeout=args.timeout, limits=limits) as client:
+        for name in args.scenario or list(scenarios):
+            path, make_body = scenarios[name]
+            results[name] = await run_scenario(client, args, path, make_body)
+            print_report(name, results[name])
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the backend API at a target concurrency.")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000", help="Backend base URL.")
+    parser.add_argument("--fake-ark", default=None, help="Base URL of tools/fake_ark.py, to count upstream calls.")
+    parser.add_argument("--scenario", action="append",
+                        choices=["interpret_name", "generate_image", "generate_name_images", "generate_feedback"],
+                        help="Scenario to run (repeatable; default: all, in order).")
+    parser.add_argument("--concurrency", type=int, default=10, help="Concurrent in-flight requests.")
+    parser.add_argument("--requests", type=int, default=100, help="Requests per scenario.")
+    parser.add_argument("--names", type=int, default=50, help="Distinct names (and imagery pairs) to draw from.")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed for reproducible request mixes.")
+    parser.add_argument("--timeout", type=float, default=300.0, help="Per-request timeout in seconds.")
+    parser.add_argument("--json", default=None, help="Also write the results to this JSON file.")
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
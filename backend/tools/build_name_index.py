@@ -0,0 +1,149 @@
+# backend/tools/build_name_index.py
+"""
+Builds the homophone index used by the local name interpretation fast path.
+
+Reads validated interpretations from the name interpretation cache (current prompt version only)
+and, optionally, JSONL exports with one {"name": ..., "combinations": [...]} object per line.
+Each imagery of an interpretation is attributed to the name characters it matches, either
+literally ("小鱼" → "灵动的小鱼尾") or by pinyin ("孙" → "鲜嫩竹笋"). Candidates seen for a
+character in at least --min-support different names are kept, best supported first.
+
+Usage (from backend/):
+    python -m tools.build_name_index [--jsonl export.jsonl ...] [--output data/name_index.json]
+"""
+import argparse
+import json
+import os
+import sqlite3
+import tempfile
+from collections import Counter, defaultdict
+from typing import Dict, Iterator, List, Tuple
+from config import Config
+from models.user_models import InterpretNameLLMResponse
+from prompts.llm_prompts import INTERPRET_NAME_PROMPT_VERSION
+from services.name_cache import normalize_name
+from services.name_index import char_syllables, name_syllables, pinyin
+
+
+def iter_cached_interpretations(path: str) -> Iterator[Tuple[str, str]]:
+    """Yields (normalized name, payload) rows of the current prompt version from the name cache."""
+    if not os.path.exists(path):
+        return
+    prefix = f"{INTERPRET_NAME_PROMPT_VERSION}:"
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        rows = conn.execute(
+            "SELECT key, payload FROM name_interpretations WHERE key LIKE ? ESCAPE '\\'",
+            (prefix.replace("_", "\\_").replace("%", "\\%") + "%",),
+        )
+        for key, payload in rows:
+            yield key[len(prefix):], payload
+    finally:
+        conn.close()
+
+
+def iter_jsonl_interpretations(path: str) -> Iterator[Tuple[str, str]]:
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                yield normalize_name(record["name"]), json.dumps(record["combinations"], ensure_ascii=False)
+
+
+def build_index(records: Iterator[Tuple[str, str]], min_support: int, max_candidates: int) -> Dict:
+    # support[char][imagery] = 支持该归属的不同名字数
+    support: Dict[str, Counter] = defaultdict(Counter)
+    char_readings: Dict[str, Counter] = defaultdict(Counter)
+    names = skipped = 0
+    seen = set()
+
+    for name, payload in records:
+        try:
+            combinations = InterpretNameLLMResponse.model_validate_json(payload).root
+        except Exception:
+            skipped += 1
+            continue
+        names += 1
+        syllables = name_syllables(name)
+        for char, syllable in zip(name, syllables):
+            if syllable is not None:
+                char_readings[char][syllable] += 1
+        for combination in combinations:
+            for imagery in (combination.imagery1, combination.imagery2):
+                imagery_syllables = char_syllables(imagery)
+                for char, syllable in zip(name, syllables):
+                    if char in imagery or (syllable is not None and syllable in imagery_syllables):
+                        # 同一个名字的多个变体只计一次支持
+                        if (name, char, imagery) not in seen:
+                            seen.add((name, char, imagery))
+                            support[char][imagery] += 1
+
+    def vetted(counter: Counter) -> List[str]:
+        ranked = sorted(counter.items(), key=lambda kv: (-kv[1], kv[0]))
+        return [imagery for imagery, count in ranked if count >= min_support][:max_candidates]
+
+    # 同音字共享候选：按字最常见的读音汇总，供索引中未出现过的同音字使用
+    by_syllable: Dict[str, Counter] = defaultdict(Counter)
+    for char, counter in support.items():
+        if char_readings[char]:
+            by_syllable[char_readings[char].most_common(1)[0][0]].update(counter)
+
+    imagery: List[str] = []
+    positions: Dict[str, int] = {}
+
+    def encode(candidates: List[str]) -> List[int]:
+        for text in candidates:
+            if text not in positions:
+                positions[text] = len(imagery)
+                imagery.append(text)
+        return [positions[text] for text in candidates]
+
+    chars = {char: encode(vetted(counter)) for char, counter in sorted(support.items())}
+    syllable_table = {syllable: encode(vetted(counter)) for syllable, counter in sorted(by_syllable.items())}
+    print(f"Read {names} interpretations ({skipped} invalid skipped)")
+    return {
+        "prompt_version": INTERPRET_NAME_PROMPT_VERSION,
+        "imagery": imagery,
+        "chars": {char: p for char, p in chars.items() if p},
+        "pinyin": {syllable: p for syllable, p in syllable_table.items() if p},
+    }
+
+
+def write_index(index: Dict, path: str):
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(index, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the homophone index for the name interpretation fast path.")
+    parser.add_argument("--cache", default=Config.NAME_CACHE_PATH, help="Name interpretation cache (SQLite) to read.")
+    parser.add_argument("--jsonl", action="append", default=[], help="Extra JSONL export of validated interpretations.")
+    parser.add_argument("--output", default=Config.NAME_INDEX_PATH, help="Index file to write.")
+    parser.add_argument("--min-support", type=int, default=2, help="Names an imagery must be seen in for a character.")
+    parser.add_argument("--max-candidates", type=int, default=5, help="Candidates kept per character or syllable.")
+    args = parser.parse_args()
+
+    if pinyin is None:
+        print("pypinyin is not installed: only literal character matches will be indexed")
+
+    def records() -> Iterator[Tuple[str, str]]:
+        yield from iter_cached_interpretations(args.cache)
+        for path in args.jsonl:
+            yield from iter_jsonl_interpretations(path)
+
+    index = build_index(records(), args.min_support, args.max_candidates)
+    write_index(index, args.output)
+    print(f"Wrote {args.output}: {len(index['chars'])} characters, {len(index['pinyin'])} syllables, "
+          f"{len(index['imagery'])} imagery candidates")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+# backend/tools/fake_ark.py
+"""
+Local stand-in for the Volcengine Ark endpoints used by the backend, for load tests and benchmarks.
+
+Implements the request/response shapes used by DoubaoLLMService (chat/completions, streaming or not)
+and DoubaoSeedreamService (images/generations, "url" or "b64_json"), with lognormal latency, 429 /
+5xx / sensitive-content injection and optional concurrency limits that answer 429 like a throttled
+upstream. GET /stats returns call counts; POST /stats/reset clears them.
+
+Usage (from backend/):
+    python -m tools.fake_ark --port 9000 --llm-latency 0.8,0.4 --image-latency 6,0.3 --rate-429 0.02
+
+Then start the backend with:
+    DOUBAO_LLM_ENDPOINT=http://127.0.0.1:9000/api/v3/chat/completions
+    DOUBAO_SEEDREAM_ENDPOINT=http://127.0.0.1:9000/api/v3/images/generations
+"""
+import argparse
+import asyncio
+import base64
+import json
+import math
+import random
+import time
+import uuid
+from collections import Counter
+from typing import Any, AsyncIterator, Dict, Optional
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+# 1x1 PNG，作为生成图片的内容
+PIXEL_PNG = base64.b64decode(
+    "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mP8z8BQDwAEhQGAhKmMIQAAAABJRU5ErkJggg=="
+)
+
+FEEDBACK_TEXT = "哇，这对组合简直是好运磁铁！运气值 88 分，今天的你闪闪发光，好事正排队向你走来～"
+
+
+class Latency:
+    """Lognormal latency given by its median (seconds) and sigma."""
+
+    def __init__(self, spec: str):
+        median, _, sigma = spec.partition(",")
+        self.median = float(median)
+        self.sigma = float(sigma or 0)
+
+    def sample(self) -> float:
+        if self.sigma <= 0:
+            return self.median
+        return self.median * math.exp(random.gauss(0, self.sigma))
+
+
+class FakeArk:
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.llm_latency = Latency(args.llm_latency)
+        self.image_latency = Latency(args.image_latency)
+        self.in_flight: Counter = Counter()
+        self.counters: Counter = Counter()
+        self.started_at = time.time()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"counters": dict(self.counters), "in_flight": dict(self.in_flight), "since": self.started_at}
+
+    def reset(self):
+        self.counters.clear()
+        self.started_at = time.time()
+
+    def inject_error(self, kind: str, limit: int, sensitive: bool = False) -> Optional[Response]:
+        """Returns an injected error response, or None to serve the call normally."""
+        if limit and self.in_flight[kind] >= limit:
+            self.counters[f"{kind}.throttled"] += 1
+            return JSONResponse(
+                {"error": {"code": "RateLimitExceeded.EndpointRPMExceeded", "message": "Too many concurrent requests"}},
+                status_code=429, headers={"Retry-After": "1"},
+            )
+        roll = random.random()
+        if roll < self.args.rate_429:
+            self.counters[f"{kind}.429"] += 1
+            return JSONResponse(
+                {"error": {"code": "RateLimitExceeded", "message": "Request rate limit exceeded"}},
+                status_code=429, headers={"Retry-After": str(self.args.retry_after)},
+            )
+        roll -= self.args.rate_429
+        if roll < self.args.rate_500:
+            self.counters[f"{kind}.500"] += 1
+            return JSONResponse({"error": {"code": "InternalServiceError", "message": "Injected failure"}}, status_code=500)
+        roll -= self.args.rate_500
+        if sensitive and roll < self.args.rate_sensitive:
+            self.counters[f"{kind}.sensitive"] += 1
+            return JSONResponse(
+                {"error": {"code": "OutputImageSensitiveContentDetected", "message": "SensitiveContentDetected"}},
+                status_code=400,
+            )
+        return None
+
+
+def _completion_text(payload: Dict[str, Any]) -> str:
+    prompt = payload["messages"][-1]["content"]
+    if "输出格式" in prompt:
+        # 名字解析：返回 3 组合法的意象组合，按 prompt 内容随机化以便区分缓存
+        rng = random.Random(prompt)
+        items = ["小猴", "竹笋", "锦鲤", "鱼尾", "梨子", "黄鹂", "羽毛", "雨伞", "白鹅", "星星兔", "松果", "柠檬"]
+        picks = rng.sample(items, 6)
+        return json.dumps(
+            [{"id": i + 1, "imagery1": picks[2 * i], "imagery2": picks[2 * i + 1]} for i in range(3)],
+            ensure_ascii=False,
+        )
+    return FEEDBACK_TEXT
+
+
+def _usage(payload: Dict[str, Any], text: str) -> Dict[str, int]:
+    prompt_tokens = sum(len(m["content"]) for m in payload["messages"])
+    return {"prompt_tokens": prompt_tokens, "completion_tokens": len(text), "total_tokens": prompt_tokens + len(text)}
+
+
+def create_app(args: argparse.Namespace) -> FastAPI:
+    app = FastAPI()
+    ark = FakeArk(args)
+
+    @app.post("/api/v3/chat/completions")
+    async def chat_completions(request: Request):
+        payload = await request.json()
+        stream = bool(payload.get("stream"))
+        ark.counters["llm.calls"] += 1
+        error = ark.inject_error("llm", args.llm_max_concurrency)
+        if error is not None:
+            return error
+
+        text = _completion_text(payload)
+        latency = ark.llm_latency.sample()
+        if not stream:
+            ark.in_flight["llm"] += 1
+            try:
+                await asyncio.sleep(latency)
+            finally:
+                ark.in_flight["llm"] -= 1
+            ark.counters["llm.ok"] += 1
+            return {
+                "id": uuid.uuid4().hex,
+                "model": payload.get("model"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                "usage": _usage(payload, text),
+            }
+
+        async def events() -> AsyncIterator[str]:
+            # 总延迟的 ttft_share 花在首 token 之前，其余均匀分布在各个 chunk 之间
+            ark.in_flight["llm"] += 1
+            try:
+                chunks = max(1, args.stream_chunks)
+                size = max(1, math.ceil(len(text) / chunks))
+                parts = [text[i:i + size] for i in range(0, len(text), size)]
+                await asyncio.sleep(latency * args.ttft_share)
+                for part in parts:
+                    chunk = {"choices": [{"index": 0, "delta": {"content": part}}]}
+                    yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+                    await asyncio.sleep(latency * (1 - args.ttft_share) / len(parts))
+                if (payload.get("stream_options") or {}).get("include_usage"):
+                    yield f"data: {json.dumps({'choices': [], 'usage': _usage(payload, text)})}\n\n"
+                yield "data: [DONE]\n\n"
+                ark.counters["llm.ok"] += 1
+            finally:
+                ark.in_flight["llm"] -= 1
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.post("/api/v3/images/generations")
+    async def images_generations(request: Request):
+        payload = await request.json()
+        ark.counters["image.calls"] += 1
+        error = ark.inject_error("image", args.image_max_concurrency, sensitive=True)
+        if error is not None:
+            return error
+
+        ark.in_flight["image"] += 1
+        try:
+            await asyncio.sleep(ark.image_latency.sample())
+        finally:
+            ark.in_flight["image"] -= 1
+        ark.counters["image.ok"] += 1
+        if payload.get("response_format") == "b64_json":
+            item = {"b64_json": base64.b64encode(PIXEL_PNG).decode()}
+        else:
+            item = {"url": f"{args.public_url.rstrip('/')}/images/{uuid.uuid4().hex}.png"}
+        return {
+            "model": payload.get("model"),
+            "created": int(time.time()),
+            "data": [item],
+            "usage": {"generated_images": 1},
+        }
+
+    @app.get("/images/{image_id}.png")
+    async def image_file(image_id: str):
+        ark.counters["image.downloads"] += 1
+        return Response(PIXEL_PNG, media_type="image/png")
+
+    @app.get("/stats")
+    async def stats():
+        return ark.stats()
+
+    @app.post("/stats/reset")
+    async def reset_stats():
+        ark.reset()
+        return ark.stats()
+
+    return app
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Local fake of the Volcengine Ark LLM and Seedream endpoints.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--public-url", default=None, help="Base URL put into image URLs (default http://host:port).")
+    parser.add_argument("--llm-latency", default="0.8,0.4", help="LLM latency as 'median_seconds,sigma' (lognormal).")
+    parser.add_argument("--image-latency", default="6,0.3", help="Image latency as 'median_seconds,sigma' (lognormal).")
+    parser.add_argument("--ttft-share", type=float, default=0.3, help="Share of a streamed call's latency before the first token.")
+    parser.add_argument("--stream-chunks", type=int, default=20, help="Number of content chunks per streamed completion.")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="Fraction of calls answered with 429.")
+    parser.add_argument("--rate-500", type=float, default=0.0, help="Fraction of calls answered with 500.")
+    parser.add_argument("--rate-sensitive", type=float, default=0.0, help="Fraction of image calls rejected as sensitive content.")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After seconds sent with injected 429s.")
+    parser.add_argument("--llm-max-concurrency", type=int, default=0, help="Concurrent LLM calls before answering 429 (0 = unlimited).")
+    parser.add_argument("--image-max-concurrency", type=int, default=0, help="Concurrent image calls before answering 429 (0 = unlimited).")
+    args = parser.parse_args(argv)
+    if args.public_url is None:
+        args.public_url = f"http://{args.host}:{args.port}"
+    return args
+
+
+def main():
+    args = parse_args()
+    uvicorn.run(create_app(args), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()